@@ -0,0 +1,2 @@
+-- Per-chunk content hash so re-ingestion can reuse vectors of unchanged chunks
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
@@ -0,0 +1,6 @@
+-- Source character span, page span and token count of each chunk, so answers can cite exact spans
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS char_start INT;
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS char_end INT;
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS page_start INT;
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS page_end INT;
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS token_count INT;
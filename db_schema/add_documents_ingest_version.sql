@@ -0,0 +1,2 @@
+-- Counter incremented by every committed ingestion of a document; cached answers are keyed by it, so no API worker serves answers over re-ingested chunks
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS ingest_version BIGINT NOT NULL DEFAULT 0;
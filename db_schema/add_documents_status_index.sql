@@ -0,0 +1,2 @@
+-- Index for GET /documents status filters with keyset pagination on id, and for Q&A's ingested-documents lookup
+CREATE INDEX IF NOT EXISTS idx_documents_status_id ON documents (status, id);
@@ -0,0 +1,5 @@
+-- Binary vector storage (see python-backend/vector_codec.py) replacing the JSON text column.
+-- Existing rows keep working through the JSON column until converted with
+-- `python backfill_embedding_bytes.py` from python-backend/.
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS embedding_bytes BYTEA;
+ALTER TABLE embeddings ALTER COLUMN embedding DROP NOT NULL;
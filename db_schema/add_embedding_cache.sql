@@ -0,0 +1,8 @@
+-- Content-addressed embedding cache shared across documents
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model VARCHAR(128) NOT NULL,
+    text_hash VARCHAR(64) NOT NULL, -- sha256 of the embedded text
+    embedding BYTEA NOT NULL, -- Raw float32 bytes
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model, text_hash)
+);
@@ -0,0 +1,15 @@
+-- Native pgvector storage for embeddings, used by VECTOR_SEARCH_BACKEND=pgvector
+-- The dimension must match EMBEDDING_DIM in python-backend/config.py (768 for nomic-embed-text)
+CREATE EXTENSION IF NOT EXISTS "vector";
+
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS embedding_vector vector(768);
+
+-- Backfill from the JSON text column, skipping placeholder vectors of another dimension
+UPDATE embeddings
+SET embedding_vector = embedding::vector
+WHERE embedding_vector IS NULL
+  AND json_array_length(embedding::json) = 768;
+
+-- HNSW index for cosine distance (embedding_vector <=> :q)
+CREATE INDEX IF NOT EXISTS idx_embeddings_embedding_vector_hnsw
+    ON embeddings USING hnsw (embedding_vector vector_cosine_ops);
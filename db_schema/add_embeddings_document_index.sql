@@ -0,0 +1,2 @@
+-- Index for per-document embedding lookups (re-ingestion, top-k chunk fetch by (document_id, chunk_index))
+CREATE INDEX IF NOT EXISTS idx_embeddings_document_id_chunk_index ON embeddings (document_id, chunk_index);
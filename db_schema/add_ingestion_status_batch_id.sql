@@ -0,0 +1,3 @@
+-- Batch of each ingestion job queued by /ingest/batch, so any API worker can report a batch's status
+ALTER TABLE ingestion_status ADD COLUMN IF NOT EXISTS batch_id UUID;
+CREATE INDEX IF NOT EXISTS idx_ingestion_status_batch_id ON ingestion_status (batch_id) WHERE batch_id IS NOT NULL;
@@ -27,7 +27,11 @@ export class InternalDocumentsController {
         return;
       }
       
-      res.status(HttpStatus.OK).json(doc);
+      // Base64 instead of the default Buffer JSON, a list of numbers many times the file size
+      res.status(HttpStatus.OK).json({
+        ...doc,
+        fileContent: doc.fileContent ? Buffer.from(doc.fileContent).toString('base64') : null,
+      });
       return;
     } catch (err) {
       console.error(`[GET] /internal/documents/${id}/content error:`, err);
@@ -44,6 +44,9 @@ export class Document {
   @Column({ name: 'file_size', type: 'bigint', nullable: true })
   fileSize: number;
 
+  @Column({ name: 'ingest_version', type: 'bigint', default: 0 })
+  ingestVersion: number;
+
   @CreateDateColumn({ name: 'created_at' })
   createdAt: Date;
 
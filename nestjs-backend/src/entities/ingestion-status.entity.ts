@@ -31,6 +31,9 @@ export class IngestionStatus {
   @Column({ name: 'error_message', type: 'text', nullable: true })
   errorMessage: string;
 
+  @Column({ name: 'batch_id', type: 'uuid', nullable: true })
+  batchId: string;
+
   @CreateDateColumn({ name: 'created_at' })
   createdAt: Date;
 
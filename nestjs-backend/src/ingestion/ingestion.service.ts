@@ -148,8 +148,13 @@ export class IngestionService {
       });
 
       // Call Python backend to ingest the document
-      const result = await this.pythonBackendService.ingestDocument(documentId);
-      
+      const result = await this.pythonBackendService.ingestDocument(documentId, ingestionId);
+
+      if (result.status === 'queued') {
+        // The Python backend worker records progress and the final document status
+        return;
+      }
+
       if (result.status === 'success') {
         // Update status to completed
         await this.ingestionStatusRepository.update(ingestionId, {
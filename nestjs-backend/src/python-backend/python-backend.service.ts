@@ -8,11 +8,13 @@ export interface PythonBackendConfig {
 
 export interface DocumentIngestRequest {
   document_id: string;
+  ingestion_id?: string;
 }
 
 export interface DocumentIngestResponse {
   status: string;
   message: string;
+  job_id?: string;
   embeddings_count?: number;
 }
 
@@ -79,8 +81,8 @@ export class PythonBackendService {
     return this.makeRequest<{ status: string; service: string }>('GET', '/health');
   }
 
-  async ingestDocument(documentId: string): Promise<DocumentIngestResponse> {
-    const request: DocumentIngestRequest = { document_id: documentId };
+  async ingestDocument(documentId: string, ingestionId?: string): Promise<DocumentIngestResponse> {
+    const request: DocumentIngestRequest = { document_id: documentId, ingestion_id: ingestionId };
     return this.makeRequest<DocumentIngestResponse>('POST', '/ingest', request);
   }
 
@@ -0,0 +1,67 @@
+"""Convert JSON text vectors in the embeddings table to the binary embedding_bytes column.
+
+Run from python-backend/ after applying db_schema/add_embedding_bytes.sql:
+
+    python backfill_embedding_bytes.py --batch-size 2000
+
+Rows are converted in primary-key order, one transaction per batch, so the
+script can be interrupted and re-run. The JSON text is cleared once a row is
+converted unless --keep-json is given.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+import numpy as np
+from sqlalchemy import select, update
+from database import AsyncSessionLocal, Embedding
+from vector_codec import encode_vector
+from config import settings
+
+logger = logging.getLogger("backfill_embedding_bytes")
+
+
+async def backfill(batch_size: int, storage_format: str, keep_json: bool) -> int:
+    converted = 0
+    last_id = None
+    started = time.perf_counter()
+    while True:
+        async with AsyncSessionLocal() as session:
+            stmt = (
+                select(Embedding.id, Embedding.embedding)
+                .where(Embedding.embedding_bytes.is_(None), Embedding.embedding.is_not(None))
+                .order_by(Embedding.id)
+                .limit(batch_size)
+            )
+            if last_id is not None:
+                stmt = stmt.where(Embedding.id > last_id)
+            rows = (await session.execute(stmt)).all()
+            if not rows:
+                break
+
+            updates = []
+            for row_id, embedding in rows:
+                values = {"id": row_id, "embedding_bytes": encode_vector(np.asarray(json.loads(embedding), dtype=np.float32), storage_format)}
+                if not keep_json:
+                    values["embedding"] = None
+                updates.append(values)
+            # ORM bulk UPDATE by primary key, sent as one executemany
+            await session.execute(update(Embedding), updates)
+            await session.commit()
+
+        last_id = rows[-1][0]
+        converted += len(rows)
+        logger.info(f"Converted {converted} rows ({converted / (time.perf_counter() - started):.0f} rows/s)")
+    return converted
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--format", default=settings.EMBEDDING_STORAGE_FORMAT, choices=["float32", "float16", "int8"])
+    parser.add_argument("--keep-json", action="store_true", help="leave the JSON text in place after conversion")
+    args = parser.parse_args()
+    total = asyncio.run(backfill(args.batch_size, args.format, args.keep_json))
+    logger.info(f"Backfill finished: {total} rows converted")
@@ -0,0 +1,57 @@
+"""Compare per-question vector search with the batched search used by /qa/batch.
+
+Runs offline from python-backend/:
+
+    python -m benchmarks.bench_batch_search --chunks 200000 --questions 1000
+
+Reports the wall time of scoring every question with VectorIndex.search
+one at a time against a single VectorIndex.search_many call, and checks
+that both return the same hits.
+"""
+import argparse
+import json
+import time
+import uuid
+import numpy as np
+from vector_index import VectorIndex
+
+
+def build_index(chunks: int, dim: int, chunks_per_document: int = 200) -> VectorIndex:
+    rng = np.random.default_rng(0)
+    index = VectorIndex(initial_capacity=chunks)
+    for start in range(0, chunks, chunks_per_document):
+        count = min(chunks_per_document, chunks - start)
+        index.add_document(uuid.uuid4(), list(range(count)), rng.standard_normal((count, dim)).astype(np.float32))
+    return index
+
+
+def main(args):
+    index = build_index(args.chunks, args.dim)
+    queries = np.random.default_rng(1).standard_normal((args.questions, args.dim)).astype(np.float32)
+
+    start = time.perf_counter()
+    single = [index.search(query, args.k) for query in queries]
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = index.search_many(queries, args.k)
+    batched_seconds = time.perf_counter() - start
+
+    same = all([hit[1:] for hit in a] == [hit[1:] for hit in b] for a, b in zip(single, batched))
+    print(json.dumps({
+        "chunks": args.chunks,
+        "questions": args.questions,
+        "single_seconds": round(single_seconds, 3),
+        "batched_seconds": round(batched_seconds, 3),
+        "speedup": round(single_seconds / batched_seconds, 1) if batched_seconds else None,
+        "same_results": same,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--questions", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("-k", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,173 @@
+"""Measure /qa latency while large files are being extracted.
+
+Runs fully offline from python-backend/:
+
+    python -m benchmarks.bench_extraction_latency --pages 100 --extractions 2
+
+/qa requests go through the FastAPI app in-process with fake LLM and
+embedding providers and an in-memory corpus standing in for the database.
+Each scenario issues paced /qa requests for the same duration:
+
+- idle:   no extraction running
+- inline: PDFs extracted directly on the event loop (the previous behaviour)
+- pool:   PDFs posted to /extract-text, which runs them in the extraction pool
+"""
+import os
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("EMBEDDING_PROVIDER", "fake")
+os.environ.setdefault("EMBEDDING_CACHE_PERSISTENT", "false")
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+import uuid
+from types import SimpleNamespace
+import numpy as np
+import httpx
+from database import get_db
+from extraction import extract_text
+from main import app, rag_service
+
+
+def make_pdf(pages: int, words_per_page: int = 400) -> bytes:
+    """A minimal text PDF with the given number of pages"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for page in range(pages):
+        lines = []
+        words = [f"page{page} word{i} extraction benchmark text" for i in range(0, words_per_page, 5)]
+        for row, line in enumerate(words):
+            lines.append(f"BT /F1 8 Tf 40 {780 - (row % 90) * 8} Td ({line}) Tj ET")
+        stream = "\n".join(lines).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref)
+        page_refs.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % ref for ref in page_refs), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class CorpusSession:
+    """Answers the two queries /qa issues against an in-memory corpus"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def execute(self, stmt, params=None):
+        if "embeddings" in str(stmt):
+            return [
+                SimpleNamespace(
+                    document_id=doc_id, chunk_index=index, chunk_content=text, title="Benchmark document",
+                    embedding_bytes=None, page_start=None, page_end=None, char_start=None, char_end=None
+                )
+                for (doc_id, index), text in self.chunks.items()
+            ]
+        ids = sorted({doc_id for doc_id, _ in self.chunks})
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: ids))
+
+
+def build_corpus(documents: int, chunks_per_document: int):
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(2000)]
+    chunks = {}
+    for _ in range(documents):
+        doc_id = uuid.uuid4()
+        texts = [" ".join(rng.choice(vocabulary, 60)) for _ in range(chunks_per_document)]
+        vectors = [rag_service.embedding_client.embed_sync(text) for text in texts]
+        rag_service.vector_index.add_document(doc_id, list(range(len(texts))), vectors)
+        rag_service.lexical_index.add_document(doc_id, enumerate(texts))
+        chunks.update({(doc_id, i): text for i, text in enumerate(texts)})
+    return chunks
+
+
+async def measure_qa(client: httpx.AsyncClient, duration: float, interval: float):
+    latencies = []
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        i += 1
+        start = time.perf_counter()
+        response = await client.post("/qa", json={"question": f"what is term{i % 50} and term{i % 7}?"})
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def extract_inline(pdf: bytes, stop: asyncio.Event):
+    while not stop.is_set():
+        extract_text(pdf, "application/pdf")
+        await asyncio.sleep(0)
+
+
+async def extract_in_pool(client: httpx.AsyncClient, pdf: bytes, stop: asyncio.Event):
+    while not stop.is_set():
+        response = await client.post("/extract-text", files={"file": ("bench.pdf", pdf, "application/pdf")})
+        response.raise_for_status()
+
+
+async def run_scenario(client, scenario: str, pdf: bytes, args):
+    stop = asyncio.Event()
+    if scenario == "inline":
+        load = [asyncio.create_task(extract_inline(pdf, stop)) for _ in range(args.extractions)]
+    elif scenario == "pool":
+        load = [asyncio.create_task(extract_in_pool(client, pdf, stop)) for _ in range(args.extractions)]
+    else:
+        load = []
+    await asyncio.sleep(0.2)
+    latencies = await measure_qa(client, args.duration, args.interval)
+    stop.set()
+    await asyncio.gather(*load)
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "max_ms": round(float(np.max(latencies)), 2),
+    }
+
+
+async def main(args):
+    logging.disable(logging.INFO)
+    chunks = build_corpus(args.documents, args.chunks_per_document)
+    session = CorpusSession(chunks)
+
+    async def fake_db():
+        yield session
+
+    app.dependency_overrides[get_db] = fake_db
+    pdf = make_pdf(args.pages)
+    # Warm up the pool so process start-up is not part of the measurement
+    await rag_service.extract_text_from_file(make_pdf(1), "application/pdf")
+
+    results = {"pdf_pages": args.pages, "pdf_bytes": len(pdf), "concurrent_extractions": args.extractions}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for scenario in ("idle", "inline", "pool"):
+                results[scenario] = await run_scenario(client, scenario, pdf, args)
+    finally:
+        await rag_service.aclose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--extractions", type=int, default=2, help="concurrent extraction loops")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of /qa traffic per scenario")
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between /qa requests")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--chunks-per-document", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
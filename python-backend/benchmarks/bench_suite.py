@@ -0,0 +1,277 @@
+"""Offline benchmark suite for ingestion and retrieval, emitting JSON results.
+
+Runs without network access from python-backend/:
+
+    python -m benchmarks.bench_suite --sizes 1000,10000,100000 --output results.json
+    EMBEDDING_DIM=768 python -m benchmarks.bench_suite --sizes 1000000 --questions 100
+
+NestJS and Ollama are replaced by in-process httpx transports (see
+benchmarks/offline.py), the LLM by the fake provider and the database by an
+in-memory store, so the real RAGService code paths run end to end. Corpora
+are synthetic and seeded, so runs are reproducible.
+
+- ingestion: process_document (one document at a time) and process_documents
+  (grouped) throughput in documents and chunks per second, and re-ingestion
+  of every document with one paragraph appended, which reuses the stored
+  vectors of unchanged chunks
+- retrieval, for each corpus size:
+  - index build time and memory (vector matrix bytes, process RSS growth)
+  - recall@k and search latency for the vector, lexical and hybrid rankings
+  - /qa latency p50/p99 through answer_question, with the answer cache off,
+    and how often the labelled chunk reached the packed context
+
+The pgvector backend needs Postgres and is not covered.
+"""
+import os
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("EMBEDDING_PROVIDER", "ollama")
+os.environ.setdefault("EMBEDDING_CACHE_PERSISTENT", "false")
+os.environ.setdefault("EMBEDDING_DIM", "384")
+os.environ.setdefault("ANSWER_CACHE_SIZE", "0")
+os.environ.setdefault("VECTOR_SEARCH_BACKEND", "memory")
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import platform
+import resource
+import time
+from typing import Any, Dict, List
+import numpy as np
+import httpx
+from config import settings
+from lexical_index import reciprocal_rank_fusion
+from rag_service import RAGService
+from benchmarks.offline import InMemoryStore, StoreSession, SyntheticCorpus, nestjs_transport, ollama_transport, percentile
+
+
+def max_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if platform.system() == "Darwin" else rss * 1024
+
+
+def make_service(documents: Dict[str, Dict[str, Any]], embed_latency: float, fetch_latency: float):
+    """RAGService whose NestJS and Ollama clients talk to in-process stand-ins"""
+    service = RAGService()
+    service.nestjs_client = httpx.AsyncClient(base_url=service.nestjs_url, transport=nestjs_transport(documents, fetch_latency))
+    transport, counters = ollama_transport(settings.EMBEDDING_DIM, latency=embed_latency)
+    service.embedding_client._client = httpx.AsyncClient(base_url=settings.OLLAMA_BASE_URL, transport=transport)
+    return service, counters
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    millis = [s * 1000 for s in seconds]
+    return {
+        "p50_ms": round(percentile(millis, 50), 3),
+        "p99_ms": round(percentile(millis, 99), 3),
+        "mean_ms": round(float(np.mean(millis)), 3) if millis else 0.0,
+    }
+
+
+async def bench_ingestion(chunks: int, group_size: int, embed_latency: float, fetch_latency: float) -> Dict[str, Any]:
+    corpus = SyntheticCorpus(chunks, settings.EMBEDDING_DIM, seed=7)
+    payloads = {
+        str(document_id): {"title": f"Document {i}", "content": text, "mimeType": "text/plain"}
+        for i, (document_id, text) in enumerate(corpus.documents())
+    }
+    document_ids = list(payloads)
+    results = {"documents": len(document_ids), "source_paragraphs": len(corpus)}
+
+    for mode in ("sequential", "batch"):
+        store = InMemoryStore()
+        for document_id in corpus.document_ids:
+            store.add_document(document_id, "", status="processing")
+        session = StoreSession(store)
+        service, counters = make_service(payloads, embed_latency, fetch_latency)
+        statuses: List[str] = []
+        started = time.perf_counter()
+        if mode == "sequential":
+            for document_id in document_ids:
+                statuses.append((await service.process_document(session, document_id))["status"])
+        else:
+            async for group in service.process_documents(session, document_ids, group_size=group_size):
+                statuses.extend(result["status"] for result in group.values())
+        elapsed = time.perf_counter() - started
+        await service.aclose()
+        results[mode] = {
+            "seconds": round(elapsed, 4),
+            "documents_per_second": round(len(document_ids) / elapsed, 2),
+            "chunks_per_second": round(len(store) / elapsed, 2),
+            "chunks": len(store),
+            "failed": sum(status != "success" for status in statuses),
+            "embed_requests": counters["requests"],
+            "db_statements": session.statements,
+        }
+
+    # Re-ingest into the store left by the batch run, with a paragraph appended to every document
+    edited = {
+        document_id: {**payload, "content": payload["content"] + f"\n\nAppendix for {payload['title']}."}
+        for document_id, payload in payloads.items()
+    }
+    service, counters = make_service(edited, embed_latency, fetch_latency)
+    statements = session.statements
+    outcomes: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    for document_id in document_ids:
+        outcomes.append(await service.process_document(session, document_id))
+    elapsed = time.perf_counter() - started
+    await service.aclose()
+    results["reingest"] = {
+        "seconds": round(elapsed, 4),
+        "documents_per_second": round(len(document_ids) / elapsed, 2),
+        "chunks": sum(outcome.get("embeddings_count") or 0 for outcome in outcomes),
+        "chunks_reused": sum(outcome.get("embeddings_reused") or 0 for outcome in outcomes),
+        "failed": sum(outcome["status"] != "success" for outcome in outcomes),
+        "embed_requests": counters["requests"],
+        "db_statements": session.statements - statements,
+    }
+    return results
+
+
+async def bench_retrieval(size: int, questions: int, ks: List[int], qa_questions: int) -> Dict[str, Any]:
+    rss_before = max_rss_bytes()
+    started = time.perf_counter()
+    corpus = SyntheticCorpus(size, settings.EMBEDDING_DIM)
+    generated = time.perf_counter() - started
+
+    store = InMemoryStore()
+    store.load_corpus(corpus)
+    session = StoreSession(store)
+    service, counters = make_service({}, 0.0, 0.0)
+
+    started = time.perf_counter()
+    document_rows: Dict[Any, List[int]] = {}
+    for position, (document_id, _) in enumerate(corpus.keys):
+        document_rows.setdefault(document_id, []).append(position)
+    for document_id, positions in document_rows.items():
+        service.vector_index.add_document(document_id, [corpus.keys[p][1] for p in positions], corpus.vectors[positions[0]:positions[-1] + 1])
+    vector_built = time.perf_counter() - started
+    rss_vector = max_rss_bytes()
+    started = time.perf_counter()
+    for document_id, positions in document_rows.items():
+        service.lexical_index.add_document(document_id, ((corpus.keys[p][1], corpus.texts[p]) for p in positions))
+    lexical_built = time.perf_counter() - started
+    rss_lexical = max_rss_bytes()
+
+    pairs = corpus.questions(questions)
+    question_vectors = [await service._embed_question(question) for question, _ in pairs]
+    depth = max(ks)
+    candidates = settings.HYBRID_CANDIDATES
+    rankings: Dict[str, List[List[Any]]] = {"vector": [], "lexical": [], "hybrid": []}
+    timings: Dict[str, List[float]] = {"vector": [], "lexical": [], "hybrid": []}
+    for (question, _), vector in zip(pairs, question_vectors):
+        t0 = time.perf_counter()
+        vector_hits = service.vector_index.search(vector, max(depth, candidates))
+        t1 = time.perf_counter()
+        lexical_hits = service.lexical_index.search(question, max(depth, candidates))
+        t2 = time.perf_counter()
+        fused = reciprocal_rank_fusion(
+            [[(d, c) for _, d, c in hits[:candidates]] for hits in (vector_hits, lexical_hits) if hits], k=settings.RRF_K
+        )
+        t3 = time.perf_counter()
+        rankings["vector"].append([(d, c) for _, d, c in vector_hits[:depth]])
+        rankings["lexical"].append([(d, c) for _, d, c in lexical_hits[:depth]])
+        rankings["hybrid"].append([key for _, key in fused[:depth]])
+        timings["vector"].append(t1 - t0)
+        timings["lexical"].append(t2 - t1)
+        timings["hybrid"].append(t3 - t0)
+
+    modes = {}
+    for mode, ranked in rankings.items():
+        modes[mode] = {
+            **{f"recall@{k}": round(float(np.mean([target in hits[:k] for (_, target), hits in zip(pairs, ranked)])), 4) for k in ks},
+            **latency_summary(timings[mode]),
+        }
+
+    # End-to-end /qa path: document resolution, question embedding, hybrid search, chunk load, MMR, packing, generation
+    qa_latencies, in_context = [], []
+    for question, target in pairs[:qa_questions]:
+        t0 = time.perf_counter()
+        result = await service.answer_question(session, question)
+        qa_latencies.append(time.perf_counter() - t0)
+        sources = {(source["document_id"], source["chunk_index"]) for source in result.get("sources", [])}
+        in_context.append((str(target[0]), target[1]) in sources)
+    await service.aclose()
+
+    vector_bytes = service.vector_index._vectors.nbytes + service.vector_index._doc_codes.nbytes + service.vector_index._chunk_indices.nbytes
+    result = {
+        "chunks": size,
+        "documents": len(corpus.document_ids),
+        "questions": len(pairs),
+        "build_seconds": {"corpus": round(generated, 3), "vector_index": round(vector_built, 3), "lexical_index": round(lexical_built, 3)},
+        "memory_bytes": {
+            "vector_index": int(vector_bytes),
+            # Peak RSS growth while each index was built; 0 when an earlier, larger run set the peak
+            "vector_index_rss_growth": max(0, rss_vector - rss_before),
+            "lexical_index_rss_growth": max(0, rss_lexical - rss_vector),
+            "max_rss": max_rss_bytes(),
+        },
+        "modes": modes,
+        "qa": {
+            "requests": len(qa_latencies),
+            "context_recall": round(float(np.mean(in_context)), 4) if in_context else 0.0,
+            **latency_summary(qa_latencies),
+        },
+        "embed_requests": counters["requests"],
+    }
+    del corpus, store, session, service
+    gc.collect()
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated corpus sizes in chunks (1000 to 1000000)")
+    parser.add_argument("--questions", type=int, default=200, help="Labelled questions per corpus for recall@k")
+    parser.add_argument("--qa-questions", type=int, default=100, help="Questions sent through answer_question per corpus")
+    parser.add_argument("--k", default="1,5,10", help="Comma-separated cut-offs for recall@k")
+    parser.add_argument("--ingest-chunks", type=int, default=5000, help="Synthetic paragraphs ingested for the throughput runs; 0 skips them")
+    parser.add_argument("--group-size", type=int, default=settings.INGEST_BATCH_GROUP_SIZE)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Simulated seconds per Ollama request")
+    parser.add_argument("--fetch-latency", type=float, default=0.0, help="Simulated seconds per NestJS request")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("rag_service").setLevel(logging.CRITICAL)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    ks = sorted(int(k) for k in args.k.split(","))
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "embedding_dim": settings.EMBEDDING_DIM,
+            "embedding_batch_size": settings.EMBEDDING_BATCH_SIZE,
+            "chunk_tokens": settings.CHUNK_TOKENS,
+            "hybrid_candidates": settings.HYBRID_CANDIDATES,
+            "retrieval_top_k": settings.RETRIEVAL_TOP_K,
+            "group_size": args.group_size,
+            "embed_latency": args.embed_latency,
+            "fetch_latency": args.fetch_latency,
+        },
+    }
+    if args.ingest_chunks:
+        results["ingestion"] = await bench_ingestion(args.ingest_chunks, args.group_size, args.embed_latency, args.fetch_latency)
+    results["retrieval"] = []
+    # Smallest corpus first, so the RSS growth of each size is measured against a lower peak
+    for size in sorted(sizes):
+        results["retrieval"].append(await bench_retrieval(size, args.questions, ks, args.qa_questions))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""Compare JSON text vectors with the binary storage formats of vector_codec.
+
+Runs offline from python-backend/:
+
+    python -m benchmarks.bench_vector_codec --vectors 20000
+
+Reports bytes per vector, the time to decode all rows into a search matrix,
+and recall@k of the quantized formats against exact float32 search.
+"""
+import argparse
+import json
+import time
+import numpy as np
+from vector_codec import encode_vector, decode_matrix
+
+
+def make_vectors(count: int, dim: int, clusters: int = 64) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def top_k(matrix: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ matrix.T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def main(args):
+    vectors = make_vectors(args.vectors, args.dim)
+    queries = make_vectors(args.queries, args.dim)[::-1].copy()
+    exact = top_k(vectors, queries, args.k)
+    results = {"vectors": args.vectors, "dim": args.dim}
+
+    rows = [json.dumps(v.tolist()) for v in vectors]
+    start = time.perf_counter()
+    matrix = np.asarray([json.loads(row) for row in rows], dtype=np.float32)
+    results["json"] = {
+        "bytes_per_vector": round(sum(len(row) for row in rows) / len(rows), 1),
+        "decode_seconds": round(time.perf_counter() - start, 4),
+    }
+
+    for storage_format in ("float32", "float16", "int8"):
+        blobs = [encode_vector(v, storage_format) for v in vectors]
+        start = time.perf_counter()
+        matrix = decode_matrix(blobs)
+        decode_seconds = time.perf_counter() - start
+        found = top_k(np.ascontiguousarray(matrix), queries, args.k)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(found, exact)])
+        results[storage_format] = {
+            "bytes_per_vector": len(blobs[0]),
+            "decode_seconds": round(decode_seconds, 4),
+            f"recall@{args.k}": round(float(recall), 4),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    main(parser.parse_args())
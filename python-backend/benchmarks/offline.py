@@ -0,0 +1,317 @@
+"""Offline stand-ins for the services RAGService talks to, shared by the benchmarks.
+
+- InMemoryStore / StoreSession: the documents and embeddings tables, answering
+  the statements RAGService issues during ingestion and Q&A
+- nestjs_transport: the NestJS internal document content endpoint
+- ollama_transport: Ollama's /api/embed, embedding like FakeEmbeddingProvider
+- SyntheticCorpus: deterministic chunk text, vectors and labelled questions
+
+Transports plug into the real httpx clients, so request batching, pooling and
+retries are exercised as in production.
+"""
+import asyncio
+import contextlib
+import json
+import uuid
+from collections import namedtuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import httpx
+from sqlalchemy.sql.elements import BinaryExpression
+from database import DocumentStatus
+from providers import FakeEmbeddingProvider
+from vector_codec import encode_vector
+
+
+class InMemoryStore:
+    """Embedding rows and document metadata held in memory.
+
+    Rows inserted through a StoreSession are kept as dicts, by id and by
+    (document_id, chunk_index) for the newest row of each chunk. Bulk-loaded
+    corpora keep their text in a list and their vectors in one matrix, and
+    are only turned into row values when a query touches them.
+    """
+
+    def __init__(self):
+        self.documents: Dict[uuid.UUID, Dict[str, Any]] = {}
+        self.rows: Dict[Tuple[uuid.UUID, int], Dict[str, Any]] = {}
+        self.rows_by_id: Dict[uuid.UUID, Dict[str, Any]] = {}  # Includes rows a re-ingestion has not deleted yet
+        self._bulk_positions: Dict[Tuple[uuid.UUID, int], int] = {}
+        self._bulk_texts: List[str] = []
+        self._bulk_vectors: Optional[np.ndarray] = None
+
+    def add_document(self, document_id: uuid.UUID, title: str, status: str = DocumentStatus.INGESTED.value) -> None:
+        self.documents[document_id] = {"title": title, "status": status}
+
+    def load_corpus(self, corpus: "SyntheticCorpus") -> None:
+        """Register a synthetic corpus as already ingested rows"""
+        self._bulk_texts = corpus.texts
+        self._bulk_vectors = corpus.vectors
+        for position, (document_id, chunk_index) in enumerate(corpus.keys):
+            self._bulk_positions[(document_id, chunk_index)] = position
+        for document_id in corpus.document_ids:
+            self.add_document(document_id, f"Synthetic document {document_id.hex[:8]}")
+
+    def row(self, key: Tuple[uuid.UUID, int]) -> Optional[Dict[str, Any]]:
+        row = self.rows.get(key)
+        if row is not None:
+            return row
+        position = self._bulk_positions.get(key)
+        if position is None:
+            return None
+        return {
+            "id": None, "document_id": key[0], "chunk_index": key[1], "chunk_content": self._bulk_texts[position],
+            "embedding_bytes": encode_vector(self._bulk_vectors[position]), "embedding": None, "content_hash": None,
+            "page_start": None, "page_end": None, "char_start": None, "char_end": None,
+        }
+
+    def __len__(self) -> int:
+        return len(self.rows) + len(self._bulk_positions)
+
+
+class _Result:
+    def __init__(self, rows: List[Any]):
+        self._rows = rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def all(self) -> List[Any]:
+        return list(self._rows)
+
+    def scalars(self) -> "_Result":
+        return _Result([row[0] for row in self._rows])
+
+
+class StoreSession:
+    """AsyncSession stand-in answering RAGService's statements from an InMemoryStore.
+
+    Statements are recognised by their kind and selected columns, and IN
+    filters are read from the bound parameters. Transactions are not
+    modelled: writes apply immediately and rollback is a no-op.
+    """
+
+    def __init__(self, store: InMemoryStore):
+        self.store = store
+        self.statements = 0
+
+    async def execute(self, stmt, params=None):
+        self.statements += 1
+        if getattr(stmt, "is_insert", False):
+            for values in params or []:
+                # Columns the insert leaves out are NULL, as in Postgres
+                row = {"embedding": None, **values}
+                self.store.rows[(_as_uuid(values["document_id"]), values["chunk_index"])] = row
+                self.store.rows_by_id[values["id"]] = row
+            return _Result([])
+        if getattr(stmt, "is_delete", False):
+            for row_id in _in_values(stmt.whereclause):
+                row = self.store.rows_by_id.pop(row_id, None)
+                key = (_as_uuid(row["document_id"]), row["chunk_index"]) if row is not None else None
+                if key is not None and self.store.rows.get(key) is row:
+                    del self.store.rows[key]
+            return _Result([])
+        if getattr(stmt, "is_update", False) and stmt.table.name == "documents":
+            # Ingest version bump
+            for document_id in map(_as_uuid, _in_values(stmt.whereclause)):
+                if document_id in self.store.documents:
+                    self.store.documents[document_id]["ingest_version"] = self.store.documents[document_id].get("ingest_version", 0) + 1
+            return _Result([])
+        if not getattr(stmt, "is_select", False):
+            return _Result([])
+
+        columns = [column.key for column in stmt.selected_columns]
+        Row = namedtuple("Row", columns)
+        if columns == ["id", "ingest_version"]:
+            return _Result([
+                Row(document_id, self.store.documents[document_id].get("ingest_version", 0))
+                for document_id in self._document_ids(stmt.whereclause)
+            ])
+        if "title" in columns:
+            rows = []
+            for key in _in_values(stmt.whereclause):
+                row = self.store.row(key)
+                if row is not None:
+                    title = self.store.documents.get(key[0], {}).get("title")
+                    rows.append(Row(*(title if column == "title" else row[column] for column in columns)))
+            return _Result(rows)
+        if columns[:2] == ["id", "document_id"]:
+            wanted = {_as_uuid(value) for value in _in_values(stmt.whereclause)}
+            return _Result([Row(*(row[column] for column in columns)) for row in self.store.rows_by_id.values() if _as_uuid(row["document_id"]) in wanted])
+        if columns[0] == "id":
+            rows = []
+            for row_id in _in_values(stmt.whereclause):
+                row = self.store.rows_by_id.get(row_id)
+                if row is not None:
+                    rows.append(Row(*(row[column] for column in columns)))
+            return _Result(rows)
+        raise NotImplementedError(f"StoreSession does not handle: {stmt}")
+
+    def _document_ids(self, where) -> List[uuid.UUID]:
+        if isinstance(where, BinaryExpression) and where.left.key == "status":
+            return [doc_id for doc_id, doc in self.store.documents.items() if doc["status"] == where.right.value]
+        wanted = {_as_uuid(value) for value in _in_values(where)}
+        return [doc_id for doc_id in self.store.documents if doc_id in wanted]
+
+    @contextlib.asynccontextmanager
+    async def begin_nested(self):
+        yield self
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+def nestjs_transport(documents: Dict[str, Dict[str, Any]], latency: float = 0.0) -> httpx.MockTransport:
+    """Serves /api/internal/documents/{id}/content from {document_id: payload}"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if latency:
+            await asyncio.sleep(latency)
+        parts = request.url.path.strip("/").split("/")
+        if len(parts) != 5 or parts[:3] != ["api", "internal", "documents"] or parts[4] != "content":
+            return httpx.Response(404)
+        payload = documents.get(parts[3])
+        return httpx.Response(200, json=payload) if payload is not None else httpx.Response(404)
+
+    return httpx.MockTransport(handler)
+
+
+def ollama_transport(dim: int, latency: float = 0.0, per_input_latency: float = 0.0) -> Tuple[httpx.MockTransport, Dict[str, int]]:
+    """Serves /api/embed with FakeEmbeddingProvider vectors; returns the transport and its call counters"""
+    embedder = FakeEmbeddingProvider(dim=dim, latency=0.0)
+    counters = {"requests": 0, "inputs": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path != "/api/embed":
+            return httpx.Response(404)
+        inputs = json.loads(request.content)["input"]
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        counters["requests"] += 1
+        counters["inputs"] += len(inputs)
+        if latency or per_input_latency:
+            await asyncio.sleep(latency + per_input_latency * len(inputs))
+        return httpx.Response(200, json={"embeddings": [embedder.embed_sync(text).tolist() for text in inputs]})
+
+    return httpx.MockTransport(handler), counters
+
+
+class SyntheticCorpus:
+    """Deterministic corpus whose chunks embed exactly as FakeEmbeddingProvider would embed their text.
+
+    Every chunk mixes a few rare "topic" words with common filler words. The
+    question for a chunk uses some of its topic words, so the chunk is the
+    labelled answer for recall@k. Vectors are computed in bulk from per-word
+    vectors instead of embedding each text, which keeps 1M-chunk corpora
+    affordable.
+    """
+
+    def __init__(
+        self,
+        chunks: int,
+        dim: int,
+        chunks_per_document: int = 50,
+        vocabulary: int = 50000,
+        topic_words: int = 8,
+        topic_pool: int = 40,
+        filler_words: int = 40,
+        seed: int = 0,
+    ):
+        rng = np.random.default_rng(seed)
+        self.dim = dim
+        self.words = _make_words(vocabulary, rng)
+        common = min(500, vocabulary // 10)
+        # Topic words come from a pool of rare words per document, so chunks of a document overlap
+        # lexically; filler words follow a Zipf-like law over the common words
+        documents = (chunks + chunks_per_document - 1) // chunks_per_document
+        pools = rng.integers(common, vocabulary, size=(documents, topic_pool), dtype=np.int32)
+        picks = rng.integers(0, topic_pool, size=(chunks, topic_words))
+        self._topics = pools[np.arange(chunks)[:, None] // chunks_per_document, picks]
+        filler_weights = 1.0 / np.arange(1, common + 1)
+        self._filler = rng.choice(common, size=(chunks, filler_words), p=filler_weights / filler_weights.sum()).astype(np.int32)
+
+        self.document_ids = [uuid.UUID(int=int(rng.integers(1, 2 ** 63)) << 64 | i) for i in range(documents)]
+        self.keys = [(self.document_ids[i // chunks_per_document], i % chunks_per_document) for i in range(chunks)]
+        self.texts = [self._text(i) for i in range(chunks)]
+        self.vectors = self._embed_all()
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def questions(self, count: int, words: int = 4, seed: int = 1) -> List[Tuple[str, Tuple[uuid.UUID, int]]]:
+        """(question, key of the chunk that answers it) pairs"""
+        rng = np.random.default_rng(seed)
+        targets = rng.choice(len(self.texts), size=min(count, len(self.texts)), replace=False)
+        pairs = []
+        for target in targets:
+            picked = rng.choice(self._topics.shape[1], size=min(words, self._topics.shape[1]), replace=False)
+            terms = " ".join(self.words[self._topics[target, j]] for j in picked)
+            pairs.append((f"What does the manual say about {terms}?", self.keys[int(target)]))
+        return pairs
+
+    def documents(self) -> Iterator[Tuple[uuid.UUID, str]]:
+        """(document_id, full text) with one paragraph per chunk"""
+        for start in range(0, len(self.keys), 1):
+            document_id = self.keys[start][0]
+            if start and self.keys[start - 1][0] == document_id:
+                continue
+            paragraphs = []
+            position = start
+            while position < len(self.keys) and self.keys[position][0] == document_id:
+                paragraphs.append(self.texts[position])
+                position += 1
+            yield document_id, "\n\n".join(paragraphs)
+
+    def _text(self, i: int) -> str:
+        topics = [self.words[w] for w in self._topics[i]]
+        filler = [self.words[w] for w in self._filler[i]]
+        half = len(filler) // 2
+        first = " ".join(filler[:half] + topics[:len(topics) // 2])
+        second = " ".join(topics[len(topics) // 2:] + filler[half:])
+        return f"{first.capitalize()}. {second.capitalize()}."
+
+    def _embed_all(self, block: int = 2048) -> np.ndarray:
+        embedder = FakeEmbeddingProvider(dim=self.dim, latency=0.0)
+        used = np.unique(np.concatenate([self._topics.ravel(), self._filler.ravel()]))
+        word_vectors = np.zeros((len(self.words), self.dim), dtype=np.float32)
+        for w in used:
+            word_vectors[w] = embedder._token_vector(self.words[w])
+        tokens = np.concatenate([self._topics, self._filler], axis=1)
+        vectors = np.empty((len(tokens), self.dim), dtype=np.float32)
+        for start in range(0, len(tokens), block):
+            summed = word_vectors[tokens[start:start + block]].sum(axis=1)
+            vectors[start:start + block] = summed / np.linalg.norm(summed, axis=1, keepdims=True)
+        return vectors
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def _make_words(count: int, rng: np.random.Generator) -> List[str]:
+    """Distinct pronounceable pseudo-words"""
+    consonants, vowels = "bdfgklmnprstvz", "aeiou"
+    syllables = [c + v for c in consonants for v in vowels]
+    words: Dict[str, None] = {}
+    while len(words) < count:
+        lengths = rng.integers(2, 5, size=count)
+        draws = rng.integers(0, len(syllables), size=(count, 4))
+        for length, row in zip(lengths, draws):
+            words.setdefault("".join(syllables[i] for i in row[:length]))
+            if len(words) == count:
+                break
+    return list(words)
+
+
+def _in_values(where) -> List[Any]:
+    value = where.right.value
+    return list(value) if value is not None else []
+
+
+def _as_uuid(value: Any) -> uuid.UUID:
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
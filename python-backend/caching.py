@@ -0,0 +1,303 @@
+import sys
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import AsyncSessionLocal, EmbeddingCacheEntry
+from config import settings
+
+logger = logging.getLogger("caching")
+
+
+def text_hash(text: str) -> str:
+    """Content address of a text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    """Cache key form of a question: Unicode-normalized, case-folded, whitespace-collapsed"""
+    return " ".join(unicodedata.normalize("NFKC", question).split()).casefold()
+
+
+def _sizeof(value: Any) -> int:
+    return value.nbytes if isinstance(value, np.ndarray) else sys.getsizeof(value)
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU mapping with hit/miss counters.
+
+    Entries are evicted least-recently-used first when either `max_entries`
+    or the optional `max_bytes` memory cap is exceeded, and expire after the
+    optional `ttl` in seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None, max_bytes: Optional[int] = None, sizeof: Callable[[Any], int] = _sizeof):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._sizeof = sizeof
+        self._bytes = 0
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        # Membership test that neither counts as a lookup nor refreshes recency
+        entry = self._data.get(key)
+        return entry is not None and entry[1] >= time.monotonic()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        size = self._sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class AnswerCache:
+    """Cache of generated answers keyed by normalized question and retrieval scope.
+
+    The scope combines the set of candidate documents with their corpus
+    version, so re-ingesting any of them makes earlier answers unreachable
+    rather than stale. With a `semantic_threshold`, an exact miss falls back
+    to the cached question of the same scope whose embedding is most similar,
+    when its cosine similarity reaches the threshold.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.ANSWER_CACHE_SIZE,
+        ttl: Optional[float] = settings.ANSWER_CACHE_TTL,
+        semantic_threshold: Optional[float] = settings.ANSWER_CACHE_SEMANTIC_THRESHOLD,
+    ):
+        self.entries = LRUCache(max_entries, ttl=ttl)
+        self.semantic_threshold = semantic_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        # scope -> normalized question -> unit question embedding, for semantic lookups
+        self._vectors: Dict[Hashable, Dict[str, np.ndarray]] = {}
+        self._vector_count = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def scope(document_ids: List[Any], corpus_version: int) -> Tuple[str, int]:
+        """Scope of an answer: digest of the candidate document set and its corpus version"""
+        digest = hashlib.sha256("\0".join(sorted(str(doc_id) for doc_id in document_ids)).encode("utf-8")).hexdigest()
+        return digest, corpus_version
+
+    def get(self, question: str, scope: Hashable, question_vector: Optional[np.ndarray] = None) -> Optional[Dict[str, Any]]:
+        """Cached answer for the question in this scope, by exact or (with a vector) semantic match"""
+        key = normalize_question(question)
+        value = self.entries.get((key, scope))
+        if value is not None:
+            self.exact_hits += 1
+            return value
+        if question_vector is not None and self.semantic_threshold:
+            match = self._nearest(scope, question_vector)
+            value = self.entries.get((match, scope)) if match is not None else None
+            if value is not None:
+                self.semantic_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, question: str, scope: Hashable, value: Dict[str, Any], question_vector: Optional[np.ndarray] = None) -> None:
+        key = normalize_question(question)
+        self.entries.put((key, scope), value)
+        if question_vector is None or not self.semantic_threshold:
+            return
+        norm = float(np.linalg.norm(question_vector))
+        if norm == 0:
+            return
+        with self._lock:
+            questions = self._vectors.setdefault(scope, {})
+            if key not in questions:
+                self._vector_count += 1
+            questions[key] = np.asarray(question_vector, dtype=np.float32) / norm
+            if self._vector_count > 2 * self.entries.max_entries:
+                self._prune()
+
+    def clear(self) -> None:
+        self.entries.clear()
+        with self._lock:
+            self._vectors.clear()
+            self._vector_count = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "memory": self.entries.stats(),
+            "semantic_threshold": self.semantic_threshold,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _nearest(self, scope: Hashable, question_vector: np.ndarray) -> Optional[str]:
+        with self._lock:
+            candidates = [(key, vector) for key, vector in self._vectors.get(scope, {}).items() if len(vector) == len(question_vector)]
+        if not candidates:
+            return None
+        norm = float(np.linalg.norm(question_vector))
+        if norm == 0:
+            return None
+        scores = np.stack([vector for _, vector in candidates]) @ (np.asarray(question_vector, dtype=np.float32) / norm)
+        best = int(np.argmax(scores))
+        return candidates[best][0] if scores[best] >= self.semantic_threshold else None
+
+    def _prune(self) -> None:
+        # Drop embeddings of answers the LRU has evicted or expired; called with the lock held
+        for scope in list(self._vectors):
+            questions = {key: vector for key, vector in self._vectors[scope].items() if (key, scope) in self.entries}
+            if questions:
+                self._vectors[scope] = questions
+            else:
+                del self._vectors[scope]
+        self._vector_count = sum(len(questions) for questions in self._vectors.values())
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache keyed by (model name, sha256 of text).
+
+    Lookups go to a bounded in-process LRU first and then to the
+    `embedding_cache` table, so identical chunks across documents, tenants
+    and restarts are embedded once.
+    """
+
+    def __init__(self, max_entries: int = settings.EMBEDDING_CACHE_SIZE, persistent: bool = settings.EMBEDDING_CACHE_PERSISTENT):
+        self.memory = LRUCache(max_entries)
+        self.persistent = persistent
+        self.persistent_hits = 0
+        self.misses = 0
+
+    async def get_many(self, model: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """Return {position: vector} for every text that is already cached"""
+        found: Dict[int, np.ndarray] = {}
+        missing: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            key = text_hash(text)
+            vector = self.memory.get((model, key))
+            if vector is not None:
+                found[i] = vector
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing and self.persistent:
+            for key, vector in (await self._load(model, list(missing))).items():
+                self.memory.put((model, key), vector)
+                self.persistent_hits += len(missing[key])
+                for i in missing.pop(key):
+                    found[i] = vector
+
+        self.misses += sum(len(positions) for positions in missing.values())
+        return found
+
+    async def put_many(self, model: str, texts: List[str], vectors: List[np.ndarray]) -> None:
+        """Store freshly computed vectors in both tiers"""
+        entries = {}
+        for text, vector in zip(texts, vectors):
+            key = text_hash(text)
+            self.memory.put((model, key), vector)
+            entries[key] = vector
+        if entries and self.persistent:
+            await self._store(model, entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory.hits + self.memory.misses
+        hits = self.memory.hits + self.persistent_hits
+        return {
+            "memory": self.memory.stats(),
+            "persistent_enabled": self.persistent,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    async def _load(self, model: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        try:
+            async with AsyncSessionLocal() as session:
+                stmt = select(EmbeddingCacheEntry.text_hash, EmbeddingCacheEntry.embedding).where(
+                    tuple_(EmbeddingCacheEntry.model, EmbeddingCacheEntry.text_hash).in_([(model, key) for key in keys])
+                )
+                result = await session.execute(stmt)
+                return {key: np.frombuffer(blob, dtype=np.float32) for key, blob in result}
+        except Exception as e:
+            logger.warning(f"Persistent embedding cache lookup failed: {str(e)}")
+            return {}
+
+    async def _store(self, model: str, entries: Dict[str, np.ndarray]) -> None:
+        try:
+            async with AsyncSessionLocal() as session:
+                rows = [
+                    {"model": model, "text_hash": key, "embedding": np.asarray(vector, dtype=np.float32).tobytes()}
+                    for key, vector in entries.items()
+                ]
+                stmt = pg_insert(EmbeddingCacheEntry).on_conflict_do_nothing(index_elements=["model", "text_hash"])
+                await session.execute(stmt, rows)
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"Persistent embedding cache write failed: {str(e)}")
@@ -0,0 +1,226 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional
+from config import settings
+
+# Subword-ish pieces: runs of word characters, or single punctuation marks
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_WORD_RE = re.compile(r"\S+")
+_SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?;:])\s+")
+# Markdown headings, numbered section titles ("2.1 Installation", "IV. Results") and short ALL-CAPS lines
+_HEADING_RE = re.compile(
+    r"^(#{1,6}\s+\S.*"
+    r"|(?:\d+(?:\.\d+)*\.?|[IVXLC]+\.)\s+[A-Z][^.!?]{0,80}"
+    r"|(?i:chapter|section|part|appendix)\s+\S[^.!?]{0,80}"
+    r"|[A-Z][A-Z0-9 &/,:'()\-]{2,80})$"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate subword token count: one per punctuation mark plus one per ~4 characters of each word.
+
+    This tracks the BPE/WordPiece tokenizers of common embedding models
+    (e.g. nomic-embed-text) closely enough to size chunks without loading one.
+    """
+    return sum((len(piece) + 3) // 4 if piece[0].isalnum() or piece[0] == "_" else 1 for piece in _PIECE_RE.findall(text))
+
+
+@dataclass
+class Chunk:
+    """A chunk of source text with its character span, and page span for paged sources"""
+    text: str
+    char_start: int
+    char_end: int
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    token_count: int = 0
+
+
+@dataclass
+class _Unit:
+    # Smallest piece the packer moves around: a paragraph, or a sentence or word window of a long one
+    text: str
+    start: int
+    end: int
+    page: Optional[int]
+    tokens: int
+    block: int
+    heading: bool = False
+
+
+class Chunker:
+    """Token-budgeted chunker that keeps paragraphs and sections together.
+
+    Source text arrives as segments (PDF pages, Word paragraphs, or the whole
+    text), and character offsets refer to the segments joined with "\\n",
+    which is exactly what extraction returns. Paragraphs are packed whole up
+    to `max_tokens`; longer ones are split at sentence and then word
+    boundaries. A heading always starts a new chunk, consecutive chunks in a
+    section share up to `overlap_tokens` of trailing text, and a final chunk
+    with fewer than `min_tokens` of new text is merged into its predecessor.
+    Every piece of text is tokenized a bounded number of times, so chunking
+    is linear in the input size.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = settings.CHUNK_TOKENS,
+        overlap_tokens: int = settings.CHUNK_OVERLAP_TOKENS,
+        min_tokens: int = settings.CHUNK_MIN_TOKENS,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ):
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.min_tokens = max(0, min(min_tokens, self.max_tokens))
+        self.count_tokens = count_tokens
+
+    def split(self, text: str) -> List[Chunk]:
+        return list(self.iter_chunks([text]))
+
+    def iter_chunks(self, segments: Iterable[str], paged: bool = False) -> Iterator[Chunk]:
+        """Yield chunks as soon as they are complete; `paged` numbers segments as 1-based pages"""
+        current: List[_Unit] = []
+        current_tokens = 0
+        fresh = 0  # tokens in `current` that are not overlap from the previous chunk
+        held: Optional[List[_Unit]] = None  # last finished chunk, held back in case the tail is merged into it
+
+        for unit in self._units(segments, paged):
+            if current and fresh and (
+                current_tokens + unit.tokens > self.max_tokens or (unit.heading and fresh >= self.min_tokens)
+            ):
+                # A heading at the end of a full chunk moves on with the text it introduces
+                carry: List[_Unit] = []
+                while not unit.heading and current[-1].heading and fresh > current[-1].tokens:
+                    carry.insert(0, current.pop())
+                    fresh -= carry[0].tokens
+                if held is not None:
+                    yield self._build(held)
+                held = current
+                current = [] if unit.heading or carry else self._overlap(current, self.max_tokens - unit.tokens)
+                current.extend(carry)
+                current_tokens = sum(u.tokens for u in current)
+                fresh = sum(u.tokens for u in carry)
+            current.append(unit)
+            current_tokens += unit.tokens
+            fresh += unit.tokens
+
+        if fresh and held is not None and fresh < self.min_tokens:
+            tail = current[len(current) - self._fresh_count(current, fresh):]
+            if sum(u.tokens for u in held) + fresh <= self.max_tokens + self.min_tokens:
+                held = held + tail
+                fresh = 0
+        if held is not None:
+            yield self._build(held)
+        if fresh:
+            yield self._build(current)
+
+    def _overlap(self, units: List[_Unit], room: int) -> List[_Unit]:
+        """Trailing units of a finished chunk to repeat at the start of the next one"""
+        budget = min(self.overlap_tokens, room)
+        taken = 0
+        start = len(units)
+        while start > 1 and taken + units[start - 1].tokens <= budget and not units[start - 1].heading:
+            start -= 1
+            taken += units[start].tokens
+        return units[start:]
+
+    @staticmethod
+    def _fresh_count(units: List[_Unit], fresh_tokens: int) -> int:
+        count, total = 0, 0
+        for unit in reversed(units):
+            if total >= fresh_tokens:
+                break
+            total += unit.tokens
+            count += 1
+        return count
+
+    @staticmethod
+    def _build(units: List[_Unit]) -> Chunk:
+        parts = [units[0].text]
+        for previous, unit in zip(units, units[1:]):
+            parts.append(" " if unit.block == previous.block else "\n")
+            parts.append(unit.text)
+        return Chunk(
+            text="".join(parts),
+            char_start=units[0].start,
+            char_end=units[-1].end,
+            page_start=units[0].page,
+            page_end=units[-1].page,
+            token_count=sum(u.tokens for u in units),
+        )
+
+    def _units(self, segments: Iterable[str], paged: bool) -> Iterator[_Unit]:
+        base = 0
+        block = 0
+        for page, segment in enumerate(segments, start=1):
+            for start, end, heading in _blocks(segment):
+                block += 1
+                text = segment[start:end]
+                tokens = self.count_tokens(text)
+                unit = _Unit(text, base + start, base + end, page if paged else None, tokens, block, heading)
+                if tokens <= self.max_tokens:
+                    yield unit
+                else:
+                    yield from self._split_long(unit)
+            base += len(segment) + 1
+
+    def _split_long(self, unit: _Unit) -> Iterator[_Unit]:
+        """Split an oversized paragraph at sentence boundaries, and oversized sentences into word windows"""
+        position = 0
+        for match in _SENTENCE_BREAK_RE.finditer(unit.text):
+            yield from self._sentence(unit, position, match.start())
+            position = match.end()
+        yield from self._sentence(unit, position, len(unit.text))
+
+    def _sentence(self, unit: _Unit, start: int, end: int) -> Iterator[_Unit]:
+        text = unit.text[start:end]
+        if not text:
+            return
+        tokens = self.count_tokens(text)
+        if tokens <= self.max_tokens:
+            yield _Unit(text, unit.start + start, unit.start + end, unit.page, tokens, unit.block)
+            return
+        window_start = window_end = None
+        window_tokens = 0
+        for word in _WORD_RE.finditer(text):
+            word_tokens = self.count_tokens(word.group())
+            if window_start is not None and window_tokens + word_tokens > self.max_tokens:
+                yield _Unit(text[window_start:window_end], unit.start + start + window_start, unit.start + start + window_end, unit.page, window_tokens, unit.block)
+                window_start, window_tokens = None, 0
+            if window_start is None:
+                window_start = word.start()
+            window_end = word.end()
+            window_tokens += word_tokens
+        if window_start is not None:
+            yield _Unit(text[window_start:window_end], unit.start + start + window_start, unit.start + start + window_end, unit.page, window_tokens, unit.block)
+
+
+def _blocks(segment: str) -> Iterator[tuple]:
+    """(start, end, is_heading) of the paragraphs of a segment; blank lines and headings delimit paragraphs"""
+    block_start = block_end = None
+    position = 0
+    for line in segment.splitlines(keepends=True):
+        line_start, position = position, position + len(line)
+        stripped = line.strip()
+        if not stripped:
+            if block_start is not None:
+                yield block_start, block_end, False
+                block_start = None
+            continue
+        content_start = line_start + (len(line) - len(line.lstrip()))
+        content_end = line_start + len(line.rstrip())
+        if _is_heading(stripped):
+            if block_start is not None:
+                yield block_start, block_end, False
+                block_start = None
+            yield content_start, content_end, True
+            continue
+        if block_start is None:
+            block_start = content_start
+        block_end = content_end
+    if block_start is not None:
+        yield block_start, block_end, False
+
+
+def _is_heading(line: str) -> bool:
+    return len(line) <= 100 and len(line.split()) <= 12 and not line.endswith((".", ",", ";")) and bool(_HEADING_RE.match(line))
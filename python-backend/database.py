@@ -1,22 +1,68 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, String, Text, DateTime, UUID, Enum as SQLEnum, Integer
+from sqlalchemy import Column, String, Text, DateTime, UUID, Enum as SQLEnum, Integer, BigInteger, LargeBinary, Index
 from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from datetime import datetime
 import enum
+import time
+import logging
 from typing import AsyncGenerator
 from config import settings
 
-# Create async engine
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=True,  # Set to False in production
-)
+query_logger = logging.getLogger("database.query")
+
+
+def _create_engine(url: str):
+    """Async engine with the pool and statement cache configured from settings"""
+    connect_args = {}
+    if make_url(url).drivername == "postgresql+asyncpg":
+        # SQLAlchemy's prepared statement cache and asyncpg's own, sized together
+        connect_args = {
+            "prepared_statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE,
+        }
+    created = create_async_engine(
+        url,
+        echo=settings.DATABASE_ECHO,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        connect_args=connect_args,
+    )
+    event.listen(created.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(created.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return created
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if query_logger.isEnabledFor(logging.DEBUG):
+        conn.info["query_started"] = time.perf_counter()
+
 
-# Create async session factory
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        # Statement text only: parameters can hold whole chunk texts and vectors
+        query_logger.debug(f"{elapsed * 1000:.1f} ms: {' '.join(statement.split())[:200]}")
+
+
+# Create async engine for the primary, and one for the read replica when configured
+engine = _create_engine(settings.DATABASE_URL)
+read_engine = _create_engine(settings.DATABASE_READ_URL) if settings.DATABASE_READ_URL else engine
+
+# Create async session factories
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
+ReadSessionLocal = sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False
+)
 
 # Base class for models
 Base = declarative_base()
@@ -43,9 +89,19 @@ DocumentStatusEnum = SQLEnum(
     values_callable=lambda x: [e.value for e in x]
 )
 
+# Enum for ingestion job status, mirrors the NestJS IngestionStatusType
+class IngestionStatusType(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 # Database models
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        Index("idx_documents_status_id", "status", "id"),
+    )
     
     id = Column(PostgresUUID(as_uuid=True), primary_key=True)
     title = Column(String(256), nullable=False)
@@ -53,15 +109,46 @@ class Document(Base):
     owner_id = Column(PostgresUUID(as_uuid=True), nullable=True)
     status = Column(DocumentStatusEnum, default=DocumentStatus.PENDING.value)
     created_at = Column(DateTime, default=datetime.utcnow)
+    ingest_version = Column(BigInteger, nullable=False, default=0)  # Incremented by every committed ingestion; keys cached answers
 
 class Embedding(Base):
     __tablename__ = "embeddings"
+    __table_args__ = (
+        Index("idx_embeddings_document_id_chunk_index", "document_id", "chunk_index"),
+    )
     
     id = Column(PostgresUUID(as_uuid=True), primary_key=True)
     document_id = Column(PostgresUUID(as_uuid=True), nullable=False)
     chunk_index = Column(Integer, nullable=False)
-    embedding = Column(Text, nullable=False)  # Store as JSON string for Ollama embeddings
+    embedding = Column(Text, nullable=True)  # Legacy JSON text vectors, read until backfilled into embedding_bytes
+    embedding_bytes = Column(LargeBinary, nullable=True)  # Binary vector, see vector_codec
+    embedding_vector = Column(Vector(settings.EMBEDDING_DIM), nullable=True)  # Native pgvector copy for ANN search
     chunk_content = Column(Text, nullable=True)  # Store the actual chunk content
+    content_hash = Column(String(64), nullable=True)  # sha256 of embedding model + chunk text, for incremental re-ingestion
+    char_start = Column(Integer, nullable=True)  # Source span of the chunk in the extracted document text
+    char_end = Column(Integer, nullable=True)
+    page_start = Column(Integer, nullable=True)  # 1-based page span, for paged sources such as PDFs
+    page_end = Column(Integer, nullable=True)
+    token_count = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IngestionStatus(Base):
+    __tablename__ = "ingestion_status"
+    
+    id = Column(PostgresUUID(as_uuid=True), primary_key=True)
+    document_id = Column(PostgresUUID(as_uuid=True), nullable=False)
+    status = Column(String(32), nullable=False)  # pending, running, completed, failed
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    error_message = Column(Text, nullable=True)
+    batch_id = Column(PostgresUUID(as_uuid=True), nullable=True)  # Set for documents queued by /ingest/batch
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+    
+    model = Column(String(128), primary_key=True)
+    text_hash = Column(String(64), primary_key=True)  # sha256 of the embedded text
+    embedding = Column(LargeBinary, nullable=False)  # Raw float32 bytes
     created_at = Column(DateTime, default=datetime.utcnow)
 
 # Dependency to get database session
@@ -70,4 +157,12 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         try:
             yield session
         finally:
-            await session.close() 
\ No newline at end of file
+            await session.close()
+
+# Dependency for read-only paths (/qa, /documents), served by the replica when one is configured
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from typing import List, Optional, Callable
+import numpy as np
+import httpx
+from config import settings
+from providers import EmbeddingProvider
+import metrics
+
+logger = logging.getLogger("embedding_client")
+
+
+class EmbeddingError(Exception):
+    """Raised when Ollama cannot produce embeddings after all retries"""
+
+
+class OllamaEmbeddingClient(EmbeddingProvider):
+    """Long-lived embedding client with a shared connection pool.
+
+    Texts are sent in batches through Ollama's multi-input `/api/embed`
+    endpoint. A semaphore bounds how many batches are in flight at once, and
+    failed batches are retried with exponential backoff before raising
+    `EmbeddingError`.
+    """
+
+    def __init__(
+        self,
+        base_url: str = settings.OLLAMA_BASE_URL,
+        model: str = settings.EMBEDDING_MODEL,
+        batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+        concurrency: int = settings.EMBEDDING_CONCURRENCY,
+        timeout: float = settings.EMBEDDING_TIMEOUT,
+        max_retries: int = settings.EMBEDDING_MAX_RETRIES,
+        retry_backoff: float = settings.EMBEDDING_RETRY_BACKOFF,
+    ):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+
+    async def embed(self, texts: List[str], progress: Optional[Callable[[int], None]] = None) -> List[np.ndarray]:
+        """Embed texts in batches, preserving input order.
+
+        `progress` is called with the number of texts embedded so far after each batch.
+        """
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        done = 0
+
+        async def run(batch: List[str]) -> List[np.ndarray]:
+            nonlocal done
+            vectors = await self._embed_batch(batch)
+            done += len(batch)
+            if progress:
+                progress(done)
+            return vectors
+
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return [vector for batch in results for vector in batch]
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        """Embed a single text, e.g. a question"""
+        return (await self._embed_batch([text]))[0]
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def _embed_batch(self, batch: List[str]) -> List[np.ndarray]:
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self._client.post(
+                        "/api/embed",
+                        json={"model": self.model, "input": batch}
+                    )
+                    if response.status_code == 200:
+                        embeddings = response.json().get("embeddings") or []
+                        if len(embeddings) != len(batch):
+                            metrics.PROVIDER_ERRORS.labels(provider="ollama", kind="bad_response").inc()
+                            raise EmbeddingError(f"Ollama returned {len(embeddings)} embeddings for {len(batch)} inputs")
+                        return [np.array(e, dtype=np.float32) for e in embeddings]
+                    # Client errors other than rate limiting will not succeed on retry
+                    if 400 <= response.status_code < 500 and response.status_code != 429:
+                        metrics.PROVIDER_ERRORS.labels(provider="ollama", kind="rejected").inc()
+                        raise EmbeddingError(f"Embedding request failed: {response.status_code} {response.text[:200]}")
+                    error = f"Embedding request failed: {response.status_code}"
+                except httpx.HTTPError as e:
+                    error = f"Embedding request error: {type(e).__name__}: {str(e)}"
+
+                if attempt < self.max_retries:
+                    delay = self.retry_backoff * (2 ** attempt)
+                    logger.warning(f"{error} (batch of {len(batch)}), retrying in {delay:.1f}s")
+                    metrics.PROVIDER_RETRIES.labels(provider="ollama").inc()
+                    await asyncio.sleep(delay)
+
+            metrics.PROVIDER_ERRORS.labels(provider="ollama", kind="unavailable").inc()
+            raise EmbeddingError(f"{error} after {self.max_retries + 1} attempts")
@@ -0,0 +1,387 @@
+import re
+import json
+import signal
+import asyncio
+import logging
+import tempfile
+import threading
+import contextvars
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, BinaryIO, Callable, Iterator, List, Optional, Tuple, TypeVar
+from config import settings
+
+logger = logging.getLogger("extraction")
+
+T = TypeVar("T")
+
+# Extra time the event loop waits past a job's own time limit before giving up on its worker
+_TIMEOUT_GRACE = 5.0
+
+WORD_MIME_TYPES = ('application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+
+
+class ExtractionError(Exception):
+    """Raised when a file cannot be extracted within the configured limits"""
+
+
+class FileTooLargeError(ExtractionError):
+    """Raised for files above the extraction size limit"""
+
+
+class ExtractionTimeoutError(ExtractionError):
+    """Raised when an extraction job exceeds its time limit"""
+
+
+class _JobTimeout(BaseException):
+    # BaseException, so the extractors' own error handling cannot turn it into placeholder text
+    pass
+
+
+class ExtractionPool:
+    """Runs CPU-bound text extraction (PyPDF2, BeautifulSoup, python-docx) in worker processes.
+
+    Files larger than `max_bytes` are rejected up front and every job is
+    limited to `timeout` seconds. PDFs are written to a temporary file once
+    and extracted in windows of pages, with the next window already running
+    while the current one is consumed. Every job parses the file again, so
+    the first window of `pages_per_job` pages is followed by at most
+    `max_pdf_jobs` larger ones.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.EXTRACTION_WORKERS,
+        max_bytes: int = settings.EXTRACTION_MAX_BYTES,
+        timeout: float = settings.EXTRACTION_TIMEOUT,
+        pages_per_job: int = settings.EXTRACTION_PDF_PAGES_PER_JOB,
+        max_pdf_jobs: int = settings.EXTRACTION_PDF_MAX_JOBS,
+        max_tasks_per_child: int = settings.EXTRACTION_MAX_TASKS_PER_CHILD,
+    ):
+        self.workers = max(1, workers)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.pages_per_job = max(1, pages_per_job)
+        self.max_pdf_jobs = max(1, max_pdf_jobs)
+        self.max_tasks_per_child = max_tasks_per_child or None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    async def extract_text(self, file_content: bytes, mime_type: str) -> str:
+        """Extract the full text of a file in a worker process"""
+        self._check_size(file_content)
+        future = self._submit(extract_text, file_content, mime_type)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout + _TIMEOUT_GRACE)
+        except asyncio.TimeoutError:
+            self._recycle()
+            raise ExtractionTimeoutError(f"Extraction did not finish within {self.timeout:g}s")
+        except (_JobTimeout, BrokenProcessPool) as e:
+            raise self._job_error(e)
+
+    def iter_segments(self, file_content: bytes, mime_type: str) -> Iterator[str]:
+        """Blocking counterpart of iter_text_segments backed by the pool; run it off the event loop"""
+        self._check_size(file_content)
+        if mime_type != 'application/pdf':
+            yield from self._result(self._submit(_extract_segments, file_content, mime_type))
+            return
+        with tempfile.NamedTemporaryFile(prefix="extract-", suffix=".pdf") as pdf_file:
+            pdf_file.write(file_content)
+            pdf_file.flush()
+            yield from _pdf_segments(len(file_content), self._iter_pdf_windows(pdf_file.name))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _iter_pdf_windows(self, path: str) -> Iterator[str]:
+        # The first small window returns the page count, which sizes the remaining windows
+        texts, page_count = self._result(self._submit(_extract_pdf_window, path, 0, self.pages_per_job))
+        start = self.pages_per_job
+        step = max(self.pages_per_job, -(-(page_count - start) // self.max_pdf_jobs))
+        while True:
+            # Queue the next window before handing back this one, so parsing overlaps consumption
+            future = self._submit(_extract_pdf_window, path, start, min(start + step, page_count), page_count) if start < page_count else None
+            yield from texts
+            if future is None:
+                return
+            texts, _ = self._result(future)
+            start += step
+
+    def _check_size(self, file_content: bytes) -> None:
+        if self.max_bytes and len(file_content) > self.max_bytes:
+            raise FileTooLargeError(f"File of {len(file_content)} bytes exceeds the {self.max_bytes} byte extraction limit")
+
+    def _submit(self, fn: Callable[..., Any], *args) -> Future:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Never fork the server process with its event loop and pool threads
+                    mp_context=multiprocessing.get_context("spawn"),
+                    max_tasks_per_child=self.max_tasks_per_child,
+                )
+            executor = self._executor
+        try:
+            return executor.submit(_run_limited, self.timeout, fn, *args)
+        except BrokenProcessPool as e:
+            raise self._job_error(e)
+
+    def _result(self, future: Future) -> Any:
+        try:
+            return future.result(timeout=self.timeout + _TIMEOUT_GRACE)
+        except FutureTimeoutError:
+            self._recycle()
+            raise ExtractionTimeoutError(f"Extraction did not finish within {self.timeout:g}s")
+        except (_JobTimeout, BrokenProcessPool) as e:
+            raise self._job_error(e)
+
+    def _job_error(self, error: BaseException) -> ExtractionError:
+        if isinstance(error, _JobTimeout):
+            return ExtractionTimeoutError(f"Extraction did not finish within {self.timeout:g}s")
+        # A worker died (e.g. out of memory); start a fresh pool for the next job
+        self._recycle()
+        return ExtractionError(f"Extraction worker failed: {str(error)}")
+
+    def _recycle(self) -> None:
+        """Kill the workers of a stuck or broken pool; a new pool is created on the next job"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.warning("Extraction pool recycled after a stuck or failed worker")
+
+
+def _run_limited(timeout: float, fn: Callable[..., T], *args) -> T:
+    """Run fn in a worker process, interrupting it after `timeout` seconds where SIGALRM is available"""
+    if not timeout or not hasattr(signal, "setitimer"):
+        return fn(*args)
+
+    def on_alarm(signum, frame):
+        raise _JobTimeout()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _extract_segments(file_content: bytes, mime_type: str) -> List[str]:
+    return list(iter_text_segments(file_content, mime_type))
+
+
+def _extract_pdf_window(path: str, start: int, stop: int, page_count: Optional[int] = None) -> Tuple[List[str], int]:
+    """Text of pages [start, stop) of a PDF file, and the document's page count, counted unless given"""
+    import PyPDF2
+
+    with open(path, "rb") as stream:
+        pdf_reader = PyPDF2.PdfReader(stream)
+        if page_count is None:
+            page_count = len(pdf_reader.pages)
+            stop = min(stop, page_count)
+        return [(pdf_reader.pages[number].extract_text() or "") for number in range(start, stop)], page_count
+
+
+def iter_text_segments(file_content: bytes, mime_type: str) -> Iterator[str]:
+    """Yield the text of a file incrementally: one page of a PDF or one paragraph of a Word document at a time.
+
+    Other formats are small enough in practice to be extracted in one piece.
+    Extraction failures are reported as a placeholder text, as before.
+    """
+    try:
+        if mime_type == 'application/pdf':
+            yield from _iter_pdf_pages(file_content)
+        elif mime_type in WORD_MIME_TYPES:
+            yield from _iter_word_paragraphs(file_content)
+        else:
+            yield _extract_whole(file_content, mime_type)
+    except Exception as e:
+        logger.error(f"Error extracting content from BLOB: {str(e)}")
+        yield f"Error extracting content: {str(e)}"
+
+
+def extract_text(file_content: bytes, mime_type: str) -> str:
+    """Extract the full text of a file as one string"""
+    return '\n'.join(iter_text_segments(file_content, mime_type))
+
+
+async def iterate_in_thread(make_iterator: Callable[[], Iterator[T]], max_pending: int = 256) -> AsyncIterator[T]:
+    """Drive a blocking iterator on a worker thread and yield its items on the event loop.
+
+    At most `max_pending` items are buffered: the thread blocks once the
+    consumer falls behind, so the producer only ever runs a bounded window
+    ahead. Exceptions raised by the iterator are re-raised in the consumer,
+    and the thread stops early if the consumer does.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(2, max_pending))
+    stopped = threading.Event()
+    done = object()
+
+    def put(item) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce() -> None:
+        try:
+            for item in make_iterator():
+                if stopped.is_set():
+                    return
+                put(item)
+        except Exception as e:
+            put(_Failure(e))
+        finally:
+            put(done)
+
+    # Run in a copy of the caller's context, so stages timed by the iterator join the caller's trace
+    producer = loop.run_in_executor(None, contextvars.copy_context().run, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        # Free queue slots so a producer blocked on a full queue can observe the stop
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+
+
+class _Failure:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def _iter_pdf_pages(file_content: bytes) -> Iterator[str]:
+    """Yield the text of each PDF page as it is parsed"""
+    return _pdf_segments(len(file_content), _read_pdf_pages(BytesIO(file_content)))
+
+
+def _read_pdf_pages(stream: BinaryIO, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    import PyPDF2
+
+    pdf_reader = PyPDF2.PdfReader(stream)
+    for page in pdf_reader.pages[start:stop]:
+        yield page.extract_text() or ""
+
+
+def _pdf_segments(size: int, page_texts: Iterator[str]) -> Iterator[str]:
+    """Page texts, or a placeholder text when nothing could be extracted"""
+    found_text = False
+    try:
+        # Empty pages are yielded too, so the n-th segment is always page n
+        for text in page_texts:
+            found_text = found_text or bool(text.strip())
+            yield text
+    except ImportError:
+        yield f"PDF content (size: {size} bytes) - PyPDF2 library not available"
+        return
+    except ExtractionError:
+        raise
+    except Exception as e:
+        if found_text:
+            logger.warning(f"PDF extraction stopped early: {str(e)}")
+            return
+        yield f"PDF content (size: {size} bytes) - Error extracting text: {str(e)}"
+        return
+
+    if not found_text:
+        yield f"PDF content (size: {size} bytes) - No text could be extracted (may be scanned/image-based PDF)"
+
+
+def _iter_word_paragraphs(file_content: bytes) -> Iterator[str]:
+    """Yield each non-empty paragraph of a Word document, then the text of its table cells"""
+    try:
+        from docx import Document
+    except ImportError:
+        yield f"Word document content (size: {len(file_content)} bytes) - python-docx library not available"
+        return
+
+    found_text = False
+    try:
+        doc = Document(BytesIO(file_content))
+        for paragraph in doc.paragraphs:
+            if paragraph.text.strip():
+                found_text = True
+                yield paragraph.text
+
+        # Also extract text from tables
+        for table in doc.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    if cell.text.strip():
+                        found_text = True
+                        yield cell.text
+    except Exception as e:
+        if found_text:
+            logger.warning(f"Word document extraction stopped early: {str(e)}")
+            return
+        yield f"Word document content (size: {len(file_content)} bytes) - Error extracting text: {str(e)}"
+        return
+
+    if not found_text:
+        yield f"Word document content (size: {len(file_content)} bytes) - No text could be extracted"
+
+
+def _extract_whole(file_content: bytes, mime_type: str) -> str:
+    """Extract text from plain text, HTML, JSON, XML or unknown files in one piece"""
+    if mime_type == 'text/plain':
+        return file_content.decode('utf-8', errors='ignore')
+
+    elif mime_type == 'text/html':
+        # For HTML files, extract text content using BeautifulSoup
+        try:
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(file_content.decode('utf-8', errors='ignore'), 'html.parser')
+            # Remove script and style elements
+            for script in soup(["script", "style"]):
+                script.decompose()
+            # Get text and clean up whitespace
+            text = soup.get_text()
+            lines = (line.strip() for line in text.splitlines())
+            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+            return ' '.join(chunk for chunk in chunks if chunk)
+        except ImportError:
+            # Fallback to regex if BeautifulSoup is not available
+            return _strip_tags(file_content)
+
+    elif mime_type == 'application/json':
+        try:
+            data = json.loads(file_content.decode('utf-8'))
+            return json.dumps(data, indent=2)
+        except Exception:
+            return file_content.decode('utf-8', errors='ignore')
+
+    elif mime_type == 'text/xml':
+        try:
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(file_content.decode('utf-8', errors='ignore'), 'xml')
+            return soup.get_text()
+        except ImportError:
+            return _strip_tags(file_content)
+
+    else:
+        # For unknown file types, try to decode as text
+        try:
+            return file_content.decode('utf-8', errors='ignore')
+        except Exception:
+            return f"Binary file content (size: {len(file_content)} bytes, type: {mime_type}) - Text extraction not available"
+
+
+def _strip_tags(file_content: bytes) -> str:
+    text = re.sub(r'<[^>]+>', '', file_content.decode('utf-8', errors='ignore'))
+    return re.sub(r'\s+', ' ', text).strip()
@@ -0,0 +1,161 @@
+"""Versioned on-disk snapshots of the vector index, shared by uvicorn worker processes.
+
+Layout of VECTOR_INDEX_DIR:
+
+    manifest.json          current generation, e.g. {"generation": 7, "path": "gen-00000007", ...}
+    gen-00000007/          vectors.npy, doc_codes.npy, chunk_indices.npy, documents.json
+    changes/               one file per committed ingestion, listing the re-ingested documents
+    publish.lock           held while a generation is built
+
+Workers map the current generation read-only, so the matrix is held once in
+the page cache however many workers serve it. A worker that commits an
+ingestion records a change file. Any worker can then fold the pending
+changes into the next generation: the changed documents are re-read from the
+embeddings table and merged with the current generation. The new generation
+is written to its own directory and made current by atomically replacing the
+manifest. The manifest lists the changed documents of recent
+generations, so workers know which documents to refresh when they remap.
+Superseded generations are deleted, which is safe on POSIX: existing maps
+stay valid until they are dropped. Workers open a generation while holding
+the publish lock, so it cannot be pruned between reading the manifest and mapping it.
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set
+from vector_index import VectorIndex
+
+logger = logging.getLogger("index_snapshots")
+
+MANIFEST = "manifest.json"
+CHANGES = "changes"
+HISTORY = 32  # Generations whose changed documents are kept in the manifest
+
+
+class IndexSnapshots:
+    """Generations of a VectorIndex saved under one directory"""
+
+    def __init__(self, directory: str, keep: int = 2):
+        self.directory = directory
+        self.keep = max(1, keep)  # Generations left on disk, the current one included
+        os.makedirs(os.path.join(directory, CHANGES), exist_ok=True)
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """Manifest of the current generation, or None before the first publish"""
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def open(self, manifest: Dict[str, Any]) -> VectorIndex:
+        """Map the generation described by `manifest`; call with the lock held, or it may be pruned first"""
+        return VectorIndex.open(os.path.join(self.directory, manifest["path"]))
+
+    @asynccontextmanager
+    async def lock(self):
+        """Exclusive publish lock across processes; waiting for it does not block the event loop"""
+        fd = os.open(os.path.join(self.directory, "publish.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # Releases the lock
+
+    def record_change(self, document_ids: Iterable[Any]) -> str:
+        """Record documents whose rows were committed, for the next publish; returns the change name"""
+        name = f"{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+        temporary = os.path.join(self.directory, CHANGES, f".{name}.tmp")
+        with open(temporary, "w") as f:
+            json.dump([str(doc_id) for doc_id in document_ids], f)
+        os.replace(temporary, os.path.join(self.directory, CHANGES, name))
+        return name
+
+    def pending_changes(self) -> Dict[str, List[str]]:
+        """Recorded changes not yet part of a generation, by change name"""
+        changes = {}
+        for name in sorted(os.listdir(os.path.join(self.directory, CHANGES))):
+            if name.startswith("."):
+                continue
+            try:
+                with open(os.path.join(self.directory, CHANGES, name)) as f:
+                    changes[name] = json.load(f)
+            except FileNotFoundError:
+                continue
+        return changes
+
+    def publish(self, index: VectorIndex, exclude: Optional[Iterable[Any]] = None, extra: Optional[VectorIndex] = None, changes: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+        """Save `index`, minus the `exclude` documents and plus the rows of `extra`, as the next
+        generation and make it current; call with the lock held.
+
+        `changes` are the recorded changes folded into this generation. They are
+        listed in the manifest and their files removed once it is current.
+        """
+        previous = self.current()
+        generation = (previous["generation"] if previous else 0) + 1
+        path = f"gen-{generation:08d}"
+        staging = os.path.join(self.directory, f".{path}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        rows = index.save(staging, exclude=exclude, extra=extra)
+        _fsync_tree(staging)
+        os.replace(staging, os.path.join(self.directory, path))
+
+        changes = changes or {}
+        history = (previous or {}).get("history", [])[-(HISTORY - 1):] + [{
+            "generation": generation,
+            "documents": sorted({doc_id for doc_ids in changes.values() for doc_id in doc_ids}),
+        }]
+        manifest = {"generation": generation, "path": path, "rows": rows, "dim": index.dim or (extra.dim if extra else None), "published_at": time.time(), "history": history}
+        temporary = os.path.join(self.directory, f".{MANIFEST}.tmp")
+        with open(temporary, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, os.path.join(self.directory, MANIFEST))
+        _fsync_directory(self.directory)
+        for name in changes:
+            try:
+                os.remove(os.path.join(self.directory, CHANGES, name))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Published vector index generation {generation} with {rows} rows ({len(history[-1]['documents'])} documents changed)")
+        self._prune(generation)
+        return manifest
+
+    @staticmethod
+    def changed_since(manifest: Dict[str, Any], generation: int) -> Optional[Set[str]]:
+        """Documents changed after `generation` up to `manifest`, or None when the history does not reach back that far"""
+        history = [entry for entry in manifest.get("history", []) if entry["generation"] > generation]
+        if len(history) != manifest["generation"] - generation:
+            return None
+        return {doc_id for entry in history for doc_id in entry["documents"]}
+
+    def _prune(self, generation: int) -> None:
+        for name in os.listdir(self.directory):
+            if name.startswith("gen-") and int(name[4:]) <= generation - self.keep:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+def _fsync_tree(directory: str) -> None:
+    for name in os.listdir(directory):
+        fd = os.open(os.path.join(directory, name), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    _fsync_directory(directory)
+
+
+def _fsync_directory(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
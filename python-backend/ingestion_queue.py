@@ -0,0 +1,345 @@
+import asyncio
+import uuid
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+from sqlalchemy import select, update
+from database import AsyncSessionLocal, Document, DocumentStatus, IngestionStatus, IngestionStatusType
+from config import settings
+
+logger = logging.getLogger("ingestion_queue")
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue cannot accept more jobs"""
+
+
+# Job status for each ingestion_status value
+_JOB_STATUS = {
+    IngestionStatusType.PENDING.value: "queued",
+    IngestionStatusType.RUNNING.value: "running",
+    IngestionStatusType.COMPLETED.value: "completed",
+    IngestionStatusType.FAILED.value: "failed",
+}
+
+
+@dataclass
+class IngestionJob:
+    """In-memory view of one ingestion job and its progress"""
+    document_id: str
+    ingestion_id: uuid.UUID
+    status: str = "queued"  # queued, running, completed, failed
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    embeddings_count: Optional[int] = None
+    error: Optional[str] = None
+    batch_id: Optional[str] = None  # Set for jobs queued together by enqueue_batch
+    created_at: Optional[datetime] = field(default_factory=datetime.utcnow)  # None for jobs read back from the database
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+    @property
+    def id(self) -> str:
+        """Job id: the id of the job's ingestion_status row, so any worker process can look it up"""
+        return str(self.ingestion_id)
+
+    @classmethod
+    def from_status(cls, row: IngestionStatus) -> "IngestionJob":
+        """Job recorded by another worker process; progress counts are only known to that process"""
+        return cls(
+            document_id=str(row.document_id),
+            ingestion_id=row.id,
+            status=_JOB_STATUS.get(row.status, row.status),
+            error=row.error_message,
+            batch_id=str(row.batch_id) if row.batch_id else None,
+            created_at=None,
+            started_at=row.started_at,
+            completed_at=row.completed_at,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "document_id": self.document_id,
+            "ingestion_id": str(self.ingestion_id),
+            "status": self.status,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "embeddings_count": self.embeddings_count,
+            "error": self.error,
+            "batch_id": self.batch_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+        }
+
+
+class IngestionQueue:
+    """Bounded async job queue that runs process_document on a pool of workers.
+
+    State transitions are written to the `ingestion_status` table and the
+    document status is flipped to INGESTED or FAILED when a job finishes.
+    A batch of documents is one queue entry, processed by a single worker
+    with RAGService.process_documents. Jobs are tracked in memory by the
+    process that queued them; other uvicorn workers read their status back
+    from `ingestion_status`.
+    """
+
+    def __init__(
+        self,
+        rag_service,
+        workers: int = settings.INGEST_WORKERS,
+        max_queue_size: int = settings.INGEST_QUEUE_SIZE,
+        job_history: int = settings.INGEST_JOB_HISTORY,
+    ):
+        self.rag_service = rag_service
+        self.workers = max(1, workers)
+        self.job_history = job_history
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._reserved = 0  # Queue slots held by enqueue calls still writing their status rows
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._batches: "OrderedDict[str, List[str]]" = OrderedDict()  # batch id -> job ids
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Start the worker pool"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Ingestion queue started with {self.workers} workers")
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued jobs are dropped"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, document_id: str, ingestion_id: Optional[uuid.UUID] = None) -> IngestionJob:
+        """Queue a document for ingestion and return its job right away"""
+        with self._reserve_slot():
+            if ingestion_id:
+                # The caller (NestJS) already created the ingestion_status row
+                job = IngestionJob(document_id=document_id, ingestion_id=ingestion_id)
+            else:
+                job = IngestionJob(document_id=document_id, ingestion_id=uuid.uuid4())
+                async with AsyncSessionLocal() as session:
+                    session.add(IngestionStatus(
+                        id=job.ingestion_id,
+                        document_id=document_id,
+                        status=IngestionStatusType.PENDING.value,
+                    ))
+                    await session.commit()
+            self._remember(job)
+            self._queue.put_nowait(job)
+        logger.info(f"Queued ingestion job {job.id} for document {document_id} (queue size: {self._queue.qsize()})")
+        return job
+
+    async def enqueue_batch(self, document_ids: List[str]) -> List[IngestionJob]:
+        """Queue many documents as one batch and return their jobs right away"""
+        with self._reserve_slot():
+            batch_id = str(uuid.uuid4())
+            jobs = [IngestionJob(document_id=document_id, ingestion_id=uuid.uuid4(), batch_id=batch_id) for document_id in document_ids]
+            async with AsyncSessionLocal() as session:
+                session.add_all([
+                    IngestionStatus(id=job.ingestion_id, document_id=job.document_id, status=IngestionStatusType.PENDING.value, batch_id=uuid.UUID(batch_id))
+                    for job in jobs
+                ])
+                await session.commit()
+
+            for job in jobs:
+                self._remember(job)
+            self._batches[batch_id] = [job.id for job in jobs]
+            while len(self._batches) > self.job_history:
+                self._batches.popitem(last=False)
+            self._queue.put_nowait(jobs)
+        logger.info(f"Queued ingestion batch {batch_id} with {len(jobs)} documents (queue size: {self._queue.qsize()})")
+        return jobs
+
+    @contextmanager
+    def _reserve_slot(self):
+        """Hold a queue slot while a job's status row is written, so concurrent enqueues cannot overfill the queue"""
+        if self._queue.maxsize > 0 and self._queue.qsize() + self._reserved >= self._queue.maxsize:
+            raise QueueFullError(f"Ingestion queue is full ({self._queue.maxsize} jobs)")
+        self._reserved += 1
+        try:
+            yield
+        finally:
+            self._reserved -= 1
+
+    async def get(self, job_id: str) -> Optional[IngestionJob]:
+        """A job of this process, with its progress, or one read from ingestion_status"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        jobs = await self._load_jobs(IngestionStatus.id, job_id)
+        return jobs[0] if jobs else None
+
+    async def get_batch(self, batch_id: str) -> Optional[List[IngestionJob]]:
+        """Jobs of a batch from the job history, or read from ingestion_status when any has been evicted"""
+        job_ids = self._batches.get(batch_id)
+        if job_ids is not None and all(job_id in self._jobs for job_id in job_ids):
+            return [self._jobs[job_id] for job_id in job_ids]
+        stored = await self._load_jobs(IngestionStatus.batch_id, batch_id)
+        if job_ids is None:
+            return stored or None
+        # Jobs still in the history are fresher than their status rows
+        by_id = {job.id: job for job in stored}
+        by_id.update((job_id, self._jobs[job_id]) for job_id in job_ids if job_id in self._jobs)
+        return [by_id[job_id] for job_id in job_ids if job_id in by_id]
+
+    @staticmethod
+    async def _load_jobs(column, value: str) -> List[IngestionJob]:
+        """Jobs whose ingestion_status `column` equals `value`; none when it is not a UUID"""
+        try:
+            value = uuid.UUID(value)
+        except ValueError:
+            return []
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(select(IngestionStatus).where(column == value))).scalars().all()
+        return [IngestionJob.from_status(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "running": sum(1 for job in self._jobs.values() if job.status == "running"),
+        }
+
+    def _remember(self, job: IngestionJob) -> None:
+        """Track a job, evicting the oldest finished ones beyond the history limit"""
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.job_history:
+            oldest_id = next(
+                (job_id for job_id, j in self._jobs.items() if j.status in ("completed", "failed")),
+                None
+            )
+            if oldest_id is None:
+                break
+            del self._jobs[oldest_id]
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if isinstance(job, list):
+                    await self._run_batch(job)
+                else:
+                    await self._run(job)
+            except Exception as e:
+                job_id = job[0].batch_id if isinstance(job, list) else job.id
+                logger.error(f"Worker {worker_id} failed on job {job_id}: {str(e)}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestionJob) -> None:
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        await self._record_status(job, IngestionStatusType.RUNNING, started_at=job.started_at)
+
+        def on_progress(embedded: int, total: int) -> None:
+            job.chunks_embedded = embedded
+            job.chunks_total = total
+
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await self.rag_service.process_document(session, job.document_id, progress=on_progress)
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+
+        job.completed_at = datetime.utcnow()
+        if result["status"] == "success":
+            job.status = "completed"
+            job.embeddings_count = result.get("embeddings_count")
+            await self._record_status(job, IngestionStatusType.COMPLETED, DocumentStatus.INGESTED, completed_at=job.completed_at)
+        else:
+            job.status = "failed"
+            job.error = result.get("message")
+            await self._record_status(job, IngestionStatusType.FAILED, DocumentStatus.FAILED, completed_at=job.completed_at, error_message=job.error)
+        logger.info(f"Ingestion job {job.id} for document {job.document_id} {job.status}")
+
+    async def _run_batch(self, jobs: List[IngestionJob]) -> None:
+        started_at = datetime.utcnow()
+        for job in jobs:
+            job.status = "running"
+            job.started_at = started_at
+        await self._record_statuses(jobs, IngestionStatusType.RUNNING, started_at=started_at)
+
+        by_document: Dict[str, List[IngestionJob]] = {}
+        for job in jobs:
+            by_document.setdefault(job.document_id, []).append(job)
+        remaining = set(by_document)
+        try:
+            async with AsyncSessionLocal() as session:
+                async for results in self.rag_service.process_documents(session, list(by_document)):
+                    remaining.difference_update(results)
+                    await self._finish_batch_jobs(
+                        [(job, result) for document_id, result in results.items() for job in by_document[document_id]]
+                    )
+        except Exception as e:
+            logger.error(f"Ingestion batch {jobs[0].batch_id} failed: {str(e)}", exc_info=True)
+            await self._finish_batch_jobs([
+                (job, {"status": "error", "message": str(e)}) for document_id in remaining for job in by_document[document_id]
+            ])
+        logger.info(f"Ingestion batch {jobs[0].batch_id} finished: {sum(1 for job in jobs if job.status == 'completed')} of {len(jobs)} completed")
+
+    async def _finish_batch_jobs(self, outcomes: List[Any]) -> None:
+        """Record the results of one committed group of a batch: one status update for successes, one for failures"""
+        completed_at = datetime.utcnow()
+        completed, failed = [], []
+        for job, result in outcomes:
+            job.completed_at = completed_at
+            if result["status"] == "success":
+                job.status = "completed"
+                job.embeddings_count = result.get("embeddings_count")
+                job.chunks_total = job.chunks_embedded = result.get("embeddings_count") or 0
+                completed.append(job)
+            else:
+                job.status = "failed"
+                job.error = result.get("message")
+                failed.append(job)
+        if completed:
+            await self._record_statuses(completed, IngestionStatusType.COMPLETED, DocumentStatus.INGESTED, completed_at=completed_at)
+        if failed:
+            await self._record_statuses(failed, IngestionStatusType.FAILED, DocumentStatus.FAILED, completed_at=completed_at)
+
+    async def _record_statuses(self, jobs: List[IngestionJob], status: IngestionStatusType, document_status: Optional[DocumentStatus] = None, **values) -> None:
+        """_record_status for many jobs in one transaction; each failed job keeps its own error message"""
+        try:
+            async with AsyncSessionLocal() as session:
+                # ORM bulk UPDATE by primary key, sent as one executemany
+                await session.execute(update(IngestionStatus), [
+                    {"id": job.ingestion_id, "status": status.value, **values, **({"error_message": job.error} if job.error else {})}
+                    for job in jobs
+                ])
+                if document_status is not None:
+                    await session.execute(
+                        update(Document)
+                        .where(Document.id.in_([job.document_id for job in jobs]))
+                        .values(status=document_status.value)
+                    )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Failed to record ingestion status for {len(jobs)} batch jobs: {str(e)}")
+
+    async def _record_status(self, job: IngestionJob, status: IngestionStatusType, document_status: Optional[DocumentStatus] = None, **values) -> None:
+        """Write a state transition to ingestion_status (and documents on completion)"""
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(IngestionStatus)
+                    .where(IngestionStatus.id == job.ingestion_id)
+                    .values(status=status.value, **values)
+                )
+                if document_status is not None:
+                    await session.execute(
+                        update(Document)
+                        .where(Document.id == job.document_id)
+                        .values(status=document_status.value)
+                    )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Failed to record ingestion status for job {job.id}: {str(e)}")
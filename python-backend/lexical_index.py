@@ -0,0 +1,158 @@
+import re
+import math
+import heapq
+import uuid
+import logging
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from database import Embedding
+
+logger = logging.getLogger("lexical_index")
+
+# Keeps identifiers such as part numbers and error codes ("ERR-404", "A12.3b") as single tokens
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compound identifiers also yield their parts"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-_./]", token) if part)
+    return tokens
+
+
+def _as_uuid(value: Any) -> uuid.UUID:
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+class BM25Index:
+    """Incrementally maintained in-process BM25 inverted index over chunk text.
+
+    Postings map a term to {chunk key: term frequency}, where a chunk key is
+    (document_id, chunk_index). Only the postings of the query terms are
+    touched at search time, so cost scales with matching chunks rather than
+    corpus size.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Tuple[uuid.UUID, int], int]] = defaultdict(dict)
+        self._lengths: Dict[Tuple[uuid.UUID, int], int] = {}
+        self._doc_terms: Dict[uuid.UUID, Dict[int, Tuple[str, ...]]] = defaultdict(dict)
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    async def load(self, session: AsyncSession, batch_size: int = 5000) -> int:
+        """Build the index from the stored chunk_content of every embedding row"""
+        stmt = select(Embedding.document_id, Embedding.chunk_index, Embedding.chunk_content)
+        result = await session.stream(stmt.execution_options(yield_per=batch_size))
+        loaded = 0
+        async for rows in result.partitions(batch_size):
+            for document_id, chunk_index, chunk_content in rows:
+                if chunk_content:
+                    self._add_chunk(document_id, chunk_index, chunk_content)
+                    loaded += 1
+        logger.info(f"Lexical index loaded {loaded} chunks ({len(self._postings)} terms)")
+        return loaded
+
+    async def reload_documents(self, session: AsyncSession, document_ids: Iterable[Any], batch_size: int = 1000) -> int:
+        """Replace the chunks of `document_ids` with their stored rows; documents without rows are removed.
+
+        Rows are read before the index is touched, so searches never see a document half reloaded.
+        """
+        document_ids = list(map(_as_uuid, document_ids))
+        chunks: Dict[uuid.UUID, List[Tuple[int, str]]] = {document_id: [] for document_id in document_ids}
+        for start in range(0, len(document_ids), batch_size):
+            stmt = select(Embedding.document_id, Embedding.chunk_index, Embedding.chunk_content).where(
+                Embedding.document_id.in_(document_ids[start:start + batch_size])
+            )
+            for document_id, chunk_index, chunk_content in await session.execute(stmt):
+                if chunk_content:
+                    chunks[document_id].append((chunk_index, chunk_content))
+        for document_id, document_chunks in chunks.items():
+            self.add_document(document_id, document_chunks)
+        return sum(len(document_chunks) for document_chunks in chunks.values())
+
+    def add_document(self, document_id: Any, chunks: Iterable[Tuple[int, str]]) -> None:
+        """Index (chunk_index, text) pairs of one document, replacing any previous chunks"""
+        self.remove_document(document_id)
+        self.add_chunks(document_id, chunks)
+
+    def add_chunks(self, document_id: Any, chunks: Iterable[Tuple[int, str]]) -> None:
+        """Index more (chunk_index, text) pairs of a document, keeping its previous chunks"""
+        document_id = _as_uuid(document_id)
+        for chunk_index, text in chunks:
+            self._add_chunk(document_id, chunk_index, text)
+
+    def take_document(self, other: "BM25Index", document_id: Any) -> None:
+        """Replace the chunks of a document with those indexed in `other`, without tokenizing again"""
+        document_id = _as_uuid(document_id)
+        self.remove_document(document_id)
+        for chunk_index, terms in other._doc_terms.get(document_id, {}).items():
+            key = (document_id, chunk_index)
+            for term in terms:
+                self._postings[term][key] = other._postings[term][key]
+            self._lengths[key] = other._lengths[key]
+            self._total_length += other._lengths[key]
+            self._doc_terms[document_id][chunk_index] = terms
+
+    def remove_document(self, document_id: Any) -> None:
+        document_id = _as_uuid(document_id)
+        for chunk_index, terms in self._doc_terms.pop(document_id, {}).items():
+            key = (document_id, chunk_index)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(key, None)
+                    if not postings:
+                        del self._postings[term]
+            self._total_length -= self._lengths.pop(key, 0)
+
+    def search(self, query: str, k: int, document_ids: Optional[Iterable[Any]] = None) -> List[Tuple[float, uuid.UUID, int]]:
+        """Return the top-k (bm25 score, document_id, chunk_index) for a text query"""
+        if not self._lengths or k <= 0:
+            return []
+        allowed = set(map(_as_uuid, document_ids)) if document_ids is not None else None
+        n = len(self._lengths)
+        avg_length = self._total_length / n
+        scores: Dict[Tuple[uuid.UUID, int], float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, tf in postings.items():
+                if allowed is not None and key[0] not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[key] / avg_length)
+                scores[key] += idf * tf * (self.k1 + 1) / (tf + norm)
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, doc_id, chunk_index) for (doc_id, chunk_index), score in top]
+
+    def _add_chunk(self, document_id: uuid.UUID, chunk_index: int, text: str) -> None:
+        key = (document_id, chunk_index)
+        if key in self._lengths:
+            return
+        terms = tokenize(text)
+        counts = Counter(terms)
+        for term, tf in counts.items():
+            self._postings[term][key] = tf
+        self._lengths[key] = len(terms)
+        self._total_length += len(terms)
+        self._doc_terms[document_id][chunk_index] = tuple(counts)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[uuid.UUID, int]]], k: int = 60) -> List[Tuple[float, Tuple[uuid.UUID, int]]]:
+    """Fuse ranked lists of chunk keys; each list contributes 1 / (k + rank)"""
+    fused: Dict[Tuple[uuid.UUID, int], float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] += 1.0 / (k + rank)
+    return sorted(((score, key) for key, score in fused.items()), key=lambda item: item[0], reverse=True)
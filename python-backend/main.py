@@ -1,13 +1,20 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import uuid
 import uvicorn
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
-from database import get_db, Document, DocumentStatus, engine
+from sqlalchemy import text, select
+from database import get_read_db, Document, DocumentStatus, engine, read_engine, AsyncSessionLocal
 from rag_service import RAGService
+from ingestion_queue import IngestionQueue, QueueFullError
+from extraction import FileTooLargeError, ExtractionTimeoutError
+from config import settings
+import metrics
 import uuid
+import json
 from datetime import datetime
 import logging
 
@@ -33,9 +40,21 @@ app.add_middleware(
 # Initialize RAG service
 rag_service = RAGService()
 
+# Background ingestion workers
+ingestion_queue = IngestionQueue(rag_service)
+
+def _collect_queue_metrics():
+    stats = ingestion_queue.stats()
+    metrics.INGEST_QUEUE.labels(state="queued").set(stats["queued"])
+    metrics.INGEST_QUEUE.labels(state="running").set(stats["running"])
+
+# Cache and queue gauges are refreshed when /metrics is scraped
+metrics.REGISTRY.add_collector(rag_service.collect_metrics)
+metrics.REGISTRY.add_collector(_collect_queue_metrics)
+
 @app.on_event("startup")
 async def startup_event():
-    """Check database connectivity on startup"""
+    """Check database connectivity and build the vector index on startup"""
     logger.info("Checking database connectivity...")
     try:
         async with engine.begin() as conn:
@@ -44,29 +63,110 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Database connection failed: {str(e)}")
         raise e
+    
+    if settings.API_WORKERS > 1 and not settings.VECTOR_INDEX_DIR:
+        logger.warning("API_WORKERS > 1 without VECTOR_INDEX_DIR: each worker keeps its own index and misses other workers' ingestions")
+    if settings.CHUNK_SIZE is not None or settings.CHUNK_OVERLAP is not None:
+        logger.warning(f"CHUNK_SIZE and CHUNK_OVERLAP counted characters and are ignored; chunks are sized by CHUNK_TOKENS={settings.CHUNK_TOKENS} and CHUNK_OVERLAP_TOKENS={settings.CHUNK_OVERLAP_TOKENS}")
+    
+    # Build the resident vector index used by /qa
+    async with AsyncSessionLocal() as session:
+        count = await rag_service.load_index(session)
+    logger.info(f"Vector index ready with {count} embeddings")
+    rag_service.start_index_sync()
+    
+    ingestion_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop ingestion workers and close pooled clients and connections"""
+    await ingestion_queue.stop()
+    await rag_service.aclose()
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
 
 # Pydantic models
 class DocumentIngestRequest(BaseModel):
     document_id: str
+    ingestion_id: Optional[uuid.UUID] = None  # Existing ingestion_status row to update, if any; malformed ids get a 422
 
 class DocumentIngestResponse(BaseModel):
     status: str
     message: str
+    job_id: Optional[str] = None
+    embeddings_count: Optional[int] = None
+
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    document_id: str
+    ingestion_id: str
+    status: str
+    chunks_total: int
+    chunks_embedded: int
     embeddings_count: Optional[int] = None
+    error: Optional[str] = None
+    batch_id: Optional[str] = None
+    created_at: Optional[str] = None  # Unknown when another worker process queued the job
+    started_at: Optional[str] = None
+    completed_at: Optional[str] = None
+
+class BatchIngestRequest(BaseModel):
+    document_ids: List[str]
+
+class BatchIngestResponse(BaseModel):
+    batch_id: str
+    status: str
+    total: int
+    completed: int
+    failed: int
+    jobs: List[IngestionJobResponse]
 
 class QARequest(BaseModel):
     question: str
     document_ids: Optional[List[str]] = None
 
+class QASource(BaseModel):
+    document_id: str
+    chunk_index: int
+    score: Optional[float] = None
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
+
 class QAResponse(BaseModel):
     question: str
     answer: str
     relevant_documents: List[str]
     confidence: float
+    sources: List[QASource] = []
+
+class BatchQARequest(BaseModel):
+    questions: List[str]
+    document_ids: Optional[List[str]] = None
+
+class BatchQAResult(QAResponse):
+    index: int  # Position of the question in the request
+
+class BatchQAError(BaseModel):
+    index: int
+    question: str
+    error: str
 
 class DocumentSelectionRequest(BaseModel):
     document_ids: List[str]
 
+class DocumentSummary(BaseModel):
+    id: str
+    title: str
+    status: str
+    created_at: Optional[str] = None
+
+class DocumentListResponse(BaseModel):
+    documents: List[DocumentSummary]
+    next_cursor: Optional[str] = None  # Pass as "after" for the next page; None on the last page
+
 @app.get("/")
 async def root():
     return {"message": "Document Management and RAG Q&A API"}
@@ -93,27 +193,22 @@ async def health_check():
             "error": str(e)
         }
 
-@app.post("/ingest", response_model=DocumentIngestResponse)
-async def ingest_document(
-    request: DocumentIngestRequest,
-    db: AsyncSession = Depends(get_db)
-):
+@app.post("/ingest", response_model=DocumentIngestResponse, status_code=202)
+async def ingest_document(request: DocumentIngestRequest):
     """
-    Ingest a document, generate embeddings, and store for retrieval.
+    Queue a document for ingestion and return the job id right away.
+    Progress is available from /ingest/jobs/{job_id}.
     """
     try:
-        logger.info(f"Starting ingestion for document: {request.document_id}")
-        
-        # Process document using RAG service
-        result = await rag_service.process_document(db, request.document_id)
-        
-        logger.info(f"Ingestion completed for document {request.document_id}: {result}")
+        job = await ingestion_queue.enqueue(request.document_id, request.ingestion_id)
         
         return DocumentIngestResponse(
-            status=result["status"],
-            message=result["message"],
-            embeddings_count=result.get("embeddings_count")
+            status="queued",
+            message=f"Document {request.document_id} queued for ingestion",
+            job_id=job.id
         )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error in ingest endpoint: {str(e)}")
         logger.error(f"Full error details: {type(e).__name__}: {str(e)}")
@@ -121,10 +216,68 @@ async def ingest_document(
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/ingest/batch", response_model=BatchIngestResponse, status_code=202)
+async def ingest_documents_batch(request: BatchIngestRequest):
+    """
+    Queue many documents for ingestion as one batch, e.g. for bulk imports.
+    Documents are fetched concurrently, embedded in shared batches and
+    committed in groups; per-document results are available from
+    /ingest/batches/{batch_id} and /ingest/jobs/{job_id}.
+    """
+    document_ids = list(dict.fromkeys(request.document_ids))
+    if not document_ids:
+        raise HTTPException(status_code=400, detail="No document ids given")
+    if len(document_ids) > settings.INGEST_BATCH_MAX_DOCUMENTS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.INGEST_BATCH_MAX_DOCUMENTS} documents per batch")
+    try:
+        jobs = await ingestion_queue.enqueue_batch(document_ids)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in batch ingest endpoint: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    return _batch_response(jobs[0].batch_id, jobs)
+
+@app.get("/ingest/batches/{batch_id}", response_model=BatchIngestResponse)
+async def get_ingestion_batch(batch_id: str):
+    """
+    Status of a batch ingestion and of each of its documents.
+    """
+    jobs = await ingestion_queue.get_batch(batch_id)
+    if jobs is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion batch {batch_id} not found")
+    return _batch_response(batch_id, jobs)
+
+def _batch_response(batch_id: str, jobs: list) -> BatchIngestResponse:
+    completed = sum(1 for job in jobs if job.status == "completed")
+    failed = sum(1 for job in jobs if job.status == "failed")
+    if completed + failed == len(jobs):
+        status = "completed"
+    else:
+        status = "running" if any(job.status != "queued" for job in jobs) else "queued"
+    return BatchIngestResponse(
+        batch_id=batch_id,
+        status=status,
+        total=len(jobs),
+        completed=completed,
+        failed=failed,
+        jobs=[IngestionJobResponse(**job.to_dict()) for job in jobs]
+    )
+
+@app.get("/ingest/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_ingestion_job(job_id: str):
+    """
+    Report the status and progress of an ingestion job.
+    """
+    job = await ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found")
+    return IngestionJobResponse(**job.to_dict())
+
 @app.post("/qa", response_model=QAResponse)
 async def ask_question(
     request: QARequest,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Ask a question and get RAG-based answer.
@@ -137,11 +290,79 @@ async def ask_question(
             question=request.question,
             answer=result["answer"],
             relevant_documents=result["relevant_documents"],
-            confidence=result["confidence"]
+            confidence=result["confidence"],
+            sources=result.get("sources", [])
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Size and hit/miss counters for the embedding caches.
+    """
+    return rag_service.cache_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Stage latency histograms, provider error and fallback counters, cache
+    and in-flight gauges, in the Prometheus text format.
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/qa/stream")
+async def ask_question_stream(
+    request: QARequest,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Ask a question and stream the answer as server-sent events.
+    A "retrieval" event with the relevant documents comes first, then "token"
+    events as the answer is generated, then a "done" event with the full
+    QAResponse payload. If generation fails, an "error" event with a
+    "message" is sent instead of "done".
+    """
+    async def event_stream():
+        async for event in rag_service.answer_question_stream(db, request.question, request.document_ids):
+            data = event["data"]
+            if event["event"] == "done":
+                data = QAResponse(question=request.question, **data).model_dump()
+            yield f"event: {event['event']}\ndata: {json.dumps(data)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/qa/batch")
+async def ask_questions_batch(
+    request: BatchQARequest,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Answer many questions against the same documents, e.g. for evaluation runs.
+    Results are streamed as newline-delimited JSON, one BatchQAResult per line,
+    in the order they finish; use "index" to match them to the questions.
+    A question that could not be answered gets a BatchQAError line instead.
+    """
+    if len(request.questions) > settings.BATCH_QA_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_QA_MAX_QUESTIONS} questions per batch")
+    
+    async def result_stream():
+        async for result in rag_service.answer_questions(db, request.questions, request.document_ids):
+            model = BatchQAError if "error" in result else BatchQAResult
+            yield json.dumps(model(**result).model_dump()) + "\n"
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/documents/select")
 async def select_documents(request: DocumentSelectionRequest):
     """
@@ -158,28 +379,59 @@ async def select_documents(request: DocumentSelectionRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/documents")
-async def list_documents(db: AsyncSession = Depends(get_db)):
+async def _document_page(db: AsyncSession, status: Optional[List[DocumentStatus]], after: Optional[uuid.UUID], limit: int) -> List[DocumentSummary]:
+    """One keyset page of document summaries ordered by id; content and file columns are never selected"""
+    stmt = select(Document.id, Document.title, Document.status, Document.created_at).order_by(Document.id).limit(limit)
+    if status:
+        stmt = stmt.where(Document.status.in_([s.value for s in status]))
+    if after is not None:
+        stmt = stmt.where(Document.id > after)
+    result = await db.execute(stmt)
+    return [
+        DocumentSummary(
+            id=str(row.id),
+            title=row.title,
+            status=DocumentStatus(row.status).value,
+            created_at=row.created_at.isoformat() if row.created_at else None
+        )
+        for row in result
+    ]
+
+@app.get("/documents", response_model=DocumentListResponse)
+async def list_documents(
+    status: Optional[List[DocumentStatus]] = Query(None, description="Only documents with one of these statuses"),
+    after: Optional[uuid.UUID] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(settings.DOCUMENTS_PAGE_SIZE, ge=1, le=settings.DOCUMENTS_MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Stream every matching document as one JSON response instead of a page"),
+    db: AsyncSession = Depends(get_read_db)
+):
     """
-    List all documents with their ingestion status.
+    List documents with their ingestion status, one page at a time.
+    With stream=true, every matching document after the cursor is written out
+    in the same {"documents": [...]} shape, fetched page by page as it is sent.
     """
-    try:
-        from sqlalchemy import select
-        stmt = select(Document)
-        result = await db.execute(stmt)
-        documents = result.scalars().all()
+    if stream:
+        async def export():
+            yield '{"documents": ['
+            cursor, first = after, True
+            while True:
+                page = await _document_page(db, status, cursor, settings.DOCUMENTS_EXPORT_BATCH_SIZE)
+                for document in page:
+                    yield ("" if first else ",") + document.model_dump_json()
+                    first = False
+                if len(page) < settings.DOCUMENTS_EXPORT_BATCH_SIZE:
+                    break
+                cursor = uuid.UUID(page[-1].id)
+            yield '], "next_cursor": null}'
         
-        return {
-            "documents": [
-                {
-                    "id": str(doc.id),
-                    "title": doc.title,
-                    "status": doc.status.value,
-                    "created_at": doc.created_at.isoformat()
-                }
-                for doc in documents
-            ]
-        }
+        return StreamingResponse(export(), media_type="application/json")
+    
+    try:
+        documents = await _document_page(db, status, after, limit)
+        return DocumentListResponse(
+            documents=documents,
+            next_cursor=documents[-1].id if len(documents) == limit else None
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -190,13 +442,18 @@ async def extract_text(file: UploadFile = File(...)):
         file_content = await file.read()
         mime_type = file.content_type or "application/octet-stream"
         
-        # Use the same extraction logic as in RAG service
-        extracted_text = rag_service.extract_text_from_file(file_content, mime_type)
+        # Use the same extraction logic as in RAG service, run in the extraction process pool
+        extracted_text = await rag_service.extract_text_from_file(file_content, mime_type)
         
         return {"extracted_text": extracted_text}
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ExtractionTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error in text extraction endpoint: {e}")
         return {"error": str(e)}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # Workers are separate processes, so the app is passed by import string
+    uvicorn.run("main:app", host=settings.API_HOST, port=settings.API_PORT, workers=settings.API_WORKERS)
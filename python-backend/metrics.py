@@ -0,0 +1,305 @@
+import json
+import time
+import asyncio
+import uuid
+import bisect
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from config import settings
+
+logger = logging.getLogger("metrics")
+trace_logger = logging.getLogger("trace")
+
+# Latency buckets in seconds, from sub-millisecond index lookups to multi-minute extractions
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class _Metric:
+    """Base of the metric families: a name, help text and one child per label combination"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, **labels: Any):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for key, child in list(self._children.items()):
+            yield from child.samples(self.name, dict(zip(self.labelnames, key)))
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if _enabled:
+            with self._lock:
+                self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        if _enabled:
+            self.value = value
+
+    def samples(self, name: str, labels: Dict[str, str]):
+        yield name, labels, self.value
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. errors or retries"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight or cache sizes"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        if _enabled:
+            position = bisect.bisect_left(self.buckets, value)
+            with self._lock:
+                self.counts[position] += 1
+                self.sum += value
+
+    def samples(self, name: str, labels: Dict[str, str]):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield f"{name}_bucket", {**labels, "le": _format_bound(bound)}, cumulative
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, cumulative
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. latencies, in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+
+class Registry:
+    """Metric families plus collectors that refresh derived values (cache stats, queue depth) on scrape"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def add_collector(self, collect: Callable[[], None]) -> None:
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+_enabled = settings.METRICS_ENABLED
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each ingestion and Q&A stage", ("stage",))
+REQUEST_SECONDS = Histogram("rag_request_seconds", "End-to-end time of ingestion and Q&A operations", ("operation", "status"))
+INGEST_QUEUE = Gauge("rag_ingest_queue_jobs", "Ingestion jobs by state", ("state",))
+IN_FLIGHT = Gauge("rag_in_flight", "Operations currently running", ("operation",))
+PROVIDER_ERRORS = Counter("rag_provider_errors_total", "Failed calls to the embedding and generation backends", ("provider", "kind"))
+PROVIDER_RETRIES = Counter("rag_provider_retries_total", "Retried calls to the embedding backend", ("provider",))
+FALLBACKS = Counter("rag_fallbacks_total", "Requests served in a degraded mode, e.g. lexical-only retrieval", ("kind",))
+CACHE_LOOKUPS = Counter("rag_cache_lookups_total", "Lookups per cache and result", ("cache", "result"))
+CACHE_HIT_RATIO = Gauge("rag_cache_hit_ratio", "Hit ratio per cache since startup", ("cache",))
+CACHE_ENTRIES = Gauge("rag_cache_entries", "Entries held per cache", ("cache",))
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """Record a stage timed by the caller; inside a trace its span ends now"""
+    STAGE_SECONDS.labels(stage=name).observe(seconds)
+    _record_span(name, time.perf_counter() - seconds, seconds)
+
+
+@contextmanager
+def _stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        _record_span(name, started, elapsed)
+
+
+def _record_span(name: str, started: float, elapsed: float) -> None:
+    # Code on executor threads only sees the trace when started with copy_context().run, see extraction.iterate_in_thread
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append({
+            "stage": name,
+            "start_ms": round((started - trace.started) * 1000, 3),
+            "duration_ms": round(elapsed * 1000, 3),
+        })
+
+
+def stage(name: str):
+    """Time a block into rag_stage_seconds and, inside a trace, record it as a span"""
+    return _stage(name) if _enabled else nullcontext()
+
+
+class _Trace:
+    def __init__(self, operation: str, attributes: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.operation = operation
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.status = "ok"  # Callers that report failures in their result set "error"
+
+
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar("rag_trace", default=None)
+
+
+@contextmanager
+def _traced(operation: str, attributes: Dict[str, Any]):
+    trace = _Trace(operation, attributes)
+    token = _current_trace.set(trace) if settings.TRACE_LOG_ENABLED else None
+    in_flight = IN_FLIGHT.labels(operation=operation)
+    in_flight.inc()
+    try:
+        yield trace
+    except (GeneratorExit, asyncio.CancelledError):
+        # The client went away, e.g. a closed stream
+        trace.status = "cancelled"
+        raise
+    except BaseException:
+        trace.status = "error"
+        raise
+    finally:
+        in_flight.dec()
+        status = trace.status
+        elapsed = time.perf_counter() - trace.started
+        REQUEST_SECONDS.labels(operation=operation, status=status).observe(elapsed)
+        if token is not None:
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                # An async generator finished in another context than it started in
+                _current_trace.set(None)
+            trace_logger.info(json.dumps({
+                "trace_id": trace.id,
+                "operation": operation,
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 3),
+                **trace.attributes,
+                "spans": trace.spans,
+            }))
+
+
+def trace(operation: str, **attributes: Any):
+    """Track an operation: in-flight gauge, rag_request_seconds and, with TRACE_LOG_ENABLED,
+    one JSON log line with the spans of every stage timed inside it"""
+    return _traced(operation, attributes) if _enabled else nullcontext(_Trace(operation, {}))
+
+
+class TimedIterator:
+    """Iterator wrapper accumulating the time spent producing items, for stages driven by a consumer"""
+
+    def __init__(self, iterable: Iterable):
+        self._iterator = iter(iterable)
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
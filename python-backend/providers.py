@@ -0,0 +1,244 @@
+import re
+import time
+import asyncio
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Optional
+import numpy as np
+from config import settings
+
+logger = logging.getLogger("providers")
+
+
+class LLMError(Exception):
+    """Raised when the generation backend fails or is misconfigured"""
+
+
+class LLMProvider(ABC):
+    """Interface for answer generation backends"""
+
+    name: str = "llm"
+
+    @abstractmethod
+    async def generate(self, prompt: str, max_output_tokens: int) -> str:
+        """Return the full completion; raises asyncio.TimeoutError or LLMError"""
+
+    @abstractmethod
+    def stream(self, prompt: str, max_output_tokens: int) -> AsyncIterator[str]:
+        """Yield completion text as it is generated"""
+
+    async def aclose(self) -> None:
+        pass
+
+
+class EmbeddingProvider(ABC):
+    """Interface for embedding backends"""
+
+    model: str = "embedding"
+
+    @abstractmethod
+    async def embed(self, texts: List[str], progress: Optional[Callable[[int], None]] = None) -> List[np.ndarray]:
+        """Embed texts, preserving input order"""
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        return (await self.embed([text]))[0]
+
+    async def aclose(self) -> None:
+        pass
+
+
+class GeminiProvider(LLMProvider):
+    """Gemini generation with the model created once and called asynchronously.
+
+    The SDK's native async API is used by default. With `native_async=False`
+    the blocking API runs on a dedicated, bounded thread pool instead of the
+    loop's default executor. Every call is bounded by `timeout` seconds.
+    """
+
+    name = "gemini"
+
+    def __init__(
+        self,
+        api_key: str = settings.GEMINI_API_KEY,
+        model_name: str = settings.LLM_MODEL,
+        timeout: float = settings.LLM_TIMEOUT,
+        executor_workers: int = settings.LLM_EXECUTOR_WORKERS,
+        native_async: bool = settings.LLM_NATIVE_ASYNC,
+    ):
+        import google.generativeai as genai
+
+        self._genai = genai
+        self.api_key = api_key
+        self.timeout = timeout
+        self.native_async = native_async
+        if api_key:
+            genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(model_name)
+        self._executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="gemini")
+
+    async def generate(self, prompt: str, max_output_tokens: int) -> str:
+        self._check_configured()
+        config = self._generation_config(max_output_tokens)
+        if self.native_async:
+            call = self._model.generate_content_async(prompt, generation_config=config)
+        else:
+            loop = asyncio.get_running_loop()
+            call = loop.run_in_executor(self._executor, lambda: self._model.generate_content(prompt, generation_config=config))
+        response = await asyncio.wait_for(call, timeout=self.timeout)
+        return response.text
+
+    async def stream(self, prompt: str, max_output_tokens: int) -> AsyncIterator[str]:
+        self._check_configured()
+        config = self._generation_config(max_output_tokens)
+        deadline = time.monotonic() + self.timeout
+        if self.native_async:
+            response = await asyncio.wait_for(
+                self._model.generate_content_async(prompt, generation_config=config, stream=True),
+                timeout=self.timeout
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    return
+                if chunk.text:
+                    yield chunk.text
+        else:
+            async for text in self._stream_in_executor(prompt, config, deadline):
+                yield text
+
+    async def aclose(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _check_configured(self) -> None:
+        if not self.api_key:
+            raise LLMError("Gemini API key not configured")
+
+    def _generation_config(self, max_output_tokens: int):
+        return self._genai.types.GenerationConfig(
+            max_output_tokens=max_output_tokens,  # Limit response length for speed
+            temperature=0.1  # Lower temperature for faster, more focused responses
+        )
+
+    async def _stream_in_executor(self, prompt: str, config, deadline: float) -> AsyncIterator[str]:
+        # The blocking SDK stream is drained on the dedicated executor and each
+        # piece is handed back to the event loop through a queue
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def produce():
+            try:
+                for chunk in self._model.generate_content(prompt, generation_config=config, stream=True):
+                    if chunk.text:
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        loop.run_in_executor(self._executor, produce)
+        while True:
+            item = await asyncio.wait_for(queue.get(), timeout=max(0.0, deadline - time.monotonic()))
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class FakeLLMProvider(LLMProvider):
+    """Deterministic offline generator for tests and benchmarks.
+
+    Answers echo the first sentence of the prompt's context after `latency`
+    seconds, streamed word by word with `token_delay` seconds between words.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = settings.FAKE_PROVIDER_LATENCY, token_delay: float = 0.0):
+        self.latency = latency
+        self.token_delay = token_delay
+
+    async def generate(self, prompt: str, max_output_tokens: int) -> str:
+        await asyncio.sleep(self.latency)
+        return " ".join(self._words(prompt, max_output_tokens))
+
+    async def stream(self, prompt: str, max_output_tokens: int) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency)
+        for i, word in enumerate(self._words(prompt, max_output_tokens)):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield word if i == 0 else f" {word}"
+
+    @staticmethod
+    def _words(prompt: str, max_output_tokens: int) -> List[str]:
+        context = prompt.split("Context:", 1)[-1]
+        sentence = re.split(r"(?<=[.!?])\s", context.strip(), maxsplit=1)[0]
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        return (f"[{digest}] {sentence}".split())[:max_output_tokens]
+
+
+class FakeEmbeddingProvider(EmbeddingProvider):
+    """Deterministic offline embeddings built by feature hashing of word tokens.
+
+    Each token maps to a fixed pseudo-random unit vector, and a text embeds to
+    the normalized sum of its tokens' vectors, so texts sharing words are
+    similar. That keeps retrieval quality measurable without Ollama.
+    """
+
+    def __init__(self, dim: int = settings.EMBEDDING_DIM, latency: float = settings.FAKE_PROVIDER_LATENCY, model: str = "fake-embed"):
+        self.dim = dim
+        self.latency = latency
+        self.model = model
+        self._token_vectors: Dict[str, np.ndarray] = {}
+
+    async def embed(self, texts: List[str], progress: Optional[Callable[[int], None]] = None) -> List[np.ndarray]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        vectors = [self.embed_sync(text) for text in texts]
+        if progress:
+            progress(len(texts))
+        return vectors
+
+    def embed_sync(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            vector += self._token_vector(token)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+            return vector
+        return vector / norm
+
+    def _token_vector(self, token: str) -> np.ndarray:
+        vector = self._token_vectors.get(token)
+        if vector is None:
+            seed = int.from_bytes(hashlib.sha256(token.encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            vector /= np.linalg.norm(vector)
+            if len(self._token_vectors) < 200000:
+                self._token_vectors[token] = vector
+        return vector
+
+
+def create_llm_provider(name: str = settings.LLM_PROVIDER) -> LLMProvider:
+    """Build the configured generation backend once at startup"""
+    if name == "gemini":
+        return GeminiProvider()
+    if name == "fake":
+        return FakeLLMProvider()
+    raise ValueError(f"Unknown LLM provider: {name}")
+
+
+def create_embedding_provider(name: str = settings.EMBEDDING_PROVIDER) -> EmbeddingProvider:
+    """Build the configured embedding backend once at startup"""
+    if name == "ollama":
+        from embedding_client import OllamaEmbeddingClient
+        return OllamaEmbeddingClient()
+    if name == "fake":
+        return FakeEmbeddingProvider()
+    raise ValueError(f"Unknown embedding provider: {name}")
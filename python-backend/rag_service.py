@@ -1,14 +1,28 @@
 import json
 import uuid
+import hashlib
+import asyncio
 import os
-from typing import List, Dict, Any
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable, AsyncIterator, Iterator
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from database import Document, Embedding, DocumentStatus
+from sqlalchemy import select, insert, update, delete, tuple_, text, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PostgresUUID
+from database import AsyncSessionLocal, Document, Embedding, DocumentStatus, engine, read_engine
+from vector_index import VectorIndex
+from index_snapshots import IndexSnapshots
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from embedding_client import EmbeddingError
+from providers import create_llm_provider, create_embedding_provider, LLMError
+from caching import AnswerCache, EmbeddingCache, LRUCache, normalize_question
+from extraction import ExtractionPool, iterate_in_thread
+from chunking import Chunk, Chunker
+from vector_codec import encode_vector, decode_vector
+import metrics
+from retrieval import RetrievedChunk, apply_threshold, mmr_select, pack_context, confidence_from, relevant_documents
 import numpy as np
 import httpx
 import ollama
-import google.generativeai as genai
 from config import settings
 import logging
 
@@ -20,6 +34,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger("rag_service")
 
+
+@dataclass
+class _IngestedChunks:
+    """Progress of a streaming ingestion. Each window's index entries are staged here as it is
+    stored, so neither chunk text nor embedding lists are kept until the document is done."""
+    vectors: VectorIndex = field(default_factory=VectorIndex)
+    terms: BM25Index = field(default_factory=BM25Index)
+    count: int = 0
+    reused: int = 0
+    embedded: int = 0
+    to_embed: int = 0
+
+
 class RAGService:
     def __init__(self):
         # Use environment variable for NestJS URL, fallback to localhost for development
@@ -27,80 +54,255 @@ class RAGService:
         # Configure Ollama client to use the configured base URL
         # Note: ollama client doesn't have set_host method, it uses environment variable
         logger.info(f"RAGService initialized with NestJS URL: {self.nestjs_url}")
+        # Pooled client for document fetches, shared by single and batch ingestion
+        self.nestjs_client = httpx.AsyncClient(
+            base_url=self.nestjs_url,
+            timeout=settings.NESTJS_TIMEOUT,
+            limits=httpx.Limits(max_connections=settings.NESTJS_MAX_CONNECTIONS, max_keepalive_connections=settings.NESTJS_MAX_CONNECTIONS),
+        )
+        
+        # Bounded cache for question embeddings, keyed by (model, normalized question)
+        self._question_embedding_cache = LRUCache(
+            settings.QUESTION_CACHE_SIZE,
+            ttl=settings.QUESTION_CACHE_TTL,
+            max_bytes=settings.QUESTION_CACHE_MAX_BYTES,
+        )
+        
+        # Resident indexes of chunk embeddings and chunk text, built at startup by load_index()
+        self.vector_index = VectorIndex()
+        self.lexical_index = BM25Index()
+        
+        # Snapshots of the vector index mapped read-only by every worker process, when VECTOR_INDEX_DIR is set
+        self.index_snapshots = IndexSnapshots(settings.VECTOR_INDEX_DIR) if settings.VECTOR_INDEX_DIR else None
+        self._index_generation: Optional[int] = None
+        self._pending_index_changes: Set[str] = set()  # Changes recorded by this worker and not yet in the mapped snapshot
+        self._index_sync_task: Optional[asyncio.Task] = None
+        
+        # Generation and embedding backends, created once and shared by all requests
+        self.llm = create_llm_provider()
+        self.embedding_client = create_embedding_provider()
+        
+        # Content-addressed cache shared by chunk and question embeddings
+        self.embedding_cache = EmbeddingCache()
+        
+        # Generated answers, scoped to the candidate documents and their ingest versions in the database
+        self.answer_cache = AnswerCache()
+        self._cache_lookups_seen: Dict[Tuple[str, str], int] = {}  # Cache stats already added to metrics.CACHE_LOOKUPS
+        
+        # Worker processes for CPU-bound text extraction, kept off the event loop
+        self.extraction_pool = ExtractionPool()
+        self.chunker = Chunker()
+    
+    async def aclose(self):
+        """Publish pending index changes, then release pooled connections and executor threads"""
+        if self._index_sync_task is not None:
+            self._index_sync_task.cancel()
+            await asyncio.gather(self._index_sync_task, return_exceptions=True)
+            self._index_sync_task = None
+            if self._pending_index_changes:
+                # Workers restarted before the next sync would otherwise map a snapshot without these changes
+                try:
+                    await self.sync_index()
+                except Exception as e:
+                    logger.error(f"Final vector index sync failed: {str(e)}")
+        await self.embedding_client.aclose()
+        await self.llm.aclose()
+        await self.nestjs_client.aclose()
+        self.extraction_pool.shutdown()
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Size and hit/miss counters of the embedding and answer caches"""
+        return {
+            "embedding_cache": self.embedding_cache.stats(),
+            "question_embedding_cache": self._question_embedding_cache.stats(),
+            "answer_cache": self.answer_cache.stats()
+        }
+    
+    def collect_metrics(self) -> None:
+        """Refresh the cache metrics of the registry; called on every /metrics scrape"""
+        caches = {
+            "embedding": self.embedding_cache.stats(),
+            "question_embedding": self._question_embedding_cache.stats(),
+            "answer": self.answer_cache.stats(),
+        }
+        for name, stats in caches.items():
+            memory = stats.get("memory", stats)
+            hits = stats.get("exact_hits", memory["hits"]) + stats.get("semantic_hits", 0) + stats.get("persistent_hits", 0)
+            misses = stats["misses"]
+            for result, count in (("hit", hits), ("miss", misses)):
+                seen = self._cache_lookups_seen.get((name, result), 0)
+                # Cache stats restart from zero when a cache is rebuilt; count those lookups from there
+                metrics.CACHE_LOOKUPS.labels(cache=name, result=result).inc(count - seen if count >= seen else count)
+                self._cache_lookups_seen[(name, result)] = count
+            metrics.CACHE_HIT_RATIO.labels(cache=name).set(stats["hit_ratio"])
+            metrics.CACHE_ENTRIES.labels(cache=name).set(memory["entries"])
+    
+    async def load_index(self, session: AsyncSession) -> int:
+        """Build the in-memory vector and lexical indexes from the embeddings table"""
+        if settings.LEXICAL_SEARCH_ENABLED:
+            await self.lexical_index.load(session)
+        if settings.VECTOR_SEARCH_BACKEND == "pgvector":
+            logger.info("Using pgvector search backend, skipping in-memory index build")
+            return 0
+        if self.index_snapshots is not None:
+            return await self._load_shared_index(session)
+        return await self.vector_index.load(session)
+    
+    async def _load_shared_index(self, session: AsyncSession) -> int:
+        """Map the current index snapshot; the first worker to start builds it from the embeddings table"""
+        async with self.index_snapshots.lock():
+            # Workers started together wait here and map the snapshot built by the first one.
+            # The generation is opened under the lock, before a publish can prune it.
+            manifest = self.index_snapshots.current() or await self._publish_index(session, None, self.index_snapshots.pending_changes())
+            index = self.index_snapshots.open(manifest)
+        await self._map_index(session, manifest, index)
+        # Fold in changes recorded but not published before the last shutdown
+        await self.sync_index()
+        return len(self.vector_index)
+    
+    def start_index_sync(self) -> None:
+        """Periodically publish recorded index changes and map snapshots published by other workers"""
+        if self.index_snapshots is None or settings.VECTOR_SEARCH_BACKEND == "pgvector" or self._index_sync_task is not None:
+            return
+        self._index_sync_task = asyncio.create_task(self._index_sync_loop())
+    
+    async def _index_sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.VECTOR_INDEX_SYNC_INTERVAL)
+            try:
+                await self.sync_index()
+            except Exception as e:
+                logger.error(f"Vector index sync failed: {str(e)}")
+    
+    def _record_index_change(self, document_ids: List[str]) -> None:
+        """Record committed documents for the next snapshot; until then the local changes sit in the index delta"""
+        if self.index_snapshots is not None:
+            self._pending_index_changes.add(self.index_snapshots.record_change(document_ids))
+    
+    async def sync_index(self) -> None:
+        """Publish the changes recorded by any worker as a new snapshot, then map the newest snapshot.
+        
+        A worker with changes recorded after the publish keeps its private index until the next sync.
+        """
+        recorded = set(self._pending_index_changes)
+        index = None
+        async with self.index_snapshots.lock():
+            # Every change recorded before the lock was taken is either pending here or already published
+            changes = self.index_snapshots.pending_changes()
+            manifest = self.index_snapshots.current()
+            if changes or manifest is None:
+                async with AsyncSessionLocal() as session:
+                    manifest = await self._publish_index(session, manifest, changes)
+            self._pending_index_changes -= recorded
+            if manifest["generation"] != self._index_generation and not self._pending_index_changes:
+                # Open while holding the lock: a later publish prunes old generations
+                index = self.index_snapshots.open(manifest)
+        if index is not None:
+            async with AsyncSessionLocal() as session:
+                await self._map_index(session, manifest, index)
+    
+    async def _publish_index(self, session: AsyncSession, manifest: Optional[Dict[str, Any]], changes: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Publish the next snapshot: the current one with the changed documents re-read from the
+        embeddings table, or a full build when there is none; requires the snapshot lock"""
+        if manifest is None:
+            index = VectorIndex()
+            await index.load(session)
+            return await asyncio.to_thread(self.index_snapshots.publish, index, changes=changes)
+        changed = sorted({uuid.UUID(doc_id) for doc_ids in changes.values() for doc_id in doc_ids})
+        added = VectorIndex()
+        for start in range(0, len(changed), 1000):
+            await added.load(session, document_ids=changed[start:start + 1000])
+        base = self.index_snapshots.open(manifest)
+        return await asyncio.to_thread(self.index_snapshots.publish, base, exclude=changed, extra=added, changes=changes)
+    
+    async def _map_index(self, session: AsyncSession, manifest: Dict[str, Any], index: VectorIndex) -> None:
+        """Serve a snapshot opened under the lock and reload the BM25 entries of documents other workers changed since the previous one"""
+        previous = self._index_generation
+        self.vector_index = index
+        self._index_generation = manifest["generation"]
+        logger.info(f"Mapped vector index generation {manifest['generation']} with {len(self.vector_index)} embeddings")
+        if previous is None:
+            return
+        changed = IndexSnapshots.changed_since(manifest, previous)
+        if changed is None:
+            # The manifest history does not reach back to the previous generation
+            logger.warning(f"Vector index moved from generation {previous} to {manifest['generation']}, reloading the lexical index")
+            if settings.LEXICAL_SEARCH_ENABLED:
+                lexical_index = BM25Index()
+                await lexical_index.load(session)
+                self.lexical_index = lexical_index
+            return
+        if settings.LEXICAL_SEARCH_ENABLED:
+            await self.lexical_index.reload_documents(session, changed)
         
-        # Cache for question embeddings to avoid regenerating
-        self._question_embedding_cache = {}
+    async def process_document(self, session: AsyncSession, document_id: str, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Process a document and generate embeddings using Ollama.
         
-    async def process_document(self, session: AsyncSession, document_id: str) -> Dict[str, Any]:
-        """Process a document and generate embeddings using Ollama"""
+        Text is extracted, chunked, embedded and inserted incrementally, one window of chunks
+        at a time. Only chunks whose content hash is new are embedded; vectors of unchanged
+        chunks are reused and the document's previous rows are replaced in one transaction.
+        `progress` is called with (chunks embedded, chunks to embed so far) as batches complete.
+        """
+        with metrics.trace("ingest", document_id=str(document_id)) as span:
+            result = await self._process_document(session, document_id, progress)
+            if result["status"] != "success":
+                span.status = "error"
+            return result
+    
+    async def _process_document(self, session: AsyncSession, document_id: str, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Untraced body of process_document"""
         logger.info(f"Processing document: {document_id}")
         try:
-            # Get document from NestJS backend
-            async with httpx.AsyncClient() as client:
-                # Use the internal endpoint that doesn't require authentication
-                response = await client.get(f"{self.nestjs_url}/api/internal/documents/{document_id}/content")
-                if response.status_code != 200:
-                    raise ValueError(f"Document not found in NestJS backend: {response.status_code}")
-                
-                document_data = response.json()
-                document_content = document_data.get('content', '')
-                document_title = document_data.get('title', '')
-                file_content = document_data.get('fileContent')
-                mime_type = document_data.get('mimeType', '')
+            document_data = await self._fetch_document(document_id)
+            make_segments, paged = self._document_source(document_id, document_data)
+            # Drop the decoded response early, so its copy of the file content can be freed
+            document_data = None
             
-            logger.info(f"Retrieved document: {document_title}, content length: {len(document_content)}")
+            # Pages are parsed in the extraction pool and chunked on a worker thread at most a bounded
+            # window ahead of embedding, so early pages are embedded while later ones are still parsed
+            await self._lock_documents(session, [document_id])
+            previous_ids, reusable = await self._load_previous_rows(session, document_id)
+            ingested = _IngestedChunks()
+            batch: List[Chunk] = []
+            window = max(1, settings.EMBEDDING_BATCH_SIZE * settings.EMBEDDING_CONCURRENCY)
+            chunk_stream = iterate_in_thread(
+                lambda: self._iter_chunks(make_segments, paged), max_pending=settings.EXTRACTION_PREFETCH_CHUNKS
+            )
+            async for chunk in chunk_stream:
+                batch.append(chunk)
+                if len(batch) >= window:
+                    await self._store_chunk_batch(session, document_id, batch, reusable, ingested, progress)
+                    batch = []
+            if batch:
+                await self._store_chunk_batch(session, document_id, batch, reusable, ingested, progress)
             
-            # If content is empty or placeholder, try to extract from file content
-            if not document_content or document_content.startswith('Content extracted from'):
-                if file_content:
-                    logger.info(f"Extracting content from BLOB for document {document_id}")
-                    # Handle file_content which might be a Buffer or serialized data
-                    if isinstance(file_content, str):
-                        # If it's a string, it might be base64 encoded
-                        import base64
-                        try:
-                            file_content = base64.b64decode(file_content)
-                        except:
-                            # If not base64, treat as regular string
-                            file_content = file_content.encode('utf-8')
-                    elif isinstance(file_content, list):
-                        # If it's a list, it might be a Buffer array
-                        file_content = bytes(file_content)
-                    
-                    document_content = self._extract_content_from_blob(file_content, mime_type)
-                    logger.info(f"Extracted content length: {len(document_content)}")
-                else:
-                    raise ValueError("Document has no content and no file content available")
-            
-            if not document_content:
+            if not ingested.count:
                 raise ValueError("Document has no content")
             
-            # Generate embeddings using Ollama
-            chunks = self._split_into_chunks(document_content)
-            logger.info(f"Split document into {len(chunks)} chunks")
-            embeddings = await self._generate_embeddings(chunks)
+            # Drop the previous rows in the same transaction, so readers switch to the new chunks atomically
+            await self._delete_rows(session, previous_ids)
+            await self._bump_ingest_versions(session, [document_id])
+            with metrics.stage("db_write"):
+                await session.commit()
+            logger.info(f"Split document into {ingested.count} chunks, reused {ingested.reused} unchanged chunks")
             
-            # Store embeddings and chunk content in database
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                embedding_record = Embedding(
-                    id=str(uuid.uuid4()),
-                    document_id=document_id,
-                    chunk_index=i,
-                    embedding=json.dumps(embedding.tolist()),
-                    chunk_content=chunk  # Store the actual chunk content
-                )
-                session.add(embedding_record)
-            
-            await session.commit()
-            logger.info(f"Successfully stored {len(embeddings)} embeddings for document {document_id}")
+            if settings.VECTOR_SEARCH_BACKEND != "pgvector":
+                self.vector_index.remove_document(document_id)
+                self.vector_index.add_index(ingested.vectors)
+                self._record_index_change([document_id])
+            if settings.LEXICAL_SEARCH_ENABLED:
+                self.lexical_index.take_document(ingested.terms, document_id)
+            logger.info(f"Successfully stored {ingested.count} embeddings for document {document_id}")
             
             return {
                 "status": "success",
                 "message": f"Document {document_id} processed successfully",
-                "embeddings_count": len(embeddings)
+                "embeddings_count": ingested.count,
+                "embeddings_reused": ingested.reused
             }
             
         except Exception as e:
+            await session.rollback()
             logger.error(f"Error processing document {document_id}: {str(e)}")
             logger.error(f"Full error details: {type(e).__name__}: {str(e)}")
             import traceback
@@ -110,200 +312,360 @@ class RAGService:
                 "message": str(e)
             }
     
-    async def _generate_embeddings(self, chunks: List[str]) -> List[np.ndarray]:
-        """Generate embeddings for document chunks using Ollama"""
-        logger.info(f"Generating embeddings for {len(chunks)} chunks")
-        embeddings = []
+    async def process_documents(
+        self,
+        session: AsyncSession,
+        document_ids: List[str],
+        group_size: int = settings.INGEST_BATCH_GROUP_SIZE,
+    ) -> AsyncIterator[Dict[str, Dict[str, Any]]]:
+        """Ingest many documents, yielding {document_id: result} for each group as it is committed.
         
-        # Process chunks in parallel for faster embedding generation
-        import asyncio
-        import httpx
+        Documents are fetched from NestJS and chunked concurrently, and the next group is
+        prepared while the current one is embedded. Chunks of all documents in a group share
+        embedding batches, and a group is written in one transaction with a savepoint per
+        document, so a failing document does not fail the others. Results have the same
+        shape as process_document's.
+        """
+        groups = [document_ids[i:i + max(1, group_size)] for i in range(0, len(document_ids), max(1, group_size))]
+        limit = asyncio.Semaphore(max(1, settings.INGEST_BATCH_FETCH_CONCURRENCY))
         
-        async def generate_embedding(chunk: str) -> np.ndarray:
-            try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    response = await client.post(
-                        f"{settings.OLLAMA_BASE_URL}/api/embeddings",
-                        json={
-                            "model": settings.EMBEDDING_MODEL,
-                            "prompt": chunk
-                        }
-                    )
-                    if response.status_code == 200:
-                        result = response.json()
-                        return np.array(result['embedding'])
-                    else:
-                        logger.error(f"Embedding request failed: {response.status_code}")
-                        return np.zeros(384)
-            except Exception as e:
-                logger.error(f"Error generating embedding: {str(e)}")
-                return np.zeros(384)
-        
-        # Generate embeddings concurrently
-        tasks = [generate_embedding(chunk) for chunk in chunks]
-        embeddings = await asyncio.gather(*tasks)
+        async def prepare(group: List[str]) -> Dict[str, Any]:
+            chunked = await asyncio.gather(*(self._chunk_document(document_id, limit) for document_id in group), return_exceptions=True)
+            return dict(zip(group, chunked))
         
-        logger.info(f"Successfully generated {len(embeddings)} embeddings")
-        return embeddings
+        upcoming = asyncio.create_task(prepare(groups[0])) if groups else None
+        try:
+            for position in range(len(groups)):
+                prepared = await upcoming
+                upcoming = asyncio.create_task(prepare(groups[position + 1])) if position + 1 < len(groups) else None
+                with metrics.trace("ingest_group", documents=len(prepared)):
+                    results = await self._store_document_group(session, prepared)
+                yield results
+        finally:
+            if upcoming is not None:
+                upcoming.cancel()
     
-    def _split_into_chunks(self, text: str, chunk_size: int = 1000) -> List[str]:
-        """Split text into chunks with overlap"""
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        current_size = 0
-        
-        for word in words:
-            if current_size + len(word) + 1 > chunk_size and current_chunk:
-                chunks.append(' '.join(current_chunk))
-                # Start new chunk with overlap
-                overlap_words = current_chunk[-settings.CHUNK_OVERLAP//10:]  # Approximate overlap
-                current_chunk = overlap_words + [word]
-                current_size = sum(len(w) for w in current_chunk) + len(current_chunk) - 1
-            else:
-                current_chunk.append(word)
-                current_size += len(word) + 1
+    async def _fetch_document(self, document_id: str) -> Dict[str, Any]:
+        """Document metadata, text and file content from the NestJS backend"""
+        # Use the internal endpoint that doesn't require authentication
+        with metrics.stage("fetch"):
+            response = await self.nestjs_client.get(f"/api/internal/documents/{document_id}/content")
+            if response.status_code != 200:
+                raise ValueError(f"Document not found in NestJS backend: {response.status_code}")
+            document_data = response.json()
+        logger.info(f"Retrieved document: {document_data.get('title', '')}, content length: {len(document_data.get('content') or '')}")
+        return document_data
+    
+    def _document_source(self, document_id: str, document_data: Dict[str, Any]) -> Tuple[Callable[[], Iterator[str]], bool]:
+        """Segment source for chunking, and whether its segments are pages"""
+        document_content = document_data.get('content', '')
+        file_content = document_data.get('fileContent')
+        mime_type = document_data.get('mimeType', '')
         
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
+        # If content is empty or placeholder, extract it from the file content page by page
+        if document_content and not document_content.startswith('Content extracted from'):
+            return lambda: iter([document_content]), False
+        if not file_content:
+            raise ValueError("Document has no content and no file content available")
         
-        return chunks
+        logger.info(f"Extracting content from BLOB for document {document_id}")
+        # Handle file_content which might be a Buffer or serialized data
+        if isinstance(file_content, str):
+            # If it's a string, it might be base64 encoded
+            import base64
+            try:
+                file_content = base64.b64decode(file_content)
+            except:
+                # If not base64, treat as regular string
+                file_content = file_content.encode('utf-8')
+        elif isinstance(file_content, list):
+            # If it's a list, it might be a Buffer array
+            file_content = bytes(file_content)
+        
+        blob = file_content
+        return lambda: self.extraction_pool.iter_segments(blob, mime_type), mime_type == 'application/pdf'
     
-    def extract_text_from_file(self, file_content: bytes, mime_type: str) -> str:
-        """Extract text content from file - public method for API endpoint"""
-        return self._extract_content_from_blob(file_content, mime_type)
+    def _iter_chunks(self, make_segments: Callable[[], Iterator[str]], paged: bool) -> Iterator[Chunk]:
+        """Chunk a segment source, timing extraction and chunking as separate stages"""
+        segments = metrics.TimedIterator(make_segments())
+        chunks = metrics.TimedIterator(self.chunker.iter_chunks(segments, paged=paged))
+        yield from chunks
+        metrics.observe_stage("extract", segments.elapsed)
+        metrics.observe_stage("chunk", chunks.elapsed - segments.elapsed)
     
-    def _extract_content_from_blob(self, file_content: bytes, mime_type: str) -> str:
-        """Extract text content from file BLOB based on MIME type"""
+    async def _chunk_document(self, document_id: str, limit: asyncio.Semaphore) -> List[Chunk]:
+        """Fetch and chunk a whole document, with at most `limit` documents in progress"""
+        async with limit:
+            make_segments, paged = self._document_source(document_id, await self._fetch_document(document_id))
+            chunks = [
+                chunk async for chunk in iterate_in_thread(
+                    lambda: self._iter_chunks(make_segments, paged), max_pending=settings.EXTRACTION_PREFETCH_CHUNKS
+                )
+            ]
+        if not chunks:
+            raise ValueError("Document has no content")
+        return chunks
+    
+    async def _store_document_group(self, session: AsyncSession, prepared: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Embed and store a group of chunked documents in one transaction; failures are reported per document"""
+        results: Dict[str, Dict[str, Any]] = {}
+        ready: Dict[str, List[Chunk]] = {}
+        for document_id, chunks in prepared.items():
+            if isinstance(chunks, BaseException):
+                logger.error(f"Error processing document {document_id}: {str(chunks)}")
+                results[document_id] = {"status": "error", "message": str(chunks)}
+            else:
+                ready[document_id] = chunks
+        if not ready:
+            return results
+        
         try:
-            if mime_type == 'text/plain':
-                return file_content.decode('utf-8', errors='ignore')
+            await self._lock_documents(session, list(ready))
+            previous = await self._load_previous_rows_many(session, list(ready))
+            # Unchanged chunks reuse their stored vectors, whichever document of the group they came from
+            hashes = {document_id: [self._chunk_hash(chunk.text) for chunk in chunks] for document_id, chunks in ready.items()}
+            reusable = {h: row_id for _, by_hash in previous.values() for h, row_id in by_hash.items()}
+            wanted = {h for doc_hashes in hashes.values() for h in doc_hashes}
+            vectors_by_hash = await self._load_vectors(session, {h: reusable[h] for h in wanted if h in reusable})
+            reused = set(vectors_by_hash)
             
-            elif mime_type == 'application/pdf':
-                # Extract text from PDF files using PyPDF2
-                try:
-                    import PyPDF2
-                    from io import BytesIO
-                    
-                    pdf_file = BytesIO(file_content)
-                    pdf_reader = PyPDF2.PdfReader(pdf_file)
-                    
-                    text_content = []
-                    for page_num in range(len(pdf_reader.pages)):
-                        page = pdf_reader.pages[page_num]
-                        text_content.append(page.extract_text())
-                    
-                    extracted_text = '\n'.join(text_content)
-                    if extracted_text.strip():
-                        return extracted_text
-                    else:
-                        return f"PDF content (size: {len(file_content)} bytes) - No text could be extracted (may be scanned/image-based PDF)"
-                except ImportError:
-                    return f"PDF content (size: {len(file_content)} bytes) - PyPDF2 library not available"
-                except Exception as e:
-                    return f"PDF content (size: {len(file_content)} bytes) - Error extracting text: {str(e)}"
+            texts_by_hash = {}
+            for document_id, chunks in ready.items():
+                for content_hash, chunk in zip(hashes[document_id], chunks):
+                    if content_hash not in vectors_by_hash:
+                        texts_by_hash.setdefault(content_hash, chunk.text)
+            # One embedding call for the whole group, so batches are full even for small documents
+            pending = list(texts_by_hash)
+            vectors_by_hash.update(zip(pending, await self._generate_embeddings([texts_by_hash[h] for h in pending])))
             
-            elif mime_type in ['application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
-                # Extract text from Word documents using python-docx
+            stored: Dict[str, List[Dict[str, Any]]] = {}
+            for document_id, chunks in ready.items():
+                rows = self._embedding_rows(document_id, chunks, hashes[document_id], vectors_by_hash)
                 try:
-                    from docx import Document
-                    from io import BytesIO
-                    
-                    doc_file = BytesIO(file_content)
-                    doc = Document(doc_file)
-                    
-                    text_content = []
-                    for paragraph in doc.paragraphs:
-                        if paragraph.text.strip():
-                            text_content.append(paragraph.text)
-                    
-                    # Also extract text from tables
-                    for table in doc.tables:
-                        for row in table.rows:
-                            for cell in row.cells:
-                                if cell.text.strip():
-                                    text_content.append(cell.text)
-                    
-                    extracted_text = '\n'.join(text_content)
-                    if extracted_text.strip():
-                        return extracted_text
-                    else:
-                        return f"Word document content (size: {len(file_content)} bytes) - No text could be extracted"
-                except ImportError:
-                    return f"Word document content (size: {len(file_content)} bytes) - python-docx library not available"
+                    async with session.begin_nested():
+                        await self._insert_rows(session, rows)
+                        await self._delete_rows(session, previous.get(document_id, ([], {}))[0])
+                    stored[document_id] = rows
                 except Exception as e:
-                    return f"Word document content (size: {len(file_content)} bytes) - Error extracting text: {str(e)}"
-            
-            elif mime_type == 'text/html':
-                # For HTML files, extract text content using BeautifulSoup
-                try:
-                    from bs4 import BeautifulSoup
-                    soup = BeautifulSoup(file_content.decode('utf-8', errors='ignore'), 'html.parser')
-                    # Remove script and style elements
-                    for script in soup(["script", "style"]):
-                        script.decompose()
-                    # Get text and clean up whitespace
-                    text = soup.get_text()
-                    lines = (line.strip() for line in text.splitlines())
-                    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                    text = ' '.join(chunk for chunk in chunks if chunk)
-                    return text
-                except ImportError:
-                    # Fallback to regex if BeautifulSoup is not available
-                    import re
-                    text = re.sub(r'<[^>]+>', '', file_content.decode('utf-8', errors='ignore'))
-                    text = re.sub(r'\s+', ' ', text).strip()
-                    return text
-            
-            elif mime_type == 'application/json':
-                # For JSON files, extract text content
-                import json
-                try:
-                    data = json.loads(file_content.decode('utf-8'))
-                    return json.dumps(data, indent=2)
-                except:
-                    return file_content.decode('utf-8', errors='ignore')
-            
-            elif mime_type == 'text/xml':
-                # For XML files, extract text content
-                try:
-                    from bs4 import BeautifulSoup
-                    soup = BeautifulSoup(file_content.decode('utf-8', errors='ignore'), 'xml')
-                    return soup.get_text()
-                except ImportError:
-                    # Fallback to regex
-                    import re
-                    text = re.sub(r'<[^>]+>', '', file_content.decode('utf-8', errors='ignore'))
-                    text = re.sub(r'\s+', ' ', text).strip()
-                    return text
-            
-            else:
-                # For unknown file types, try to decode as text
-                try:
-                    return file_content.decode('utf-8', errors='ignore')
-                except:
-                    return f"Binary file content (size: {len(file_content)} bytes, type: {mime_type}) - Text extraction not available"
-        
+                    logger.error(f"Error storing document {document_id}: {str(e)}")
+                    results[document_id] = {"status": "error", "message": str(e)}
+            await self._bump_ingest_versions(session, list(stored))
+            with metrics.stage("db_write"):
+                await session.commit()
         except Exception as e:
-            logger.error(f"Error extracting content from BLOB: {str(e)}")
-            return f"Error extracting content: {str(e)}"
+            await session.rollback()
+            logger.error(f"Error storing document group: {str(e)}", exc_info=True)
+            for document_id in ready:
+                results.setdefault(document_id, {"status": "error", "message": str(e)})
+            return results
+        
+        for document_id, rows in stored.items():
+            vectors = [vectors_by_hash[row["content_hash"]] for row in rows]
+            if settings.VECTOR_SEARCH_BACKEND != "pgvector":
+                self.vector_index.remove_document(document_id)
+                self.vector_index.add_document(document_id, list(range(len(vectors))), vectors)
+            if settings.LEXICAL_SEARCH_ENABLED:
+                self.lexical_index.add_document(document_id, ((row["chunk_index"], row["chunk_content"]) for row in rows))
+            old_hashes = previous.get(document_id, ([], {}))[1]
+            results[document_id] = {
+                "status": "success",
+                "message": f"Document {document_id} processed successfully",
+                "embeddings_count": len(rows),
+                "embeddings_reused": sum(1 for row in rows if row["content_hash"] in old_hashes and row["content_hash"] in reused)
+            }
+        if stored and settings.VECTOR_SEARCH_BACKEND != "pgvector":
+            self._record_index_change(list(stored))
+        logger.info(f"Stored group of {len(ready)} documents: {len(stored)} succeeded, {len(texts_by_hash)} chunks embedded")
+        return results
+    
+    def _chunk_hash(self, chunk: str) -> str:
+        """Content hash of a chunk, scoped to the embedding model so a model change never reuses stale vectors"""
+        return hashlib.sha256(f"{self.embedding_client.model}\0{chunk}".encode("utf-8")).hexdigest()
+    
+    async def _lock_documents(self, session: AsyncSession, document_ids: List[str]) -> None:
+        """Hold a transaction-scoped advisory lock per document until commit or rollback.
+        
+        Overlapping ingestions of a document (queue workers, /ingest/batch) would otherwise
+        both read the same previous rows and both keep their new ones. Locks are taken in
+        sorted order, so groups sharing documents cannot deadlock.
+        """
+        for document_id in sorted({str(document_id) for document_id in document_ids}):
+            await session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:document_id))"), {"document_id": document_id})
+    
+    async def _bump_ingest_versions(self, session: AsyncSession, document_ids: List[str]) -> None:
+        """Increment the documents' ingest versions in the ingestion's transaction, so no worker
+        serves answers cached for their previous chunks"""
+        if document_ids:
+            await session.execute(
+                update(Document)
+                .where(Document.id.in_([uuid.UUID(str(document_id)) for document_id in document_ids]))
+                .values(ingest_version=Document.ingest_version + 1)
+            )
+    
+    async def _load_previous_rows(self, session: AsyncSession, document_id: str) -> Tuple[List[uuid.UUID], Dict[str, uuid.UUID]]:
+        """Ids of the document's current rows, and content hash -> row id for reusing their vectors"""
+        return (await self._load_previous_rows_many(session, [document_id])).get(document_id, ([], {}))
+    
+    async def _load_previous_rows_many(self, session: AsyncSession, document_ids: List[str]) -> Dict[str, Tuple[List[uuid.UUID], Dict[str, uuid.UUID]]]:
+        """_load_previous_rows for several documents in one query, keyed by the given ids"""
+        keys = {uuid.UUID(str(document_id)): document_id for document_id in document_ids}
+        stmt = select(Embedding.id, Embedding.document_id, Embedding.content_hash, Embedding.chunk_content).where(
+            Embedding.document_id.in_(list(keys))
+        )
+        result = await session.execute(stmt)
+        previous: Dict[str, Tuple[List[uuid.UUID], Dict[str, uuid.UUID]]] = {}
+        for row_id, row_document_id, content_hash, chunk_content in result:
+            ids, by_hash = previous.setdefault(keys.get(row_document_id, str(row_document_id)), ([], {}))
+            ids.append(row_id)
+            # Rows stored before content hashes existed are hashed from their chunk text
+            if content_hash is None and chunk_content is not None:
+                content_hash = self._chunk_hash(chunk_content)
+            if content_hash is not None:
+                by_hash.setdefault(content_hash, row_id)
+        return previous
+    
+    async def _load_vectors(self, session: AsyncSession, ids_by_hash: Dict[str, uuid.UUID]) -> Dict[str, np.ndarray]:
+        """Map content hash -> stored vector for the given previous rows.
+        
+        Zero vectors and vectors of another dimension are left out, so their chunks are
+        embedded again: older versions stored zero placeholders when embedding failed.
+        """
+        if not ids_by_hash:
+            return {}
+        hash_by_id = {row_id: content_hash for content_hash, row_id in ids_by_hash.items()}
+        stmt = select(Embedding.id, Embedding.embedding_bytes, Embedding.embedding).where(Embedding.id.in_(list(hash_by_id)))
+        result = await session.execute(stmt)
+        vectors = {}
+        skipped = 0
+        for row_id, blob, embedding in result:
+            vector = decode_vector(blob) if blob is not None else np.array(json.loads(embedding), dtype=np.float32)
+            if len(vector) != settings.EMBEDDING_DIM or not np.any(vector):
+                skipped += 1
+                continue
+            vectors[hash_by_id[row_id]] = vector
+        if skipped:
+            logger.warning(f"Re-embedding {skipped} chunks whose stored vectors are zero or not {settings.EMBEDDING_DIM}-dimensional")
+        return vectors
+    
+    async def _store_chunk_batch(
+        self,
+        session: AsyncSession,
+        document_id: str,
+        chunks: List[Chunk],
+        reusable: Dict[str, uuid.UUID],
+        ingested: "_IngestedChunks",
+        progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        """Embed one window of chunks, reusing vectors of unchanged chunks, insert their rows and
+        stage their index entries, which are applied once the document is committed"""
+        hashes = [self._chunk_hash(chunk.text) for chunk in chunks]
+        reused = await self._load_vectors(session, {h: reusable[h] for h in set(hashes) if h in reusable})
+        texts_by_hash = {content_hash: chunk.text for content_hash, chunk in zip(hashes, chunks)}
+        pending = [h for h in texts_by_hash if h not in reused]
+        
+        # Generate embeddings for new or changed chunks only
+        embedded_before = ingested.embedded
+        ingested.to_embed += len(pending)
+        if progress:
+            progress(embedded_before, ingested.to_embed)
+        new_vectors = await self._generate_embeddings(
+            [texts_by_hash[h] for h in pending],
+            progress=(lambda done: progress(embedded_before + done, ingested.to_embed)) if progress else None
+        )
+        ingested.embedded += len(pending)
+        vectors_by_hash = {**reused, **dict(zip(pending, new_vectors))}
+        
+        # Store embeddings and chunk content in database
+        chunk_indices = list(range(ingested.count, ingested.count + len(chunks)))
+        rows = self._embedding_rows(document_id, chunks, hashes, vectors_by_hash, start=ingested.count)
+        await self._insert_rows(session, rows)
+        if settings.VECTOR_SEARCH_BACKEND != "pgvector":
+            ingested.vectors.add_document(document_id, chunk_indices, [vectors_by_hash[content_hash] for content_hash in hashes])
+        if settings.LEXICAL_SEARCH_ENABLED:
+            ingested.terms.add_chunks(document_id, zip(chunk_indices, (chunk.text for chunk in chunks)))
+        ingested.count += len(chunks)
+        ingested.reused += sum(1 for h in hashes if h in reused)
+    
+    @staticmethod
+    def _embedding_rows(document_id: str, chunks: List[Chunk], hashes: List[str], vectors_by_hash: Dict[str, np.ndarray], start: int = 0) -> List[Dict[str, Any]]:
+        """Embeddings table rows for consecutive chunks of a document, numbered from `start`"""
+        rows = []
+        for offset, (chunk, content_hash) in enumerate(zip(chunks, hashes)):
+            embedding = vectors_by_hash[content_hash]
+            rows.append({
+                "id": uuid.uuid4(),
+                "document_id": document_id,
+                "chunk_index": start + offset,
+                "embedding_bytes": encode_vector(embedding),
+                "embedding_vector": embedding if len(embedding) == settings.EMBEDDING_DIM else None,
+                "chunk_content": chunk.text,  # Store the actual chunk content
+                "content_hash": content_hash,
+                "char_start": chunk.char_start,
+                "char_end": chunk.char_end,
+                "page_start": chunk.page_start,
+                "page_end": chunk.page_end,
+                "token_count": chunk.token_count
+            })
+        return rows
+    
+    async def _insert_rows(self, session: AsyncSession, rows: List[Dict[str, Any]], batch_size: int = settings.EMBEDDING_INSERT_BATCH_SIZE):
+        """Insert embedding rows with bulk executemany statements"""
+        with metrics.stage("db_write"):
+            for start in range(0, len(rows), batch_size):
+                await session.execute(insert(Embedding), rows[start:start + batch_size])
+    
+    async def _delete_rows(self, session: AsyncSession, ids: List[uuid.UUID], batch_size: int = settings.EMBEDDING_INSERT_BATCH_SIZE):
+        with metrics.stage("db_write"):
+            for start in range(0, len(ids), batch_size):
+                await session.execute(delete(Embedding).where(Embedding.id.in_(ids[start:start + batch_size])))
+    
+    async def _generate_embeddings(self, chunks: List[str], progress: Optional[Callable[[int], None]] = None) -> List[np.ndarray]:
+        """Generate embeddings for document chunks using Ollama"""
+        logger.debug(f"Generating embeddings for {len(chunks)} chunks")
+        
+        # Identical chunk text (boilerplate, templates) is only embedded once per model
+        model = self.embedding_client.model
+        cached = await self.embedding_cache.get_many(model, chunks)
+        missing = [i for i in range(len(chunks)) if i not in cached]
+        logger.debug(f"Embedding cache hits: {len(cached)}, misses: {len(missing)}")
+        
+        # Batched and concurrency-limited; raises EmbeddingError instead of storing zero vectors
+        missing_texts = [chunks[i] for i in missing]
+        with metrics.stage("embed"):
+            new_vectors = await self.embedding_client.embed(
+                missing_texts, progress=(lambda done: progress(len(cached) + done)) if progress else None
+            )
+        await self.embedding_cache.put_many(model, missing_texts, new_vectors)
+        
+        embeddings = [cached.get(i) for i in range(len(chunks))]
+        for i, vector in zip(missing, new_vectors):
+            embeddings[i] = vector
+        
+        logger.debug(f"Successfully generated {len(embeddings)} embeddings")
+        return embeddings
+    
+    async def extract_text_from_file(self, file_content: bytes, mime_type: str) -> str:
+        """Extract text content from file in the extraction pool - public method for API endpoint"""
+        return await self.extraction_pool.extract_text(file_content, mime_type)
     
     async def answer_question(self, session: AsyncSession, question: str, document_ids: List[str] = None) -> Dict[str, Any]:
-        """Answer a question using RAG with Gemini API"""
-        logger.info(f"Q&A called with question: '{question}' and document_ids: {document_ids}")
+        """Answer a question using RAG with the configured LLM provider"""
+        with metrics.trace("qa") as span:
+            result = await self._answer_question(session, question, document_ids)
+            if result["answer"].startswith("Error"):
+                span.status = "error"
+            return result
+    
+    async def _answer_question(self, session: AsyncSession, question: str, document_ids: List[str] = None) -> Dict[str, Any]:
+        """Untraced body of answer_question"""
+        logger.debug(f"Q&A called with question: '{question}' and document_ids: {document_ids}")
         try:
-            # Get relevant documents
-            if document_ids:
-                stmt = select(Document).where(Document.id.in_(document_ids))
-            else:
-                stmt = select(Document).where(Document.status == DocumentStatus.INGESTED.value)
-            
-            result = await session.execute(stmt)
-            documents = result.scalars().all()
+            # Resolve candidate document ids (no document bodies are loaded)
+            candidate_ids, corpus_version = await self._resolve_document_ids(session, document_ids)
             
-            logger.info(f"Found {len(documents)} documents for Q&A")
+            logger.debug(f"Found {len(candidate_ids)} documents for Q&A")
             
-            if not documents:
+            if not candidate_ids:
                 logger.warning("No documents available for Q&A")
                 return {
                     "answer": "No documents available for answering questions.",
@@ -311,29 +673,31 @@ class RAGService:
                     "confidence": 0.0
                 }
             
-            # Get embeddings for documents
-            embeddings = []
-            for doc in documents:
-                stmt = select(Embedding).where(Embedding.document_id == doc.id)
-                result = await session.execute(stmt)
-                doc_embeddings = result.scalars().all()
-                embeddings.extend(doc_embeddings)
-                logger.info(f"Found {len(doc_embeddings)} embeddings for document {doc.title}")
+            # Repeated questions over unchanged documents are answered from the cache
+            scope, question_vector, cached = await self._cached_answer(question, candidate_ids, corpus_version)
+            if cached is not None:
+                logger.debug("Using cached answer")
+                return dict(cached)
             
-            # Find most relevant content using semantic search
-            relevant_content = await self._find_relevant_content(question, documents, embeddings)
-            logger.info(f"Relevant context length: {len(relevant_content)} characters")
-            logger.info(f"Relevant context preview: {relevant_content[:200]}...")
+            # Find most relevant content using hybrid search, MMR and the context budget
+            with metrics.stage("retrieve"):
+                relevant_content, chunks = await self._find_relevant_content(session, question, candidate_ids)
+            logger.debug(f"Relevant context length: {len(relevant_content)} characters")
             
-            # Generate answer using Gemini API
-            answer = await self._generate_answer(question, relevant_content, documents)
-            logger.info(f"Generated answer: {answer}")
+            # Generate answer using the LLM provider
+            outcome: Dict[str, Any] = {}
+            answer = await self._generate_answer(question, relevant_content, outcome)
+            logger.debug(f"Generated answer length: {len(answer)} characters")
             
-            return {
+            result = {
                 "answer": answer,
-                "relevant_documents": [str(doc.id) for doc in documents[:3]],  # Top 3
-                "confidence": 0.85  # Placeholder confidence
+                "relevant_documents": relevant_documents(chunks),
+                "confidence": confidence_from(chunks),
+                "sources": [chunk.source() for chunk in chunks]
             }
+            if "error" not in outcome:
+                self._cache_answer(question, scope, question_vector, chunks, result)
+            return result
             
         except Exception as e:
             logger.error(f"Error in answer_question: {str(e)}", exc_info=True)
@@ -343,139 +707,482 @@ class RAGService:
                 "confidence": 0.0
             }
     
-    async def _find_relevant_content(self, question: str, documents: List[Document], embeddings: List[Embedding]) -> str:
-        """Find most relevant content for the question using semantic search"""
-        logger.info(f"Finding relevant content for question: '{question}'")
+    async def answer_question_stream(self, session: AsyncSession, question: str, document_ids: List[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Answer a question as a stream of events: retrieval results first, then answer tokens.
+        
+        Yields dicts with an "event" name ("retrieval", "token", "done" or "error") and a "data" payload.
+        The "done" payload carries the same fields as the non-streaming answer. A failed answer ends
+        with an "error" event carrying a "message" instead of "done".
+        """
+        with metrics.trace("qa_stream") as span:
+            async for event in self._answer_question_stream(session, question, document_ids):
+                if event["event"] == "error":
+                    span.status = "error"
+                yield event
+    
+    async def _answer_question_stream(self, session: AsyncSession, question: str, document_ids: List[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Untraced body of answer_question_stream"""
+        logger.debug(f"Streaming Q&A called with question: '{question}' and document_ids: {document_ids}")
         try:
-            # Check cache first for question embedding
-            if question in self._question_embedding_cache:
-                question_vector = self._question_embedding_cache[question]
-                logger.info("Using cached question embedding")
-            else:
-                # Generate embedding for the question using httpx for faster response
-                import httpx
-                async with httpx.AsyncClient(timeout=5.0) as client:
-                    response = await client.post(
-                        f"{settings.OLLAMA_BASE_URL}/api/embeddings",
-                        json={
-                            "model": settings.EMBEDDING_MODEL,
-                            "prompt": question
-                        }
-                    )
-                    if response.status_code == 200:
-                        result = response.json()
-                        question_vector = np.array(result['embedding'])
-                        # Cache the embedding
-                        self._question_embedding_cache[question] = question_vector
-                        logger.info("Generated and cached question embedding")
-                    else:
-                        logger.error("Failed to generate question embedding")
-                        return self._fallback_keyword_search(question, documents)
-            
-            # Calculate similarities
-            similarities = []
-            for embedding in embeddings:
-                try:
-                    doc_embedding = np.array(json.loads(embedding.embedding))
-                    similarity = np.dot(question_vector, doc_embedding) / (
-                        np.linalg.norm(question_vector) * np.linalg.norm(doc_embedding)
-                    )
-                    similarities.append((similarity, embedding.document_id, embedding.chunk_index, embedding.chunk_content))
-                except Exception as e:
-                    logger.error(f"Error calculating similarity: {str(e)}")
-                    continue
-            
-            # Sort by similarity and get top chunks
-            similarities.sort(key=lambda x: x[0], reverse=True)
-            top_chunks = similarities[:3]  # Reduced to top 3 for faster processing
+            candidate_ids, corpus_version = await self._resolve_document_ids(session, document_ids)
+            if not candidate_ids:
+                logger.warning("No documents available for Q&A")
+                answer = "No documents available for answering questions."
+                yield {"event": "retrieval", "data": {"relevant_documents": [], "confidence": 0.0}}
+                yield {"event": "token", "data": {"text": answer}}
+                yield {"event": "done", "data": {"answer": answer, "relevant_documents": [], "confidence": 0.0}}
+                return
             
-            logger.info(f"Top similarity scores: {[f'{s[0]:.3f}' for s in top_chunks[:3]]}")
+            scope, question_vector, cached = await self._cached_answer(question, candidate_ids, corpus_version)
+            if cached is not None:
+                logger.debug("Using cached answer")
+                retrieval = {key: value for key, value in cached.items() if key != "answer"}
+                yield {"event": "retrieval", "data": retrieval}
+                yield {"event": "token", "data": {"text": cached["answer"]}}
+                yield {"event": "done", "data": dict(cached)}
+                return
             
-            # Get document content for top chunks
-            relevant_content = []
-            for similarity, doc_id, chunk_idx, chunk_content in top_chunks:
-                # Find the document title
-                doc_title = "Unknown Document"
-                for doc in documents:
-                    if doc.id == doc_id:
-                        doc_title = doc.title
-                        break
-                
-                relevant_content.append(f"Document: {doc_title}\nChunk {chunk_idx} (similarity: {similarity:.3f}):\n{chunk_content}")
+            with metrics.stage("retrieve"):
+                relevant_content, chunks = await self._find_relevant_content(session, question, candidate_ids)
+            retrieval = {
+                "relevant_documents": relevant_documents(chunks),
+                "confidence": confidence_from(chunks),
+                "sources": [chunk.source() for chunk in chunks]
+            }
+            yield {"event": "retrieval", "data": retrieval}
             
-            result = "\n\n---\n\n".join(relevant_content)
-            logger.info(f"Retrieved {len(relevant_content)} relevant chunks")
-            return result
+            parts = []
+            outcome: Dict[str, Any] = {}
+            async for token in self._stream_answer(question, relevant_content, outcome):
+                parts.append(token)
+                yield {"event": "token", "data": {"text": token}}
             
+            # A stream that failed partway ends with an error event instead of "done", and is not cached
+            if "error" in outcome:
+                yield {"event": "error", "data": {"message": outcome["error"]}}
+                return
+            result = {"answer": "".join(parts), **retrieval}
+            self._cache_answer(question, scope, question_vector, chunks, result)
+            yield {"event": "done", "data": result}
+        
         except Exception as e:
-            logger.error(f"Error in semantic search: {str(e)}", exc_info=True)
-            # Fallback to simple keyword matching
-            return self._fallback_keyword_search(question, documents)
+            logger.error(f"Error in answer_question_stream: {str(e)}", exc_info=True)
+            yield {"event": "error", "data": {"message": f"Error processing question: {str(e)}"}}
+    
+    async def answer_questions(
+        self,
+        session: AsyncSession,
+        questions: List[str],
+        document_ids: List[str] = None,
+        concurrency: int = settings.BATCH_QA_CONCURRENCY,
+        block_size: int = settings.BATCH_QA_BLOCK_SIZE,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Answer many questions, yielding each result with its "index" as soon as it is ready.
+        
+        Questions not in the answer cache are embedded in batched provider calls and scored
+        against the resident index with one matrix-matrix product. Their chunks are loaded a
+        block of questions at a time while earlier answers are generated, at most
+        `concurrency` LLM calls at once. Results arrive in completion order, not input order.
+        A question that failed yields {"index", "question", "error"} instead of an answer.
+        """
+        with metrics.trace("qa_batch", questions=len(questions)):
+            async for result in self._answer_questions(session, questions, document_ids, concurrency, block_size):
+                yield result
+    
+    async def _answer_questions(
+        self,
+        session: AsyncSession,
+        questions: List[str],
+        document_ids: List[str] = None,
+        concurrency: int = settings.BATCH_QA_CONCURRENCY,
+        block_size: int = settings.BATCH_QA_BLOCK_SIZE,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Untraced body of answer_questions"""
+        logger.info(f"Batch Q&A called with {len(questions)} questions and document_ids: {document_ids}")
+        candidate_ids, corpus_version = await self._resolve_document_ids(session, document_ids)
+        if not candidate_ids:
+            logger.warning("No documents available for Q&A")
+            for index, question in enumerate(questions):
+                yield {"index": index, "question": question, "answer": "No documents available for answering questions.", "relevant_documents": [], "confidence": 0.0}
+            return
+        
+        scope = self.answer_cache.scope(candidate_ids, corpus_version)
+        semantic = bool(self.answer_cache.semantic_threshold)
+        # Semantic cache matching needs every question's embedding; otherwise only misses are embedded
+        vectors: List[Optional[np.ndarray]] = await self._embed_questions(questions) if semantic else [None] * len(questions)
+        pending = []
+        for index, question in enumerate(questions):
+            cached = self.answer_cache.get(question, scope, vectors[index])
+            if cached is not None:
+                yield {"index": index, "question": question, **cached}
+            else:
+                pending.append(index)
+        if not pending:
+            return
+        if not semantic:
+            for index, vector in zip(pending, await self._embed_questions([questions[i] for i in pending])):
+                vectors[index] = vector
+        logger.info(f"Batch Q&A: {len(questions) - len(pending)} answers cached, {len(pending)} to generate")
+        
+        vector_hits = await self._search_many(session, [vectors[i] for i in pending], candidate_ids, settings.HYBRID_CANDIDATES)
+        results: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        tasks = set()
+        
+        async def generate(index: int, context: str, chunks: List[RetrievedChunk]) -> None:
+            question = questions[index]
+            try:
+                outcome: Dict[str, Any] = {}
+                async with semaphore:
+                    answer = await self._generate_answer(question, context, outcome)
+                if "error" in outcome:
+                    result = {"error": outcome["error"]}
+                else:
+                    result = {
+                        "answer": answer,
+                        "relevant_documents": relevant_documents(chunks),
+                        "confidence": confidence_from(chunks),
+                        "sources": [chunk.source() for chunk in chunks]
+                    }
+                    self._cache_answer(question, scope, vectors[index] if semantic else None, chunks, result)
+            except Exception as e:
+                logger.error(f"Error answering batch question {index}: {str(e)}", exc_info=True)
+                result = {"error": f"Error processing question: {str(e)}"}
+            await results.put({"index": index, "question": question, **result})
+        
+        async def produce() -> None:
+            for start in range(0, len(pending), max(1, block_size)):
+                # Keep retrieval only a little ahead of generation, so contexts do not pile up in memory
+                while len(tasks) >= concurrency + block_size:
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                block = list(zip(pending[start:start + block_size], vector_hits[start:start + block_size]))
+                try:
+                    retrieved = {index: self._fuse_candidates(questions[index], hits, candidate_ids) for index, hits in block}
+                    await self._load_chunks(session, [chunk for chunks in retrieved.values() for chunk in chunks])
+                    contexts = {index: self._select_context(chunks, vectors[index]) for index, chunks in retrieved.items()}
+                except Exception as e:
+                    logger.error(f"Error retrieving context for batch questions: {str(e)}", exc_info=True)
+                    for index, _ in block:
+                        await results.put({"index": index, "question": questions[index], "error": f"Error processing question: {str(e)}"})
+                    continue
+                for index, (context, chunks) in contexts.items():
+                    task = asyncio.create_task(generate(index, context, chunks))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        
+        producer = asyncio.create_task(produce())
+        try:
+            for _ in range(len(pending)):
+                yield await results.get()
+            await producer
+        finally:
+            # The client may disconnect mid-batch; stop generating answers nobody will read
+            producer.cancel()
+            for task in list(tasks):
+                task.cancel()
     
-    def _fallback_keyword_search(self, question: str, documents: List[Document]) -> str:
-        """Fallback to simple keyword matching"""
-        logger.info("Using fallback keyword search")
-        question_lower = question.lower()
-        relevant_chunks = []
+    async def _cached_answer(self, question: str, document_ids: List[uuid.UUID], corpus_version: int) -> Tuple[Any, Optional[np.ndarray], Optional[Dict[str, Any]]]:
+        """Answer cache lookup: returns the scope, the question embedding (for semantic matching only) and any hit"""
+        scope = self.answer_cache.scope(document_ids, corpus_version)
+        # The question embedding is needed for retrieval on a miss anyway, and is cached
+        question_vector = await self._embed_question(question) if self.answer_cache.semantic_threshold else None
+        return scope, question_vector, self.answer_cache.get(question, scope, question_vector)
+    
+    def _cache_answer(self, question: str, scope: Any, question_vector: Optional[np.ndarray], chunks: List[RetrievedChunk], result: Dict[str, Any]) -> None:
+        # Callers pass only answers the provider completed; of those, only answers grounded in
+        # retrieved context are cached, as "not enough information" may succeed on the next attempt
+        if chunks:
+            self.answer_cache.put(question, scope, result, question_vector)
+    
+    async def _resolve_document_ids(self, session: AsyncSession, document_ids: Optional[List[str]]) -> Tuple[List[uuid.UUID], int]:
+        """Ids of the selected documents, or of every ingested document when none are selected, and
+        their corpus version: the sum of their ingest versions, which grows with every re-ingestion"""
+        if document_ids:
+            stmt = select(Document.id, Document.ingest_version).where(Document.id.in_(document_ids))
+        else:
+            stmt = select(Document.id, Document.ingest_version).where(Document.status == DocumentStatus.INGESTED.value)
+        
+        rows = (await session.execute(stmt)).all()
+        return [row.id for row in rows], sum(row.ingest_version or 0 for row in rows)
+    
+    async def _find_relevant_content(self, session: AsyncSession, question: str, document_ids: List[uuid.UUID]) -> Tuple[str, List[RetrievedChunk]]:
+        """Retrieve context for the question: hybrid vector + BM25 candidates, similarity threshold,
+        MMR de-duplication and a token-budgeted context. Returns the context and the chunks it contains.
+        """
+        logger.debug(f"Finding relevant content for question: '{question}'")
         
-        for doc in documents:
-            if any(word in doc.content.lower() for word in question_lower.split()):
-                relevant_chunks.append(f"Document: {doc.title}\nContent: {doc.content[:500]}...")
+        # Vector ranking; when Ollama is down the lexical ranking is used alone
+        vector_hits = []
+        question_vector = await self._embed_question(question)
+        if question_vector is not None:
+            try:
+                vector_hits = await self._search_chunks(session, question_vector, document_ids, settings.HYBRID_CANDIDATES)
+            except Exception as e:
+                logger.error(f"Error in semantic search: {str(e)}", exc_info=True)
+                metrics.FALLBACKS.labels(kind="lexical_only").inc()
+        else:
+            metrics.FALLBACKS.labels(kind="lexical_only").inc()
+        
+        retrieved = self._fuse_candidates(question, vector_hits, document_ids)
+        if not retrieved:
+            logger.warning("Hybrid search returned no matches")
+            return "", []
+        await self._load_chunks(session, retrieved)
+        return self._select_context(retrieved, question_vector)
+    
+    def _fuse_candidates(self, question: str, vector_hits: List[Tuple[float, uuid.UUID, int]], document_ids: List[uuid.UUID]) -> List[RetrievedChunk]:
+        """Candidates of the reciprocal rank fusion of the vector and BM25 rankings"""
+        candidates = settings.HYBRID_CANDIDATES
+        lexical_hits = []
+        if settings.LEXICAL_SEARCH_ENABLED:
+            with metrics.stage("lexical_search"):
+                lexical_hits = self.lexical_index.search(question, candidates, document_ids=document_ids)
+        
+        fused = reciprocal_rank_fusion(
+            [[(doc_id, chunk_idx) for _, doc_id, chunk_idx in hits] for hits in (vector_hits, lexical_hits) if hits],
+            k=settings.RRF_K
+        )[:candidates]
+        logger.debug(f"Retrieved {len(vector_hits)} vector and {len(lexical_hits)} lexical candidates")
+        
+        similarities = {(doc_id, chunk_idx): similarity for similarity, doc_id, chunk_idx in vector_hits}
+        lexical_keys = {(doc_id, chunk_idx) for _, doc_id, chunk_idx in lexical_hits}
+        return [
+            RetrievedChunk(key[0], key[1], score, similarity=similarities.get(key), lexical_match=key in lexical_keys)
+            for score, key in fused
+        ]
+    
+    @staticmethod
+    def _select_context(retrieved: List[RetrievedChunk], question_vector: Optional[np.ndarray]) -> Tuple[str, List[RetrievedChunk]]:
+        """Threshold, MMR and pack loaded candidates; chunks found only by keyword are scored from their stored vector"""
+        if question_vector is not None:
+            norm = np.linalg.norm(question_vector)
+            query = question_vector / norm if norm > 0 else None
+            for chunk in retrieved:
+                if chunk.similarity is None and query is not None and chunk.vector is not None and len(chunk.vector) == len(query):
+                    chunk_norm = np.linalg.norm(chunk.vector)
+                    chunk.similarity = float(chunk.vector @ query / chunk_norm) if chunk_norm > 0 else 0.0
         
-        return "\n\n".join(relevant_chunks[:3])
+        with metrics.stage("rerank"):
+            kept = apply_threshold(retrieved, settings.RETRIEVAL_MIN_SIMILARITY)
+            selected = mmr_select(kept, settings.RETRIEVAL_TOP_K, settings.MMR_LAMBDA)
+            context, packed = pack_context(selected, settings.CONTEXT_TOKEN_BUDGET)
+        logger.debug(f"{len(kept)} candidates above threshold, {len(selected)} after MMR, {len(packed)} packed into the context")
+        return context, packed
     
-    async def _generate_answer(self, question: str, context: str, documents: List[Document]) -> str:
-        """Generate answer based on question and context using Gemini API"""
+    async def _embed_question(self, question: str) -> Optional[np.ndarray]:
+        """Question embedding from the caches or the embedding provider; None if unavailable"""
+        # Check cache first for question embedding
+        model = self.embedding_client.model
+        question_key = (model, normalize_question(question))
+        question_vector = self._question_embedding_cache.get(question_key)
+        if question_vector is not None:
+            logger.debug("Using cached question embedding")
+            return question_vector
+        
+        # Consult the shared embedding cache, then embed over the shared client
+        question_vector = (await self.embedding_cache.get_many(model, [question])).get(0)
+        if question_vector is None:
+            try:
+                with metrics.stage("embed_question"):
+                    question_vector = await self.embedding_client.embed_one(question)
+            except EmbeddingError as e:
+                logger.error(f"Failed to generate question embedding: {str(e)}")
+                return None
+            await self.embedding_cache.put_many(model, [question], [question_vector])
+        # Cache the embedding
+        self._question_embedding_cache.put(question_key, question_vector)
+        logger.debug("Generated and cached question embedding")
+        return question_vector
+    
+    async def _embed_questions(self, questions: List[str]) -> List[Optional[np.ndarray]]:
+        """Embeddings of many questions from the caches, embedding the rest in batched provider calls"""
+        model = self.embedding_client.model
+        vectors = [self._question_embedding_cache.get((model, normalize_question(question))) for question in questions]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+        
+        texts = list(dict.fromkeys(questions[i] for i in missing))
+        by_text = {texts[position]: vector for position, vector in (await self.embedding_cache.get_many(model, texts)).items()}
+        new_texts = [text for text in texts if text not in by_text]
+        if new_texts:
+            try:
+                with metrics.stage("embed_question"):
+                    new_vectors = await self.embedding_client.embed(new_texts)
+            except EmbeddingError as e:
+                logger.error(f"Failed to generate question embeddings: {str(e)}")
+            else:
+                await self.embedding_cache.put_many(model, new_texts, new_vectors)
+                by_text.update(zip(new_texts, new_vectors))
+        
+        for i in missing:
+            vectors[i] = by_text.get(questions[i])
+            if vectors[i] is not None:
+                self._question_embedding_cache.put((model, normalize_question(questions[i])), vectors[i])
+        logger.debug(f"Embedded {len(new_texts)} of {len(questions)} questions, the rest were cached")
+        return vectors
+    
+    async def _search_many(self, session: AsyncSession, question_vectors: List[Optional[np.ndarray]], document_ids: List[uuid.UUID], k: int) -> List[List[Tuple[float, uuid.UUID, int]]]:
+        """Vector hits for many questions; questions without an embedding get none and fall back to BM25"""
+        hits: List[List[Tuple[float, uuid.UUID, int]]] = [[] for _ in question_vectors]
+        embedded = [i for i, vector in enumerate(question_vectors) if vector is not None]
+        try:
+            with metrics.stage("vector_search"):
+                if settings.VECTOR_SEARCH_BACKEND == "pgvector":
+                    for i in embedded:
+                        hits[i] = await self._search_pgvector(session, question_vectors[i], document_ids, k)
+                elif embedded:
+                    for i, found in zip(embedded, self.vector_index.search_many([question_vectors[i] for i in embedded], k, document_ids=document_ids)):
+                        hits[i] = found
+        except Exception as e:
+            logger.error(f"Error in batch semantic search: {str(e)}", exc_info=True)
+            embedded = []
+        metrics.FALLBACKS.labels(kind="lexical_only").inc(len(question_vectors) - len(embedded))
+        return hits
+    
+    async def _search_chunks(self, session: AsyncSession, question_vector: np.ndarray, document_ids: Optional[List[uuid.UUID]], k: int) -> List[Tuple[float, uuid.UUID, int]]:
+        """Return the top-k (similarity, document_id, chunk_index) using the configured vector backend"""
+        with metrics.stage("vector_search"):
+            if settings.VECTOR_SEARCH_BACKEND == "pgvector":
+                return await self._search_pgvector(session, question_vector, document_ids, k)
+            return self.vector_index.search(question_vector, k, document_ids=document_ids)
+    
+    async def _search_pgvector(self, session: AsyncSession, question_vector: np.ndarray, document_ids: Optional[List[uuid.UUID]], k: int) -> List[Tuple[float, uuid.UUID, int]]:
+        """Run the nearest-neighbour search inside Postgres so only the top-k keys cross the wire"""
+        if len(question_vector) != settings.EMBEDDING_DIM:
+            logger.warning(f"Question vector dim {len(question_vector)} does not match EMBEDDING_DIM {settings.EMBEDDING_DIM}")
+            return []
+        
+        # A larger HNSW candidate list keeps recall up when the document filter discards many neighbours
+        await session.execute(text(f"SET LOCAL hnsw.ef_search = {int(settings.PGVECTOR_EF_SEARCH)}"))
+        
+        distance = Embedding.embedding_vector.cosine_distance(question_vector)
+        stmt = select(Embedding.document_id, Embedding.chunk_index, distance.label("distance")).where(
+            Embedding.embedding_vector.isnot(None)
+        )
+        if document_ids is not None:
+            ids = [doc_id if isinstance(doc_id, uuid.UUID) else uuid.UUID(str(doc_id)) for doc_id in document_ids]
+            stmt = stmt.where(Embedding.document_id == any_(bindparam("ids", ids, type_=ARRAY(PostgresUUID(as_uuid=True)))))
+        stmt = stmt.order_by(distance).limit(k)
+        
+        result = await session.execute(stmt)
+        return [(1.0 - row.distance, row.document_id, row.chunk_index) for row in result]
+    
+    async def _load_chunks(self, session: AsyncSession, chunks: List[RetrievedChunk]) -> None:
+        """Fill in text, title, vector and source span of the given chunks in one query"""
+        if not chunks:
+            return
+        keys = list({chunk.key for chunk in chunks})
+        with metrics.stage("db_load"):
+            rows = await self._fetch_chunk_rows(session, keys)
+            missing = [key for key in keys if key not in rows]
+            if missing and read_engine is not engine and getattr(session, "bind", None) is read_engine:
+                # The index comes from the primary; chunks ingested since the replica last caught up are read there
+                async with AsyncSessionLocal() as primary:
+                    rows.update(await self._fetch_chunk_rows(primary, missing))
+        
+        vectors: Dict[Tuple[uuid.UUID, int], np.ndarray] = {}
+        for chunk in chunks:
+            row = rows.get(chunk.key)
+            if row is None:
+                continue
+            chunk.text = row.chunk_content or ""
+            chunk.title = row.title or "Unknown Document"
+            chunk.page_start, chunk.page_end = row.page_start, row.page_end
+            chunk.char_start, chunk.char_end = row.char_start, row.char_end
+            if row.embedding_bytes is not None:
+                if chunk.key not in vectors:
+                    vectors[chunk.key] = decode_vector(row.embedding_bytes)
+                chunk.vector = vectors[chunk.key]
+    
+    @staticmethod
+    async def _fetch_chunk_rows(session: AsyncSession, keys: List[Tuple[uuid.UUID, int]]) -> Dict[Tuple[uuid.UUID, int], Any]:
+        stmt = (
+            select(
+                Embedding.document_id, Embedding.chunk_index, Embedding.chunk_content, Document.title,
+                Embedding.embedding_bytes, Embedding.page_start, Embedding.page_end, Embedding.char_start, Embedding.char_end
+            )
+            .outerjoin(Document, Document.id == Embedding.document_id)
+            .where(tuple_(Embedding.document_id, Embedding.chunk_index).in_(keys))
+        )
+        result = await session.execute(stmt)
+        return {(row.document_id, row.chunk_index): row for row in result}
+    
+    async def _generate_answer(self, question: str, context: str, outcome: Optional[Dict[str, Any]] = None) -> str:
+        """Generate answer based on question and context using the configured LLM provider.
+        
+        Failures are returned as the answer text and, when given, also set `outcome["error"]`.
+        """
+        outcome = {} if outcome is None else outcome
         if not context:
             logger.warning("No relevant context found for question.")
+            metrics.FALLBACKS.labels(kind="no_context").inc()
             return "I don't have enough information to answer this question."
         
+        prompt = self._build_prompt(question, context)
+        logger.debug(f"Prompt sent to {self.llm.name} (length: {len(prompt)} characters)")
+        
         try:
-            # Configure Gemini API
-            if not settings.GEMINI_API_KEY:
-                logger.error("Gemini API key not configured")
-                return "Error: Gemini API key not configured"
-            
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            # Create shorter prompt for Gemini for faster response
-            prompt = f"""Answer: {question}
+            with metrics.stage("generate"):
+                answer = await self.llm.generate(prompt, settings.LLM_MAX_OUTPUT_TOKENS)
+            if answer:
+                logger.debug(f"{self.llm.name} response received successfully")
+                return answer
+            else:
+                logger.error(f"{self.llm.name} returned empty response")
+                metrics.PROVIDER_ERRORS.labels(provider=self.llm.name, kind="empty").inc()
+                outcome["error"] = f"Error: No response from {self.llm.name}"
+        
+        except asyncio.TimeoutError:
+            logger.error(f"{self.llm.name} request timed out after {settings.LLM_TIMEOUT}s")
+            metrics.PROVIDER_ERRORS.labels(provider=self.llm.name, kind="timeout").inc()
+            outcome["error"] = "Error: Request timed out. Please try again."
+        except LLMError as e:
+            logger.error(f"LLM provider error: {str(e)}")
+            metrics.PROVIDER_ERRORS.labels(provider=self.llm.name, kind="error").inc()
+            outcome["error"] = f"Error: {str(e)}"
+        except Exception as e:
+            logger.error(f"Error calling {self.llm.name} API: {str(e)}", exc_info=True)
+            metrics.PROVIDER_ERRORS.labels(provider=self.llm.name, kind="error").inc()
+            outcome["error"] = f"Error generating response: {str(e)}"
+        return outcome["error"]
+    
+    async def _stream_answer(self, question: str, context: str, outcome: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream answer text from the LLM provider as it is generated.
+        
+        On a provider error or timeout the stream ends and `outcome["error"]` is set to the error message.
+        """
+        if not context:
+            logger.warning("No relevant context found for question.")
+            metrics.FALLBACKS.labels(kind="no_context").inc()
+            yield "I don't have enough information to answer this question."
+            return
+        
+        prompt = self._build_prompt(question, context)
+        logger.debug(f"Streaming prompt sent to {self.llm.name} (length: {len(prompt)} characters)")
+        
+        try:
+            with metrics.stage("generate"):
+                async for token in self.llm.stream(prompt, settings.LLM_STREAM_MAX_OUTPUT_TOKENS):
+                    yield token
+        except asyncio.TimeoutError:
+            logger.error(f"{self.llm.name} stream timed out after {settings.LLM_TIMEOUT}s")
+            metrics.PROVIDER_ERRORS.labels(provider=self.llm.name, kind="timeout").inc()
+            outcome["error"] = "Error: Request timed out. Please try again."
+        except LLMError as e:
+            logger.error(f"LLM provider error: {str(e)}")
+            metrics.PROVIDER_ERRORS.labels(provider=self.llm.name, kind="error").inc()
+            outcome["error"] = f"Error: {str(e)}"
+        except Exception as e:
+            logger.error(f"Error streaming from {self.llm.name} API: {str(e)}", exc_info=True)
+            metrics.PROVIDER_ERRORS.labels(provider=self.llm.name, kind="error").inc()
+            outcome["error"] = f"Error generating response: {str(e)}"
+    
+    @staticmethod
+    def _build_prompt(question: str, context: str) -> str:
+        """Create shorter prompt for the LLM for faster response; the context is already token-budgeted"""
+        return f"""Answer: {question}
 
-Context: {context[:800]}...
+Context: {context}
 
 Answer:"""
-            
-            logger.info(f"Prompt sent to Gemini (length: {len(prompt)} characters)")
-            
-            try:
-                # Generate response using Gemini with timeout
-                import asyncio
-                
-                # Use asyncio to add timeout
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(
-                    None, 
-                    lambda: model.generate_content(prompt, generation_config=genai.types.GenerationConfig(
-                        max_output_tokens=150,  # Limit response length for speed
-                        temperature=0.1  # Lower temperature for faster, more focused responses
-                    ))
-                )
-                
-                if response.text:
-                    logger.info("Gemini response received successfully")
-                    return response.text
-                else:
-                    logger.error("Gemini returned empty response")
-                    return "Error: No response from Gemini"
-                    
-            except asyncio.TimeoutError:
-                logger.error("Gemini request timed out")
-                return "Error: Request timed out. Please try again."
-            except Exception as e:
-                logger.error(f"Error calling Gemini API: {str(e)}", exc_info=True)
-                return f"Error generating response: {str(e)}"
-            
-        except Exception as e:
-            logger.error(f"Error generating Gemini response: {str(e)}", exc_info=True)
-            return f"Error generating response: {str(e)}" 
\ No newline at end of file
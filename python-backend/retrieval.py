@@ -0,0 +1,177 @@
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from chunking import estimate_tokens
+from lexical_index import tokenize
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+_SENTENCE_END_RE = re.compile(r"[.!?](?=\s)")
+
+
+@dataclass
+class RetrievedChunk:
+    """A retrieval candidate with its scores and, once loaded, its text and source span"""
+    document_id: uuid.UUID
+    chunk_index: int
+    fused_score: float
+    similarity: Optional[float] = None  # cosine similarity to the question, when both vectors are known
+    lexical_match: bool = False
+    text: str = ""
+    title: str = "Unknown Document"
+    vector: Optional[np.ndarray] = None
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
+
+    @property
+    def key(self) -> Tuple[uuid.UUID, int]:
+        return self.document_id, self.chunk_index
+
+    def source(self) -> Dict:
+        return {
+            "document_id": str(self.document_id),
+            "chunk_index": self.chunk_index,
+            "score": round(self.similarity, 4) if self.similarity is not None else None,
+            "page_start": self.page_start,
+            "page_end": self.page_end,
+            "char_start": self.char_start,
+            "char_end": self.char_end,
+        }
+
+
+def apply_threshold(candidates: List[RetrievedChunk], min_similarity: float) -> List[RetrievedChunk]:
+    """Drop candidates whose similarity is below the threshold, unless they matched the question's keywords"""
+    return [c for c in candidates if c.lexical_match or c.similarity is None or c.similarity >= min_similarity]
+
+
+def mmr_select(
+    candidates: List[RetrievedChunk], k: int, diversity_lambda: float, duplicate_similarity: float = 0.95
+) -> List[RetrievedChunk]:
+    """Maximal marginal relevance: pick up to k candidates trading relevance against similarity to those already picked.
+
+    Relevance is the fused score scaled to [0, 1]. Redundancy is the cosine
+    similarity of chunk vectors, or token-set Jaccard overlap when a vector
+    is missing. Candidates at least `duplicate_similarity` alike to a picked
+    chunk (boilerplate, repeated pages) are dropped outright.
+    """
+    if len(candidates) <= 1 or k <= 0:
+        return candidates[:k]
+    top = max(c.fused_score for c in candidates) or 1.0
+    relevance = np.array([c.fused_score / top for c in candidates], dtype=np.float32)
+    redundancy = _pairwise_similarity(candidates)
+
+    selected: List[int] = []
+    max_redundancy = np.zeros(len(candidates), dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    for _ in range(min(k, len(candidates))):
+        scores = diversity_lambda * relevance - (1 - diversity_lambda) * max_redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if not available[best]:
+            break
+        selected.append(best)
+        available[best] = False
+        max_redundancy = np.maximum(max_redundancy, redundancy[best])
+        available &= max_redundancy < duplicate_similarity
+    return [candidates[i] for i in selected]
+
+
+def pack_context(
+    chunks: List[RetrievedChunk],
+    token_budget: int,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+    min_partial_tokens: int = 48,
+) -> Tuple[str, List[RetrievedChunk]]:
+    """Format chunks into a context of at most `token_budget` tokens, best first.
+
+    A chunk that no longer fits is cut at a sentence boundary when enough of
+    the budget is left to be useful, and skipped otherwise so that a smaller
+    chunk further down can still be used. Returns the context and the chunks
+    it contains.
+    """
+    parts: List[str] = []
+    packed: List[RetrievedChunk] = []
+    remaining = token_budget
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    for chunk in chunks:
+        header = _chunk_header(chunk)
+        cost = count_tokens(header) + (separator_tokens if parts else 0)
+        body_budget = remaining - cost
+        if body_budget <= 0:
+            continue
+        body = chunk.text
+        body_tokens = count_tokens(body)
+        if body_tokens > body_budget:
+            if body_budget < min_partial_tokens:
+                continue
+            body = _truncate_to_tokens(body, body_budget, count_tokens)
+            if not body:
+                continue
+            body_tokens = count_tokens(body)
+        parts.append(header + body)
+        packed.append(chunk)
+        remaining -= cost + body_tokens
+    return CONTEXT_SEPARATOR.join(parts), packed
+
+
+def confidence_from(chunks: List[RetrievedChunk]) -> float:
+    """Best question-chunk cosine similarity among the chunks used for the answer"""
+    similarities = [c.similarity for c in chunks if c.similarity is not None]
+    if not similarities:
+        return 0.0
+    return round(float(min(1.0, max(0.0, max(similarities)))), 4)
+
+
+def relevant_documents(chunks: List[RetrievedChunk]) -> List[str]:
+    """Distinct document ids of the used chunks, most relevant first"""
+    seen: Dict[uuid.UUID, None] = {}
+    for chunk in chunks:
+        seen.setdefault(chunk.document_id, None)
+    return [str(doc_id) for doc_id in seen]
+
+
+def _chunk_header(chunk: RetrievedChunk) -> str:
+    details = []
+    if chunk.page_start is not None:
+        pages = f"{chunk.page_start}" if chunk.page_end in (None, chunk.page_start) else f"{chunk.page_start}-{chunk.page_end}"
+        details.append(f"pages {pages}")
+    details.append(f"similarity: {chunk.similarity:.3f}" if chunk.similarity is not None else "keyword match")
+    return f"Document: {chunk.title}\nChunk {chunk.chunk_index} ({', '.join(details)}):\n"
+
+
+def _truncate_to_tokens(text: str, budget: int, count_tokens: Callable[[str], int]) -> str:
+    """Longest prefix of whole sentences (or words, if no sentence fits) within the token budget"""
+    cut, start, total = 0, 0, 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        total += count_tokens(text[start:match.end()])
+        if total > budget:
+            break
+        cut = start = match.end()
+    if cut:
+        return text[:cut]
+    words, total = [], 0
+    for word in text.split():
+        total += count_tokens(word)
+        if total > budget:
+            break
+        words.append(word)
+    return " ".join(words)
+
+
+def _pairwise_similarity(candidates: List[RetrievedChunk]) -> np.ndarray:
+    if all(c.vector is not None for c in candidates) and len({len(c.vector) for c in candidates}) == 1:
+        matrix = np.stack([c.vector for c in candidates]).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms > 0, norms, 1.0)
+        return matrix @ matrix.T
+    token_sets = [set(tokenize(c.text)) for c in candidates]
+    size = len(candidates)
+    similarity = np.zeros((size, size), dtype=np.float32)
+    for i in range(size):
+        for j in range(i, size):
+            union = len(token_sets[i] | token_sets[j])
+            similarity[i, j] = similarity[j, i] = len(token_sets[i] & token_sets[j]) / union if union else 0.0
+    return similarity
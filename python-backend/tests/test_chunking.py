@@ -0,0 +1,74 @@
+from chunking import Chunker
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def paragraphs(count: int) -> str:
+    return "\n\n".join(f"p{i} w w w" for i in range(count))
+
+
+def test_consecutive_chunks_share_overlap():
+    chunker = Chunker(max_tokens=10, overlap_tokens=4, min_tokens=3, count_tokens=count_words)
+    chunks = chunker.split(paragraphs(6))
+
+    assert len(chunks) == 5
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # The last paragraph of a chunk is repeated at the start of the next one
+        assert chunk.text.split("\n")[0] == previous.text.split("\n")[-1]
+        assert chunk.char_start < previous.char_end
+    assert all(chunk.token_count <= 10 for chunk in chunks)
+
+
+def test_no_overlap_when_disabled():
+    chunker = Chunker(max_tokens=10, overlap_tokens=0, min_tokens=3, count_tokens=count_words)
+    chunks = chunker.split(paragraphs(6))
+
+    assert [chunk.text for chunk in chunks] == ["p0 w w w\np1 w w w", "p2 w w w\np3 w w w", "p4 w w w\np5 w w w"]
+
+
+def test_short_tail_is_merged_into_previous_chunk():
+    # The tail does not fit the 8-token budget, but has fewer than min_tokens of its own
+    chunker = Chunker(max_tokens=8, overlap_tokens=0, min_tokens=3, count_tokens=count_words)
+    chunks = chunker.split("one two three four five six seven eight.\n\ntail end")
+
+    assert [chunk.text for chunk in chunks] == ["one two three four five six seven eight.\ntail end"]
+    assert chunks[0].token_count == 10
+
+
+def test_tail_of_min_tokens_stays_separate():
+    chunker = Chunker(max_tokens=8, overlap_tokens=0, min_tokens=2, count_tokens=count_words)
+    chunks = chunker.split("one two three four five six seven eight.\n\ntail end")
+
+    assert [chunk.text for chunk in chunks] == ["one two three four five six seven eight.", "tail end"]
+
+
+def test_heading_starts_new_chunk():
+    chunker = Chunker(max_tokens=50, overlap_tokens=4, min_tokens=1, count_tokens=count_words)
+    text = "Intro text here a b c d.\n\n# Setup\n\nInstall it with pip now.\n\n# Usage\n\nRun the thing."
+    chunks = chunker.split(text)
+
+    assert [chunk.text for chunk in chunks] == [
+        "Intro text here a b c d.",
+        "# Setup\nInstall it with pip now.",
+        "# Usage\nRun the thing.",
+    ]
+    # Offsets point into the source text, and the overlap never crosses a heading
+    assert text[chunks[1].char_start:chunks[1].char_end] == "# Setup\n\nInstall it with pip now."
+
+
+def test_long_paragraph_is_split_within_budget():
+    chunker = Chunker(max_tokens=5, overlap_tokens=0, min_tokens=0, count_tokens=count_words)
+    chunks = chunker.split(" ".join(f"w{i}" for i in range(12)))
+
+    assert [chunk.token_count for chunk in chunks] == [5, 5, 2]
+    assert " ".join(chunk.text for chunk in chunks) == " ".join(f"w{i}" for i in range(12))
+
+
+def test_paged_chunks_carry_page_spans():
+    chunker = Chunker(max_tokens=10, overlap_tokens=0, min_tokens=0, count_tokens=count_words)
+    chunks = list(chunker.iter_chunks(["a b c d e f", "g h i j k l"], paged=True))
+
+    assert [(chunk.page_start, chunk.page_end) for chunk in chunks] == [(1, 1), (2, 2)]
+    assert chunks[1].char_start == len("a b c d e f") + 1
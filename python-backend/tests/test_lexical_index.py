@@ -0,0 +1,78 @@
+import math
+import uuid
+import pytest
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+DOC_A = uuid.UUID(int=1)
+DOC_B = uuid.UUID(int=2)
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("Error ERR-404 in v2.1") == ["error", "err-404", "err", "404", "in", "v2.1", "v2", "1"]
+
+
+def test_bm25_score_matches_formula():
+    index = BM25Index(k1=1.5, b=0.75)
+    index.add_document(DOC_A, [(0, "apple apple banana"), (1, "cherry")])
+    index.add_document(DOC_B, [(0, "banana cherry cherry cherry")])
+
+    hits = index.search("apple", 5)
+
+    # One matching chunk of length 3; 3 chunks with an average length of 8/3
+    idf = math.log(1 + (3 - 1 + 0.5) / (1 + 0.5))
+    norm = 1.5 * (1 - 0.75 + 0.75 * 3 / (8 / 3))
+    assert len(hits) == 1
+    assert hits[0][1:] == (DOC_A, 0)
+    assert hits[0][0] == pytest.approx(idf * 2 * 2.5 / (2 + norm))
+
+
+def test_bm25_ranks_by_term_frequency_and_filters_documents():
+    index = BM25Index()
+    index.add_document(DOC_A, [(0, "cherry pie"), (1, "apple")])
+    index.add_document(DOC_B, [(0, "cherry cherry cherry")])
+
+    assert [hit[1:] for hit in index.search("cherry", 5)] == [(DOC_B, 0), (DOC_A, 0)]
+    assert [hit[1:] for hit in index.search("cherry", 5, document_ids=[str(DOC_A)])] == [(DOC_A, 0)]
+    assert index.search("durian", 5) == []
+
+
+def test_add_document_replaces_previous_chunks():
+    index = BM25Index()
+    index.add_document(DOC_A, [(0, "old words"), (1, "more old words")])
+    index.add_document(DOC_A, [(0, "new words")])
+
+    assert len(index) == 1
+    assert index.search("old", 5) == []
+    assert [hit[1:] for hit in index.search("new", 5)] == [(DOC_A, 0)]
+
+    index.remove_document(DOC_A)
+    assert len(index) == 0
+    assert index.search("words", 5) == []
+
+
+def test_take_document_matches_indexing_directly():
+    staged = BM25Index()
+    staged.add_chunks(DOC_A, [(0, "apple banana")])
+    staged.add_chunks(DOC_A, [(1, "banana cherry")])
+    index = BM25Index()
+    index.add_document(DOC_A, [(0, "stale text")])
+    index.add_document(DOC_B, [(0, "banana")])
+    index.take_document(staged, DOC_A)
+
+    expected = BM25Index()
+    expected.add_document(DOC_A, [(0, "apple banana"), (1, "banana cherry")])
+    expected.add_document(DOC_B, [(0, "banana")])
+    assert sorted(index.search("banana cherry", 5)) == sorted(expected.search("banana cherry", 5))
+    assert index.search("stale", 5) == []
+
+
+def test_reciprocal_rank_fusion():
+    a, b, c = (DOC_A, 0), (DOC_A, 1), (DOC_B, 0)
+
+    fused = reciprocal_rank_fusion([[a, b], [b, c]], k=60)
+
+    assert [key for _, key in fused] == [b, a, c]
+    assert fused[0][0] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1][0] == pytest.approx(1 / 61)
+    assert fused[2][0] == pytest.approx(1 / 62)
+    assert reciprocal_rank_fusion([]) == []
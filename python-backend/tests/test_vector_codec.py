@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from vector_codec import decode_matrix, decode_vector, encode_vector
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).standard_normal((5, 32)).astype(np.float32)
+
+
+def test_float32_round_trip_is_exact(vectors):
+    blob = encode_vector(vectors[0], "float32")
+
+    assert len(blob) == 8 + 32 * 4
+    np.testing.assert_array_equal(decode_vector(blob), vectors[0])
+
+
+def test_float16_round_trip(vectors):
+    decoded = decode_vector(encode_vector(vectors[0], "float16"))
+
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, vectors[0], rtol=1e-3, atol=1e-3)
+
+
+def test_int8_round_trip_within_quantization_step(vectors):
+    decoded = decode_vector(encode_vector(vectors[0], "int8"))
+
+    step = np.max(np.abs(vectors[0])) / 127
+    assert np.max(np.abs(decoded - vectors[0])) <= step / 2 + 1e-6
+    np.testing.assert_array_equal(decode_vector(encode_vector(np.zeros(4), "int8")), np.zeros(4))
+
+
+def test_decode_matrix_mixes_formats_in_row_order(vectors):
+    formats = ["float32", "int8", "float16", "float32", "int8"]
+    blobs = [encode_vector(vector, storage_format) for vector, storage_format in zip(vectors, formats)]
+
+    matrix = decode_matrix(blobs)
+
+    assert matrix.shape == (5, 32)
+    for row, blob in zip(matrix, blobs):
+        np.testing.assert_array_equal(row, decode_vector(blob))
+    np.testing.assert_array_equal(matrix[0], vectors[0])
+
+
+def test_decode_matrix_rejects_mixed_dimensions():
+    with pytest.raises(ValueError, match="mixed dimensions"):
+        decode_matrix([encode_vector(np.ones(4), "float32"), encode_vector(np.ones(8), "float32")])
+
+
+@pytest.mark.parametrize("blob", [
+    bytes([9, 0, 0, 0]) + np.float32(1).tobytes() + np.ones(4, dtype=np.float32).tobytes(),  # unknown format code
+    encode_vector(np.ones(4), "float32")[:-1],  # truncated values
+    encode_vector(np.ones(4), "float32")[:5],  # truncated header
+    b"",
+])
+def test_decode_rejects_malformed_blob(blob):
+    with pytest.raises(ValueError, match="Malformed"):
+        decode_vector(blob)
@@ -0,0 +1,92 @@
+import uuid
+import numpy as np
+import pytest
+from vector_index import VectorIndex
+
+DOCS = [uuid.UUID(int=i + 1) for i in range(4)]
+
+
+def unit(dim: int, axis: int) -> np.ndarray:
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[axis] = 1.0
+    return vector
+
+
+@pytest.fixture
+def index():
+    # Document i has chunk j pointing mostly along axis 2 * i + j
+    index = VectorIndex(initial_capacity=2)
+    for i, doc_id in enumerate(DOCS):
+        vectors = [unit(8, 2 * i + j) + 0.1 for j in range(2)]
+        assert index.add_document(doc_id, [0, 1], vectors) == 2
+    return index
+
+
+def test_add_and_search(index):
+    hits = index.search(unit(8, 5), 3)
+
+    assert len(index) == 8
+    assert [hit[1:] for hit in hits[:1]] == [(DOCS[2], 1)]
+    assert len(hits) == 3
+    assert hits[0][0] == pytest.approx(1.1 / np.linalg.norm(unit(8, 5) + 0.1))
+    assert [score for score, _, _ in hits] == sorted((score for score, _, _ in hits), reverse=True)
+
+
+def test_vectors_of_wrong_dimension_are_skipped(index):
+    assert index.add_document(DOCS[0], [2, 3], [np.ones(4), np.zeros(8)]) == 0
+    assert index.search(np.ones(4), 3) == []
+    assert len(index) == 8
+
+
+def test_search_with_document_filter(index):
+    hits = index.search(unit(8, 5), 8, document_ids=[str(DOCS[0]), DOCS[3]])
+
+    assert {doc_id for _, doc_id, _ in hits} == {DOCS[0], DOCS[3]}
+    assert len(hits) == 4
+    assert index.search(unit(8, 5), 3, document_ids=[uuid.uuid4()]) == []
+
+
+def test_search_many_matches_single_searches(index):
+    queries = [unit(8, axis) for axis in range(8)]
+
+    results = index.search_many(queries, 2, max_score_bytes=64)
+
+    assert results == [index.search(query, 2) for query in queries]
+
+
+def test_remove_document_and_compaction(index):
+    assert index.remove_document(DOCS[1]) == 2
+    assert index.remove_document(DOCS[1]) == 0
+    assert len(index) == 6
+    assert DOCS[1] not in {doc_id for _, doc_id, _ in index.search(unit(8, 2), 8)}
+
+    index._compact()
+    assert index._size == 6 and index._tombstones == 0
+    assert [hit[1:] for hit in index.search(unit(8, 7), 1)] == [(DOCS[3], 1)]
+
+
+def test_mapped_index_keeps_local_changes_in_delta(index, tmp_path):
+    index.save(str(tmp_path))
+    mapped = VectorIndex.open(str(tmp_path))
+    matrix = mapped._vectors
+
+    mapped.remove_document(DOCS[0])
+    mapped.add_document(DOCS[0], [0], [unit(8, 7)])
+    index.remove_document(DOCS[0])
+    index.add_document(DOCS[0], [0], [unit(8, 7)])
+
+    assert mapped.mapped and mapped._vectors is matrix
+    assert len(mapped) == len(index) == 7
+    for axis in range(2, 8):
+        hits, expected = mapped.search(unit(8, axis), 3), index.search(unit(8, axis), 3)
+        # Equal scores may come back in either order
+        assert hits[0] == expected[0]
+        assert [score for score, _, _ in hits] == pytest.approx([score for score, _, _ in expected])
+    assert mapped.search(unit(8, 0), 8, document_ids=[DOCS[0]]) == index.search(unit(8, 0), 8, document_ids=[DOCS[0]])
+
+    # Saving a mapped index writes its local changes
+    saved = tmp_path / "next"
+    saved.mkdir()
+    assert mapped.save(str(saved)) == 7
+    reopened = VectorIndex.open(str(saved))
+    assert reopened.search(unit(8, 7), 2) == index.search(unit(8, 7), 2)
@@ -0,0 +1,78 @@
+import struct
+from typing import List, Sequence
+import numpy as np
+from config import settings
+
+# Every blob starts with an 8-byte header: format code, 3 padding bytes and a
+# little-endian float32 scale. The header keeps the values 4-byte aligned, so
+# float32 blobs decode zero-copy, and makes each blob self-describing, so rows
+# written with different EMBEDDING_STORAGE_FORMAT settings can coexist.
+_HEADER = struct.Struct("<B3xf")
+_FORMATS = {
+    "float32": (1, np.dtype("<f4")),
+    "float16": (2, np.dtype("<f2")),
+    "int8": (3, np.dtype("i1")),  # symmetric per-vector quantization, value = q * scale
+}
+_DTYPES = {code: dtype for code, dtype in _FORMATS.values()}
+
+
+def encode_vector(vector: np.ndarray, storage_format: str = settings.EMBEDDING_STORAGE_FORMAT) -> bytes:
+    """Serialize a vector for the embeddings.embedding_bytes column"""
+    code, dtype = _FORMATS[storage_format]
+    vector = np.asarray(vector, dtype=np.float32)
+    scale = 1.0
+    if storage_format == "int8":
+        peak = float(np.max(np.abs(vector))) if vector.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        values = np.clip(np.rint(vector / scale), -127, 127).astype(dtype)
+    else:
+        values = vector.astype(dtype)
+    return _HEADER.pack(code, scale) + values.tobytes()
+
+
+def decode_vector(blob: bytes) -> np.ndarray:
+    """Decode one blob to a float32 vector"""
+    return decode_matrix([blob])[0]
+
+
+def decode_matrix(blobs: Sequence[bytes]) -> np.ndarray:
+    """Decode blobs of one dimension into an (n, dim) float32 matrix without per-row arrays.
+
+    Blobs sharing a format are joined and reinterpreted with a single
+    `np.frombuffer` over a structured dtype. Raises ValueError when a blob
+    is malformed or the blobs do not all have the same dimension.
+    """
+    if not blobs:
+        return np.zeros((0, 0), dtype=np.float32)
+    groups = {}
+    for i, blob in enumerate(blobs):
+        groups.setdefault((blob[0] if blob else None, len(blob)), []).append(i)
+    for code, length in groups:
+        if code not in _DTYPES or length < _HEADER.size or (length - _HEADER.size) % _DTYPES[code].itemsize:
+            raise ValueError(f"Malformed embedding blob: format code {code}, {length} bytes")
+
+    dims = {(length - _HEADER.size) // _DTYPES[code].itemsize for code, length in groups}
+    if len(dims) != 1:
+        raise ValueError(f"Embedding blobs have mixed dimensions: {sorted(dims)}")
+    dim = dims.pop()
+
+    if len(groups) == 1:
+        (code, _), = groups
+        return _decode_group(blobs, code, dim)
+    matrix = np.empty((len(blobs), dim), dtype=np.float32)
+    for (code, _), positions in groups.items():
+        matrix[positions] = _decode_group([blobs[i] for i in positions], code, dim)
+    return matrix
+
+
+def _decode_group(blobs: List[bytes], code: int, dim: int) -> np.ndarray:
+    dtype = _DTYPES[code]
+    record = np.dtype([("code", "u1"), ("pad", "V3"), ("scale", "<f4"), ("values", dtype, (dim,))])
+    buffer = blobs[0] if len(blobs) == 1 else b"".join(blobs)
+    records = np.frombuffer(buffer, dtype=record)
+    if dtype == np.float32:
+        return records["values"]
+    values = records["values"].astype(np.float32)
+    if dtype == np.int8:
+        values *= records["scale"][:, None]
+    return values
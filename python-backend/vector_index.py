@@ -0,0 +1,361 @@
+import os
+import json
+import uuid
+import heapq
+import logging
+from typing import List, Dict, Set, Tuple, Optional, Iterable, Any, Union
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from database import Embedding
+from vector_codec import decode_matrix, decode_vector
+
+logger = logging.getLogger("vector_index")
+
+
+def _as_uuid(value: Any) -> uuid.UUID:
+    """Normalize a document id given as str or UUID"""
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+class VectorIndex:
+    """Resident index of normalized chunk embeddings searched with a single matmul.
+
+    Rows are kept in a float32 matrix with parallel arrays of document codes and
+    chunk indices. Document UUIDs are mapped to small integer codes so that the
+    `document_ids` filter is a vectorized mask instead of per-row comparisons.
+    Removed rows are tombstoned (code -1) and compacted once they pile up.
+    An index saved with save() can be mapped read-only by other processes with open();
+    local changes to a mapped index are kept beside the map, which is never copied.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self.dim: Optional[int] = None
+        self._capacity = initial_capacity
+        self._size = 0
+        self._tombstones = 0
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._doc_codes = np.full(initial_capacity, -1, dtype=np.int32)
+        self._chunk_indices = np.zeros(initial_capacity, dtype=np.int32)
+        self._doc_to_code: Dict[uuid.UUID, int] = {}
+        self._code_to_doc: List[uuid.UUID] = []
+        self._mapped = False  # Arrays are read-only maps of a saved snapshot, see open()
+        self._delta: Optional["VectorIndex"] = None  # Rows added locally on top of a mapped snapshot
+        self._hidden: Set[int] = set()  # Codes of mapped documents removed locally
+        self._hidden_rows = 0
+
+    def __len__(self) -> int:
+        local = len(self._delta) if self._delta is not None else 0
+        return self._size - self._tombstones - self._hidden_rows + local
+
+    @property
+    def mapped(self) -> bool:
+        return self._mapped
+
+    def save(self, directory: str, exclude: Optional[Iterable[Any]] = None, extra: Optional["VectorIndex"] = None, block_rows: int = 65536) -> int:
+        """Write the live rows to `directory` as .npy files plus the document id table; returns the row count.
+
+        Rows of the `exclude` documents are left out and the rows of `extra` are
+        appended, which updates a mapped snapshot without first copying it into
+        memory. Rows are copied in blocks, so saving never holds a second copy of the matrix.
+        Local changes to a mapped index are saved along with it.
+        """
+        codes = self._doc_codes[:self._size]
+        excluded = [self._doc_to_code[d] for d in map(_as_uuid, exclude or ()) if d in self._doc_to_code] + list(self._hidden)
+        live = np.flatnonzero((codes >= 0) & ~np.isin(codes, np.asarray(excluded, dtype=np.int32)))
+        added = [index for index in (self._delta, extra) if index is not None and len(index)]
+        dim = self.dim or next((index.dim for index in added), None) or 0
+        documents = list(self._code_to_doc)
+        doc_to_code = dict(self._doc_to_code)
+        parts = [(self, live, np.arange(len(documents), dtype=np.int32))]
+        for index in added:
+            if index.dim != dim:
+                logger.warning(f"Skipping {len(index)} added embeddings with dimension {index.dim} != {dim}")
+                continue
+            # Codes of the added documents in the saved document table
+            remap = np.empty(len(index._code_to_doc), dtype=np.int32)
+            for code, doc_id in enumerate(index._code_to_doc):
+                if doc_id not in doc_to_code:
+                    doc_to_code[doc_id] = len(documents)
+                    documents.append(doc_id)
+                remap[code] = doc_to_code[doc_id]
+            parts.append((index, np.flatnonzero(index._doc_codes[:index._size] >= 0), remap))
+
+        total = sum(len(rows) for _, rows, _ in parts)
+        vectors = np.lib.format.open_memmap(os.path.join(directory, "vectors.npy"), mode="w+", dtype=np.float32, shape=(total, dim))
+        offset = 0
+        for index, rows, _ in parts:
+            for start in range(0, len(rows), block_rows):
+                block = rows[start:start + block_rows]
+                vectors[offset:offset + len(block)] = index._vectors[block]
+                offset += len(block)
+        vectors.flush()
+        del vectors
+        np.save(os.path.join(directory, "doc_codes.npy"), np.concatenate([remap[index._doc_codes[rows]] for index, rows, remap in parts]).astype(np.int32))
+        np.save(os.path.join(directory, "chunk_indices.npy"), np.concatenate([index._chunk_indices[rows] for index, rows, _ in parts]).astype(np.int32))
+        with open(os.path.join(directory, "documents.json"), "w") as f:
+            json.dump([str(doc_id) for doc_id in documents], f)
+        return total
+
+    @classmethod
+    def open(cls, directory: str) -> "VectorIndex":
+        """Map an index written by save() read-only.
+
+        The matrix is served from the page cache, so processes mapping the same
+        snapshot share one copy. Local changes never copy it: added rows go to a
+        small private delta index searched alongside the map, and removed documents
+        are hidden from it.
+        """
+        index = cls(initial_capacity=0)
+        index._vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        index._doc_codes = np.load(os.path.join(directory, "doc_codes.npy"), mmap_mode="r")
+        index._chunk_indices = np.load(os.path.join(directory, "chunk_indices.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "documents.json")) as f:
+            index._code_to_doc = [uuid.UUID(doc_id) for doc_id in json.load(f)]
+        index._doc_to_code = {doc_id: code for code, doc_id in enumerate(index._code_to_doc)}
+        index._size = index._capacity = len(index._vectors)
+        index.dim = index._vectors.shape[1] if index._size else None
+        index._mapped = True
+        return index
+
+    async def load(self, session: AsyncSession, batch_size: int = 5000, document_ids: Optional[List[Any]] = None) -> int:
+        """Build the index from every row of the embeddings table, or only the rows of `document_ids`"""
+        stmt = select(Embedding.document_id, Embedding.chunk_index, Embedding.embedding_bytes, Embedding.embedding)
+        if document_ids is not None:
+            stmt = stmt.where(Embedding.document_id.in_(document_ids))
+        result = await session.stream(stmt.execution_options(yield_per=batch_size))
+        loaded = 0
+        async for rows in result.partitions(batch_size):
+            binary = [row for row in rows if row.embedding_bytes is not None]
+            legacy = [row for row in rows if row.embedding_bytes is None and row.embedding is not None]
+            if binary:
+                blobs = [row.embedding_bytes for row in binary]
+                try:
+                    vectors = decode_matrix(blobs)
+                except ValueError:
+                    # Rows of several dimensions; decode one by one so _add_rows can skip the odd ones
+                    vectors = [decode_vector(blob) for blob in blobs]
+                loaded += self._add_rows([row.document_id for row in binary], [row.chunk_index for row in binary], vectors)
+            if legacy:
+                # Rows not yet converted by backfill_embedding_bytes.py
+                vectors = [json.loads(row.embedding) for row in legacy]
+                loaded += self._add_rows([row.document_id for row in legacy], [row.chunk_index for row in legacy], vectors)
+        logger.info(f"Vector index loaded {loaded} embeddings (dim={self.dim})")
+        return loaded
+
+    def add_document(self, document_id: Any, chunk_indices: List[int], vectors: List[np.ndarray]) -> int:
+        """Append the chunk vectors of one document to the index"""
+        document_id = _as_uuid(document_id)
+        return self._add_rows([document_id] * len(chunk_indices), chunk_indices, vectors)
+
+    def add_index(self, other: "VectorIndex") -> int:
+        """Append the live rows of another index, e.g. one staged while a document was ingested"""
+        rows = np.flatnonzero(other._doc_codes[:other._size] >= 0)
+        if len(rows) == 0:
+            return 0
+        doc_ids = [other._code_to_doc[code] for code in other._doc_codes[rows]]
+        return self._add_rows(doc_ids, other._chunk_indices[rows].tolist(), other._vectors[rows])
+
+    def remove_document(self, document_id: Any) -> int:
+        """Tombstone every row belonging to a document"""
+        document_id = _as_uuid(document_id)
+        if self._mapped:
+            return self._hide(document_id)
+        code = self._doc_to_code.get(document_id)
+        if code is None:
+            return 0
+        rows = np.flatnonzero(self._doc_codes[:self._size] == code)
+        if len(rows) == 0:
+            return 0
+        self._doc_codes[rows] = -1
+        self._tombstones += len(rows)
+        if self._tombstones > max(1024, self._size // 4):
+            self._compact()
+        return len(rows)
+
+    def search(self, query: np.ndarray, k: int, document_ids: Optional[Iterable[Any]] = None) -> List[Tuple[float, uuid.UUID, int]]:
+        """Return the top-k (similarity, document_id, chunk_index) for a query vector"""
+        return self.search_many([query], k, document_ids=document_ids)[0]
+
+    def search_many(
+        self,
+        queries: Union[np.ndarray, List[np.ndarray]],
+        k: int,
+        document_ids: Optional[Iterable[Any]] = None,
+        max_score_bytes: int = 256 * 1024 * 1024,
+    ) -> List[List[Tuple[float, uuid.UUID, int]]]:
+        """Top-k hits for each of several query vectors, scored with one matrix-matrix product.
+
+        Queries are scored in blocks so the (rows x queries) score matrix stays
+        under `max_score_bytes`. Queries of the wrong dimension or with zero
+        norm get an empty result.
+        """
+        results = self._search_rows(queries, k, document_ids, max_score_bytes)
+        if self._delta is None or not len(self._delta):
+            return results
+        local = self._delta.search_many(queries, k, document_ids=document_ids, max_score_bytes=max_score_bytes)
+        return [heapq.nlargest(k, hits + local_hits, key=lambda hit: hit[0]) for hits, local_hits in zip(results, local)]
+
+    def _search_rows(
+        self,
+        queries: Union[np.ndarray, List[np.ndarray]],
+        k: int,
+        document_ids: Optional[Iterable[Any]],
+        max_score_bytes: int,
+    ) -> List[List[Tuple[float, uuid.UUID, int]]]:
+        """search_many() over this index's own rows, without the delta"""
+        results: List[List[Tuple[float, uuid.UUID, int]]] = [[] for _ in range(len(queries))]
+        if self._size == 0 or k <= 0 or len(queries) == 0:
+            return results
+        valid = []
+        for i, query in enumerate(queries):
+            if len(query) != self.dim:
+                logger.warning(f"Query vector dim {len(query)} does not match index dim {self.dim}")
+            elif np.any(query):
+                valid.append(i)
+        if not valid:
+            return results
+        matrix = np.asarray([queries[i] for i in valid], dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+        doc_codes = self._doc_codes[:self._size]
+        if document_ids is not None:
+            codes = [self._doc_to_code[d] for d in map(_as_uuid, document_ids) if d in self._doc_to_code]
+            if not codes:
+                return results
+            allowed = np.isin(doc_codes, np.asarray(codes, dtype=np.int32))
+        else:
+            allowed = doc_codes >= 0
+        if self._hidden:
+            allowed &= ~np.isin(doc_codes, np.fromiter(self._hidden, dtype=np.int32, count=len(self._hidden)))
+
+        # Score only the allowed rows when the filter is selective, otherwise
+        # one full matmul with the excluded rows masked out is cheaper
+        candidates = np.flatnonzero(allowed)
+        if len(candidates) == 0:
+            return results
+        selective = len(candidates) < self._size // 2
+        vectors = self._vectors[candidates] if selective else self._vectors[:self._size]
+        k = min(k, len(candidates))
+        block = max(1, max_score_bytes // (4 * len(vectors)))
+
+        for start in range(0, len(valid), block):
+            scores = vectors @ matrix[start:start + block].T
+            if not selective:
+                scores = scores[candidates]
+            if k < len(candidates):
+                top = np.argpartition(-scores, k - 1, axis=0)[:k]
+            else:
+                top = np.broadcast_to(np.arange(len(candidates))[:, None], scores.shape)
+            for column, query_position in enumerate(valid[start:start + block]):
+                column_top = top[:, column]
+                column_scores = scores[column_top, column]
+                order = np.argsort(-column_scores)
+                rows = candidates[column_top[order]]
+                results[query_position] = [
+                    (float(score), self._code_to_doc[self._doc_codes[r]], int(self._chunk_indices[r]))
+                    for score, r in zip(column_scores[order], rows)
+                ]
+        return results
+
+    def _add_rows(self, doc_ids: List[uuid.UUID], chunk_indices: List[int], vectors: Union[np.ndarray, List[Any]]) -> int:
+        """Normalize and append rows, skipping vectors of the wrong dimension.
+
+        `vectors` is either a list of vectors or an (n, dim) matrix, which is used without per-row copies.
+        """
+        if len(vectors) == 0:
+            return 0
+        if self._mapped:
+            added = self._local()._add_rows(doc_ids, chunk_indices, vectors)
+            self.dim = self.dim or self._delta.dim
+            return added
+        if self.dim is None:
+            # Take the dimension from the first real vector, not a zero placeholder
+            first = next((v for v in vectors if np.any(v)), None)
+            if first is None:
+                return 0
+            self.dim = len(first)
+            self._vectors = np.zeros((self._capacity, self.dim), dtype=np.float32)
+
+        if isinstance(vectors, np.ndarray) and vectors.ndim == 2:
+            matrix = vectors
+            keep = list(range(len(vectors))) if vectors.shape[1] == self.dim else []
+        else:
+            keep = [i for i, v in enumerate(vectors) if len(v) == self.dim]
+            matrix = np.asarray([vectors[i] for i in keep], dtype=np.float32) if keep else None
+        if len(keep) != len(vectors):
+            logger.warning(f"Skipping {len(vectors) - len(keep)} embeddings with dimension != {self.dim}")
+        if not keep:
+            return 0
+
+        norms = np.linalg.norm(matrix, axis=1)
+        nonzero = norms > 0
+        matrix = matrix[nonzero] / norms[nonzero, None]
+        keep = [i for i, ok in zip(keep, nonzero) if ok]
+        count = len(keep)
+        if count == 0:
+            return 0
+
+        self._reserve(self._size + count)
+        start, end = self._size, self._size + count
+        self._vectors[start:end] = matrix
+        self._doc_codes[start:end] = [self._code_for(doc_ids[i]) for i in keep]
+        self._chunk_indices[start:end] = [chunk_indices[i] for i in keep]
+        self._size = end
+        return count
+
+    def _code_for(self, document_id: uuid.UUID) -> int:
+        code = self._doc_to_code.get(document_id)
+        if code is None:
+            code = len(self._code_to_doc)
+            self._doc_to_code[document_id] = code
+            self._code_to_doc.append(document_id)
+        return code
+
+    def _local(self) -> "VectorIndex":
+        """Private delta index holding the rows added on top of a mapped snapshot"""
+        if self._delta is None:
+            self._delta = VectorIndex()
+            if self.dim is not None:
+                self._delta.dim = self.dim
+                self._delta._vectors = np.zeros((self._delta._capacity, self.dim), dtype=np.float32)
+        return self._delta
+
+    def _hide(self, document_id: uuid.UUID) -> int:
+        """Remove a document from a mapped index: drop its delta rows and mask its mapped rows in search"""
+        removed = self._delta.remove_document(document_id) if self._delta is not None else 0
+        code = self._doc_to_code.get(document_id)
+        if code is not None and code not in self._hidden:
+            rows = int(np.count_nonzero(self._doc_codes[:self._size] == code))
+            if rows:
+                self._hidden.add(code)
+                self._hidden_rows += rows
+                removed += rows
+        return removed
+
+    def _reserve(self, required: int) -> None:
+        """Grow the backing arrays geometrically so appends stay amortized O(1)"""
+        if required <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < required:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        doc_codes = np.full(capacity, -1, dtype=np.int32)
+        doc_codes[:self._size] = self._doc_codes[:self._size]
+        chunk_indices = np.zeros(capacity, dtype=np.int32)
+        chunk_indices[:self._size] = self._chunk_indices[:self._size]
+        self._vectors, self._doc_codes, self._chunk_indices = vectors, doc_codes, chunk_indices
+        self._capacity = capacity
+
+    def _compact(self) -> None:
+        """Drop tombstoned rows"""
+        live = np.flatnonzero(self._doc_codes[:self._size] >= 0)
+        size = len(live)
+        self._vectors[:size] = self._vectors[live]
+        self._doc_codes[:size] = self._doc_codes[live]
+        self._chunk_indices[:size] = self._chunk_indices[live]
+        self._doc_codes[size:self._size] = -1
+        self._size = size
+        self._tombstones = 0